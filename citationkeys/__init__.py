@@ -1 +1 @@
-__all__ = 'bib misc print tags urlhandlers'.split()
+__all__ = 'bib cache export fuzzy latex misc output paper print query rekey serve snapshot suggest tags tagstore urlhandlers utils vectors watch'.split()
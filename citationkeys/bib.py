@@ -14,6 +14,7 @@ from bibtexparser.customization import page_double_hyphen
 from bibtexparser.latexenc import latex_to_unicode  # , string_to_latex, protect_uppercase
 
 from .print import print_error
+from .utils import string_to_file_atomic
 
 
 # WARNING(Alin): Please abide by the naming convention:
@@ -93,17 +94,18 @@ def bibent_canonicalize(ck, bibent, verbosity):
         bibent['ID'] = ck
         updated = True
 
-    author = bibent['author'].replace('\r', '').replace('\n', ' ').strip()
-    if bibent['author'] != author:
+    # NOTE: Not every entry has authors (e.g., @misc web pages) or even a title
+    author = bibent.get('author', '').replace('\r', '').replace('\n', ' ').strip()
+    if bibent.get('author', '') != author:
         if verbosity > 1:
             print(ck + ": Stripped author name(s): " + author)
         bibent['author'] = author
         updated = True
 
-    title  = bibent['title'].strip()
+    title  = bibent.get('title', '').strip()
     if len(title) > 0 and title[0] != "{" and title[len(title)-1] != "}":
         title = "{" + title + "}"
-    if bibent['title'] != title:
+    if bibent.get('title', '') != title:
         if verbosity > 1:
             print(ck + ": Added brackets to title: " + title)
         bibent['title'] = title
@@ -113,6 +115,21 @@ def bibent_canonicalize(ck, bibent, verbosity):
 
     return updated
 
+def bibpath_canonicalize(ck, bibpath, verbosity, dry_run=False):
+    """Canonicalizes the BibTeX file of the given CK in place (see bibent_canonicalize).
+       Returns True if the file needed updating and, unless 'dry_run' is set, was rewritten."""
+    bibdb = bibdb_from_file(bibpath)
+
+    assert len(bibdb.entries) == 1
+    assert type(ck) == str
+    updated = bibent_canonicalize(ck, bibdb.entries[0], verbosity)
+
+    if updated and not dry_run:
+        bibwriter = bibtexparser.bwriter.BibTexWriter()
+        string_to_file_atomic(bibwriter.write(bibdb), bibpath)
+
+    return updated
+
 def bibent_to_bibdb(bibent):
     """Wraps a single bibentry into a bibdb, which other calls might expect"""
     bibdb = bibtexparser.bibdatabase.BibDatabase()
@@ -187,6 +204,27 @@ def bibent_get_first_author_year_title_ck(bibent):
     citation_key = ''.join([c for c in citation_key if c in string.ascii_lowercase or c in string.digits]) # filter out strange chars
     return citation_key
 
+# Characters we drop from author names before picking their last names
+AUTHOR_NAME_RE = re.compile('[^ ,a-zA-Z]')
+
+# returns the last name (heuristically) from a string in either <first> <last> or <last>, <first> format
+def author_last_name(author, verbosity=0):
+    # NOTE(Alin): Removes everything but the characters below. (i.e., for now, we're restrict ourselves to simple names with A-Z letters only)
+    author = AUTHOR_NAME_RE.sub('', author).strip()  # Also, remove leading/trailing spaces
+
+    if ',' in author:
+        last_name = author.split(',')[0]
+    else:
+        last_name = author.split(' ')[-1]
+
+    # Remove spaces from the last name (for names like "de Rooij" -> "deRooij")
+    last_name = last_name.replace(' ', '')
+
+    if verbosity > 0:
+        print("Last name of \"" + author + "\" is: " + last_name)
+
+    return last_name
+
 def bibent_get_author_initials_ck(bibent, verbosity):
     # replace all newlines by space, so our ' and ' splitting works
     bibent['author'] = bibent['author'].replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
@@ -204,38 +242,19 @@ def bibent_get_author_initials_ck(bibent, verbosity):
 
     if verbosity > 0:
         print("First 3+ authors: ", authors)
-    # returns the last name (heuristically) from a string in either <first> <last> or <last>, <first> format
-
-    def get_last_name(author):
-        # NOTE(Alin): Removes everything but the characters below. (i.e., for now, we're restrict ourselves to simple names with A-Z letters only)
-        regex = re.compile('[^ ,a-zA-Z]')
-        author = regex.sub('', author).strip()  # Also, remove leading/trailing spaces
-
-        if ',' in author:
-            last_name = author.split(',')[0]
-        else:
-            last_name = author.split(' ')[-1]
-
-        # Remove spaces from the last name (for names like "de Rooij" -> "deRooij")
-        last_name = last_name.replace(' ', '')
-
-        if verbosity > 0:
-            print("Last name of \"" + author + "\" is: " + last_name)
-
-        return last_name
 
     initials = ""
     # For single authors, use the first four letters of their last name
     # TODO(Alin): This won't work for Dutch authors with 'van' in their last name.
     # e.g., for 'van Damme', it will be either 'van' or 'Dam' but would be better to do 'vD' or something like that.
     if len(authors) == 1:
-        last_name = get_last_name(authors[0])
+        last_name = author_last_name(authors[0], verbosity)
         initials = last_name[0:4]
     # For <= 4 authors, we use 'ABCD99'
     else:
         for author in authors:
             # the author name format could be "<first> <last>" or "<last>, <first>"
-            last_name = get_last_name(author)
+            last_name = author_last_name(author, verbosity)
             initials += last_name[0].upper()
     
     # If we had more than 4 authors, then we use 'ABC+99'
@@ -255,6 +274,9 @@ def bibtex_to_bibent(bibtex):
     return bibdb.entries[0]
 
 
+# The policies the DefaultCk option in the configuration file can be set to
+DEFAULT_CK_POLICIES = ['KeepBibtex', 'FirstAuthorYearTitle', 'InitialsShortYear', 'InitialsFullYear']
+
 def bibent_to_default_ck(bibent, default_ck_policy, verbosity):
     # We use the DefaultCk policy from the configuration file to determine the citation key, if none was given
     if default_ck_policy == "KeepBibtex":
@@ -376,3 +398,153 @@ def bibpath_set_dateadded(destbibfile, timestr):
     bibent = bibent_from_file(destbibfile)
     bibent_set_dateadded(bibent, timestr)
     bibent_to_file(destbibfile, bibent)
+
+def bibent_refresh(old_bibent, new_bibent):
+    """Returns a copy of the old bibentry updated with the fields of a freshly-downloaded bibentry.
+       Keeps the old citation key and 'ckdateadded', as well as any fields the new BibTeX does not have (e.g., user notes)."""
+    bibent = dict(old_bibent)
+    bibent.update(new_bibent)
+
+    bibent['ID'] = old_bibent['ID']
+    if 'ckdateadded' in old_bibent:
+        bibent['ckdateadded'] = old_bibent['ckdateadded']
+
+    return bibent
+
+def bibent_diff(old_bibent, new_bibent):
+    """Returns a sorted list of (field, old_value, new_value) tuples for the fields that differ between the two bibentries.
+       A value is None when the field is missing from that bibentry."""
+    diff = []
+    for field in sorted(set(old_bibent.keys()) | set(new_bibent.keys())):
+        old_value = old_bibent.get(field, None)
+        new_value = new_bibent.get(field, None)
+
+        if old_value != new_value:
+            diff.append((field, old_value, new_value))
+
+    return diff
+
+def ck_sanitize(ck):
+    """Removes characters that do not belong in a citation key (and thus in a file name) from a CK, e.g., one taken
+       from someone else's .bib file. Keeps letters, digits, '+', '-' and '_'."""
+    return ''.join(c for c in ck if c.isalnum() or c in '+-_')
+
+def ck_add_suffix(ck, taken_cks):
+    """Returns 'ck' if it is not taken, or else the first of 'ck' + a, b, ..., z, aa, ab, ... that is not.
+       Also marks the returned CK as taken. 'taken_cks' is a set of casefolded CKs, since CKs are file names and
+       some filesystems (e.g., on macOS) are case-insensitive."""
+    candidate = ck
+    i = 0
+    while candidate.casefold() in taken_cks:
+        # Bijective base-26: 0 -> a, 25 -> z, 26 -> aa, ...
+        suffix = ''
+        n = i
+        while True:
+            suffix = string.ascii_lowercase[n % 26] + suffix
+            n = n // 26 - 1
+            if n < 0:
+                break
+        candidate = ck + suffix
+        i += 1
+
+    taken_cks.add(candidate.casefold())
+    return candidate
+
+# '@type{' or '@type(' at the start of an entry
+BIBTEX_ENTRY_START_RE = re.compile(r'@\s*([a-zA-Z]+)\s*[{(]')
+BIBTEX_BRACES_RE = re.compile(r'[{}]')
+BIBTEX_BRACES_AND_PARENS_RE = re.compile(r'[{}()]')
+
+def bibtex_iter_blocks(lines):
+    """Streams the top-level '@type{...}' blocks of a BibTeX file, given an iterator over its lines (e.g., the open file),
+       and yields (type, bibtex) pairs, with the type lowercased (e.g., 'article', 'string', 'comment').
+       Only ever holds one block in memory, so it works on arbitrarily large files."""
+    block = []
+    kind = None
+    depth = 0
+    close = None
+
+    for line in lines:
+        pos = 0
+        while pos < len(line):
+            if kind is None:
+                m = BIBTEX_ENTRY_START_RE.search(line, pos)
+                if m is None:
+                    break
+
+                kind = m.group(1).lower()
+                close = '}' if line[m.end() - 1] == '{' else ')'
+                depth = 1
+                start = m.start()
+                pos = m.end()
+                block = []
+            else:
+                start = 0
+
+            # Find where the block ends, i.e., the delimiter that brings the depth back to zero
+            end = None
+            for d in (BIBTEX_BRACES_RE if close == '}' else BIBTEX_BRACES_AND_PARENS_RE).finditer(line, pos):
+                if d.group() in '{(':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        end = d.end()
+                        break
+
+            if end is None:
+                block.append(line[start:])
+                break
+            else:
+                block.append(line[start:end])
+                yield kind, ''.join(block)
+                kind = None
+                pos = end
+
+    if kind is not None:
+        raise ValueError("Unterminated @" + kind + " entry at the end of the BibTeX")
+
+def bibtex_blocks_to_bibents(bibtex_blocks, bibtex_strings, default_ck_policy, timestr):
+    """Parses a batch of BibTeX entries, as yielded by bibtex_iter_blocks(), picks their CKs via the DefaultCk policy
+       and sets their 'ckdateadded' (unless they already have one). 'bibtex_strings' are the @string definitions they
+       may refer to. Returns a list with a (ck, bibent, bibtex) triple per entry, or (None, None, error message) if the
+       entry could not be parsed. Runs in worker processes when importing large .bib files, so it never prints."""
+    # NOTE(Alin): Creating a parser is about as slow as parsing an entry, so parse the whole batch at once. If any entry is
+    # malformed, the entries no longer line up with the blocks, so then we fall back to parsing them one by one.
+    bibents = [None] * len(bibtex_blocks)
+    try:
+        bibdb = bibtexparser.loads(bibtex_strings + '\n'.join(bibtex_blocks), new_bibtex_parser())
+        ids = [bibtex[bibtex.find('{') + 1:bibtex.find(',')].strip() for bibtex in bibtex_blocks]
+        if [bibent.get('ID') for bibent in bibdb.entries] == ids:
+            bibents = bibdb.entries
+    except Exception:
+        pass
+
+    results = []
+    for bibtex, bibent in zip(bibtex_blocks, bibents):
+        try:
+            if bibent is None:
+                bibdb = bibtexparser.loads(bibtex_strings + bibtex, new_bibtex_parser())
+                if len(bibdb.entries) != 1:
+                    raise ValueError("Expected one BibTeX entry, got " + str(len(bibdb.entries)))
+                bibent = bibdb.entries[0]
+
+            try:
+                ck = bibent_to_default_ck(defaultdict(lambda: '', bibent), default_ck_policy, 0)
+            except (AssertionError, IndexError, KeyError):
+                # e.g., no authors, so fall back to the entry's own citation key
+                ck = bibent.get('ID', '')
+            ck = ck_sanitize(ck)
+            if len(ck) == 0:
+                raise ValueError("Could not derive a citation key")
+
+            bibent['ID'] = ck
+            if 'ckdateadded' not in bibent:
+                bibent_set_dateadded(bibent, timestr)
+
+            results.append((ck, bibent, bibent_to_bibtex(bibent)))
+        except Exception as e:
+            first_line = bibtex.strip().split('\n')[0]
+            results.append((None, None, first_line + ": " + str(e)))
+
+    return results
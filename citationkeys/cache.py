@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import hashlib
+import json
+import os
+
+from .bib import bibent_to_markdown, bibent_to_text, bibtex_to_bibent
+from .utils import string_to_file_atomic
+
+
+# NOTE(Alin): Caches live in CacheDir (by default, the user's cache directory), never in BibDir or TagDir,
+# so that they do not get synced across machines by Dropbox. Each BibDir gets its own subdirectory.
+def library_cache_dir(cache_root, ck_bib_dir):
+    """Returns (and creates, if needed) the directory where we cache things about the library in 'ck_bib_dir'."""
+    digest = hashlib.sha1(os.path.realpath(ck_bib_dir).encode('utf-8')).hexdigest()[:16]
+    path = os.path.join(cache_root, digest)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_fingerprint(path):
+    """Returns a cheap [mtime, size] fingerprint of a file, which changes (almost always) when the file changes."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def json_cache_load(path):
+    """Loads a JSON cache file. Returns an empty dict if it does not exist or is corrupted, since caches can always be rebuilt."""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def json_cache_save(path, data):
+    string_to_file_atomic(json.dumps(data, separators=(',', ':')), path)
+
+
+# The citation formats CitationCache renders, mapped to how to render them from a BibTeX entry
+CITATION_RENDERERS = {
+    'markdown': bibent_to_markdown,
+    'text':     bibent_to_text,
+}
+
+# NOTE(Alin): Bump this whenever any of the CITATION_RENDERERS changes what it outputs, or CitationCache keeps
+# returning citations rendered the old way
+CITATION_RENDERERS_VERSION = 1
+
+
+class CitationCache(object):
+    """Markdown and plain text citations, rendered once per CK and cached in CacheDir until its BibTeX changes.
+
+    Rendering needs the BibTeX parsed and the authors converted from LaTeX to Unicode, which is slow for
+    hundreds of papers, while looking up a cached citation is just a hash of the BibTeX. Citations rendered
+    before CITATION_RENDERERS_VERSION was bumped are rendered again."""
+
+    def __init__(self, ck_cache_dir):
+        self.path = os.path.join(ck_cache_dir, 'citations.json')
+        self.entries = json_cache_load(self.path)     # CK -> [sha1 of its BibTeX, renderers version, { format: citation }]
+        self.dirty = False
+
+    def get(self, ck, bibtex, fmt):
+        """Returns the citation for the CK with the given BibTeX in the given format (one of CITATION_RENDERERS).
+           Raises whatever bibtex_to_bibent() raises if the BibTeX needs rendering and cannot be parsed."""
+        digest = hashlib.sha1(bibtex.encode('utf-8')).hexdigest()
+
+        entry = self.entries.get(ck)
+        if entry is None or entry[:2] != [digest, CITATION_RENDERERS_VERSION] or fmt not in entry[2]:
+            # Render all formats at once, since parsing is most of the work
+            bibent = bibtex_to_bibent(bibtex)
+            entry = [digest, CITATION_RENDERERS_VERSION, { f: render(bibent) for f, render in CITATION_RENDERERS.items() }]
+            self.entries[ck] = entry
+            self.dirty = True
+
+        return entry[2][fmt]
+
+    def save(self):
+        if self.dirty:
+            json_cache_save(self.path, self.entries)
+            self.dirty = False
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import errno
+import io
+import os
+import shutil
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# zstandard is optional: it is only needed for exporting .tar.zst archives
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# How 'ck copypdfs' can put a PDF in the output directory
+LINK_MODES = ['copy', 'hard', 'sym', 'reflink']
+
+# Archive formats supported by 'ck copypdfs --archive', by file name suffix
+ARCHIVE_SUFFIXES = {
+    '.zip':     'zip',
+    '.tar':     'tar',
+    '.tar.gz':  'tar.gz',
+    '.tgz':     'tar.gz',
+    '.tar.zst': 'tar.zst',
+    '.tzst':    'tar.zst',
+}
+
+# Errors meaning "this filesystem (or pair of filesystems) cannot do that", as opposed to real I/O errors
+LINK_UNSUPPORTED_ERRNOS = set([errno.EXDEV, errno.EPERM, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTTY, errno.ENOSYS])
+
+# From <linux/fs.h>: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def reflink_file(src, dst):
+    """Makes 'dst' a copy-on-write clone of 'src', which shares its data blocks (e.g., on Btrfs or XFS).
+       Raises OSError if the filesystem (or OS) does not support it."""
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are only supported on Linux")
+
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            # Do not leave an empty file behind (we created it above, so it is ours to remove)
+            os.remove(dst)
+            raise
+
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst, mode):
+    """Puts 'src' at 'dst' using the given LINK_MODES mode. If the filesystem cannot hard-link or reflink the file,
+       falls back to copying it. Returns the mode that was actually used."""
+    try:
+        if mode == 'hard':
+            os.link(src, dst)
+            return mode
+        elif mode == 'sym':
+            os.symlink(os.path.abspath(src), dst)
+            return mode
+        elif mode == 'reflink':
+            reflink_file(src, dst)
+            return mode
+        elif mode != 'copy':
+            raise ValueError("Unknown link mode: " + mode)
+    except OSError as e:
+        if mode == 'sym' or e.errno not in LINK_UNSUPPORTED_ERRNOS:
+            raise
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def export_files(pairs, mode, jobs):
+    """Puts each (src, dst) pair in place via link_or_copy(). Copies (and reflinks) run in a pool of 'jobs' threads,
+       since they spend their time waiting on I/O. Returns a list of (src, dst, mode used or None, error or None)."""
+    def export_one(pair):
+        src, dst = pair
+        try:
+            return src, dst, link_or_copy(src, dst, mode), None
+        except OSError as e:
+            return src, dst, None, e
+
+    if mode in ('hard', 'sym') or jobs <= 1 or len(pairs) <= 1:
+        return [export_one(pair) for pair in pairs]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(export_one, pairs))
+
+
+def archive_format(path):
+    """Returns the archive format of 'path' (one of ARCHIVE_SUFFIXES' values) based on its suffix, or None if unsupported."""
+    lower = path.lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if lower.endswith(suffix):
+            return ARCHIVE_SUFFIXES[suffix]
+    return None
+
+
+def write_archive(path, members, extra_files=None):
+    """Streams the files in 'members', a list of (src path, name in archive) pairs, and the in-memory 'extra_files'
+       (name in archive mapped to bytes) into a new archive at 'path', without staging anything on disk.
+       Raises ValueError for unsupported archive formats and RuntimeError if zstandard is needed but missing."""
+    if extra_files is None:
+        extra_files = {}
+
+    fmt = archive_format(path)
+    if fmt is None:
+        raise ValueError("Unsupported archive format for '" + path + "' (supported: " + ', '.join(sorted(ARCHIVE_SUFFIXES)) + ")")
+    if fmt == 'tar.zst' and zstandard is None:
+        raise RuntimeError("Writing .tar.zst archives requires the 'zstandard' package (pip install zstandard)")
+
+    try:
+        with open(path, 'wb') as f:
+            if fmt == 'zip':
+                # NOTE(Alin): PDFs are already compressed, so deflating them again is slow for barely any gain
+                with zipfile.ZipFile(f, 'w') as zf:
+                    for src, arcname in members:
+                        zf.write(src, arcname, compress_type=zipfile.ZIP_STORED)
+                    for arcname, data in extra_files.items():
+                        zf.writestr(arcname, data, compress_type=zipfile.ZIP_DEFLATED)
+            elif fmt == 'tar.zst':
+                with zstandard.ZstdCompressor().stream_writer(f, closefd=False) as zf:
+                    write_tar_stream(zf, 'w|', members, extra_files)
+            else:
+                write_tar_stream(f, 'w|gz' if fmt == 'tar.gz' else 'w|', members, extra_files)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def write_tar_stream(fileobj, mode, members, extra_files):
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for src, arcname in members:
+            tar.add(src, arcname)
+        for arcname, data in extra_files.items():
+            info = tarfile.TarInfo(arcname)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import json
+import os
+import re
+import struct
+import unicodedata
+from array import array
+from collections import Counter
+
+import click
+
+from .utils import bytes_to_file_atomic
+
+
+# NOTE(Alin): The fuzzy index maps each trigram (i.e., three consecutive characters) of every CK and title in the
+# library to the papers that have it, so that we can find papers whose CK or title look like what the user typed
+# (e.g., 'KZG10' for 'KZG10e', or 'polynomial comitments') without comparing the query against every paper.
+# It is derived from the library snapshot, and rebuilt (in CacheDir) whenever the snapshot changes.
+#
+# Layout:
+#   FUZZY_MAGIC | <header length, as a little-endian uint64> | <JSON header> | <uint32 arrays, in the machine's byte order>
+#
+# The JSON header has the 'built_ns' of the snapshot the index was built from, the list of 'cks', and, for each
+# field ('ck' and 'title'), a map from each trigram to the [offset, length] of its posting list (the sorted indices
+# of the papers that have it) in the uint32 arrays, as well as the [offset, length] of the 'sizes' array, which has
+# the number of distinct trigrams of each paper's field.
+FUZZY_MAGIC = b'CKFUZZ1\n'
+FUZZY_INDEX_FILENAME = 'fuzzy.index'
+FUZZY_FIELDS = ('ck', 'title')
+
+# A title match counts a little less than an equally good CK match, since people mostly type CKs
+FUZZY_TITLE_WEIGHT = 0.9
+
+FUZZY_WORD_RE = re.compile(r'\w+')
+
+
+def fuzzy_normalize(text):
+    """Lowercases the text and strips accents (e.g., 'Schnörr' becomes 'schnorr')."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def trigrams(text):
+    """Returns the set of trigrams of the words in the text. Like PostgreSQL's pg_trgm, each word is padded with two
+       spaces in front and one at the end, so that short words have trigrams too, and words that start the same match better."""
+    grams = set()
+    for word in FUZZY_WORD_RE.findall(fuzzy_normalize(text)):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FuzzyIndex(object):
+    """A trigram index over the CKs and titles of the papers in a library snapshot."""
+
+    def __init__(self, built_ns, cks, postings, sizes):
+        self.built_ns = built_ns
+        self.cks = cks
+        self._postings = postings   # field -> trigram -> sequence of paper indices
+        self._sizes = sizes         # field -> sequence of the number of trigrams of each paper
+
+    def __len__(self):
+        return len(self.cks)
+
+    def search(self, query, limit=10, fields=FUZZY_FIELDS, min_score=0.3):
+        """Returns up to 'limit' (CK, score) pairs for the papers whose CK or title best match the query, best first.
+           Scores are between 0 and 1, with 1 meaning an exact match.
+
+           A CK is scored by how similar it is to the query (i.e., the Dice coefficient of their trigrams), while a
+           title is scored mostly by how much of the query it contains, since queries are usually a few of its words."""
+        grams = trigrams(query)
+        if len(grams) == 0:
+            return []
+
+        scores = {}
+        for field in fields:
+            counts = Counter()
+            for gram in grams:
+                posting = self._postings[field].get(gram)
+                if posting is not None:
+                    counts.update(posting)
+
+            sizes = self._sizes[field]
+            for i, common in counts.items():
+                dice = 2 * common / (len(grams) + sizes[i])
+                if field == 'ck':
+                    score = dice
+                else:
+                    score = FUZZY_TITLE_WEIGHT * (0.9 * common / len(grams) + 0.1 * dice)
+
+                if score >= min_score and score > scores.get(i, 0):
+                    scores[i] = score
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], self.cks[item[0]]))
+        return [(self.cks[i], score) for i, score in best[:limit]]
+
+    def suggest(self, ck, limit=5):
+        """Returns the CKs most similar to the given one (e.g., to ask "did you mean ...?" when it does not exist)."""
+        return [c for c, _ in self.search(ck, limit, fields=('ck',), min_score=0.4) if c != ck]
+
+
+def fuzzy_index_build(snapshot):
+    """Builds the FuzzyIndex of the papers in the LibrarySnapshot."""
+    cks = snapshot.cks()
+    postings = dict((field, {}) for field in FUZZY_FIELDS)
+    sizes = dict((field, array('I')) for field in FUZZY_FIELDS)
+
+    for i, ck in enumerate(cks):
+        entry = snapshot.get_paper_fields(ck)
+        title = entry[1][1] if entry is not None else ''
+
+        for field, text in (('ck', ck), ('title', title)):
+            grams = trigrams(text)
+            sizes[field].append(len(grams))
+            for gram in grams:
+                postings[field].setdefault(gram, array('I')).append(i)
+
+    return FuzzyIndex(snapshot.built_ns, cks, postings, sizes)
+
+
+def fuzzy_index_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, FUZZY_INDEX_FILENAME)
+
+
+def fuzzy_index_save(index, path):
+    arrays = []
+    offset = 0
+    header = { 'built_ns': index.built_ns, 'cks': index.cks, 'postings': {}, 'sizes': {} }
+
+    def add(a):
+        nonlocal offset
+        arrays.append(a.tobytes())
+        offset += len(a)
+        return [offset - len(a), len(a)]
+
+    for field in FUZZY_FIELDS:
+        header['sizes'][field] = add(array('I', index._sizes[field]))
+        header['postings'][field] = dict((gram, add(array('I', posting))) for gram, posting in index._postings[field].items())
+
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    bytes_to_file_atomic(b''.join([FUZZY_MAGIC, struct.pack('<Q', len(header)), header] + arrays), path)
+
+
+def fuzzy_index_load(path):
+    """Returns the FuzzyIndex saved at 'path', or None if it is missing or corrupted."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        hdr_len = len(FUZZY_MAGIC) + 8
+        if data[:len(FUZZY_MAGIC)] != FUZZY_MAGIC:
+            return None
+
+        (header_len,) = struct.unpack('<Q', data[len(FUZZY_MAGIC):hdr_len])
+        header = json.loads(data[hdr_len:hdr_len + header_len].decode('utf-8'))
+
+        # NOTE: The posting lists stay in the file's buffer, and are only looked at for the trigrams of a query
+        start = hdr_len + header_len
+        if (len(data) - start) % array('I').itemsize != 0:
+            return None
+        uints = memoryview(data)[start:].cast('I')
+
+        postings = {}
+        sizes = {}
+        for field in FUZZY_FIELDS:
+            offset, length = header['sizes'][field]
+            sizes[field] = uints[offset:offset + length]
+            postings[field] = dict((gram, uints[offset:offset + length]) for gram, (offset, length) in header['postings'][field].items())
+
+        return FuzzyIndex(header['built_ns'], header['cks'], postings, sizes)
+    except (OSError, KeyError, TypeError, ValueError, struct.error):
+        return None
+
+
+def fuzzy_index_update(ck_cache_dir, snapshot, verbosity=0):
+    """Returns the FuzzyIndex of the papers in the LibrarySnapshot, rebuilding the one in CacheDir if it is out of date."""
+    path = fuzzy_index_path(ck_cache_dir)
+    index = fuzzy_index_load(path)
+    if index is not None and index.built_ns == snapshot.built_ns:
+        return index
+
+    index = fuzzy_index_build(snapshot)
+    fuzzy_index_save(index, path)
+    if verbosity > 0:
+        click.echo("Rebuilt fuzzy index of " + str(len(index)) + " papers")
+    return index
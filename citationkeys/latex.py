@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import os
+import re
+
+
+# \citation{KZG10,BLS01} is what \cite{KZG10,BLS01} writes to the .aux file; biblatex writes \abx@aux@cite{KZG10}
+# (or \abx@aux@cite{0}{KZG10}, since v3.16) instead. \@input{chapter1.aux} is how \include'd files' .aux files are pulled in.
+AUX_CITATION_RE = re.compile(r'\\citation\{([^}]*)\}|\\abx@aux@cite(?:\{[^}]*\})?\{([^}]*)\}')
+AUX_INPUT_RE = re.compile(r'\\@input\{([^}]*)\}')
+
+# Matches \cite, \citep, \citet*, \nocite, \parencite, \textcite, \autocite, \Citeauthor, etc., with up to two
+# optional arguments (e.g., \cite[p.~3]{KZG10}).
+TEX_CITE_RE = re.compile(r'\\[a-zA-Z]*cite[a-zA-Z]*\*?\s*(?:\[[^\]]*\]\s*){0,2}\{([^}]*)\}')
+TEX_INPUT_RE = re.compile(r'\\(?:input|include)\s*\{([^}]*)\}')
+TEX_CITE_OR_INPUT_RE = re.compile(TEX_CITE_RE.pattern + '|' + TEX_INPUT_RE.pattern)
+
+# A '%' that starts a comment, i.e., one not escaped as '\%'
+TEX_COMMENT_RE = re.compile(r'(?<!\\)%.*')
+
+
+def split_keys(keys):
+    return [key.strip() for key in keys.split(',') if len(key.strip()) > 0]
+
+
+def add_keys(found, keys):
+    for key in keys:
+        if key not in found:
+            found[key] = True
+
+
+def cites_from_aux(aux_path, found=None, visited=None):
+    """Returns the list of keys cited in a LaTeX .aux file (and the .aux files it pulls in), in order of first citation.
+       A key of '*' means \\nocite{*}, i.e., "cite everything"."""
+    if found is None:
+        found = {}
+    if visited is None:
+        visited = set()
+
+    aux_path = os.path.realpath(aux_path)
+    if aux_path in visited:
+        return list(found)
+    visited.add(aux_path)
+
+    with open(aux_path, 'r', errors='replace') as f:
+        aux = f.read()
+
+    for m in AUX_CITATION_RE.finditer(aux):
+        add_keys(found, split_keys(m.group(1) if m.group(1) is not None else m.group(2)))
+
+    # \@input paths are relative to the directory LaTeX ran in, which is where the main .aux file is
+    aux_dir = os.path.dirname(aux_path)
+    for m in AUX_INPUT_RE.finditer(aux):
+        path = os.path.join(aux_dir, m.group(1))
+        if os.path.exists(path):
+            cites_from_aux(path, found, visited)
+
+    return list(found)
+
+
+def cites_from_tex(tex_path, found=None, visited=None, root_dir=None):
+    """Returns the list of keys cited in a LaTeX .tex file (and the files it \\input's or \\include's), in order of
+       first citation. A key of '*' means \\nocite{*}, i.e., "cite everything"."""
+    if found is None:
+        found = {}
+    if visited is None:
+        visited = set()
+
+    tex_path = os.path.realpath(tex_path)
+    if tex_path in visited:
+        return list(found)
+    visited.add(tex_path)
+
+    # NOTE(Alin): LaTeX resolves \input paths relative to the directory it runs in, which is usually the main file's
+    if root_dir is None:
+        root_dir = os.path.dirname(tex_path)
+
+    with open(tex_path, 'r', errors='replace') as f:
+        tex = TEX_COMMENT_RE.sub('', f.read())
+
+    # Go through citations and inputs in the order they appear, so keys come out in citation order
+    for m in TEX_CITE_OR_INPUT_RE.finditer(tex):
+        if m.group(1) is not None:
+            add_keys(found, split_keys(m.group(1)))
+        else:
+            path = os.path.join(root_dir, m.group(2).strip())
+            if not os.path.exists(path) and os.path.exists(path + '.tex'):
+                path += '.tex'
+            if os.path.isfile(path):
+                cites_from_tex(path, found, visited, root_dir)
+
+    return list(found)
+
+
+def cites_from_latex(path, visited=None):
+    """Returns the list of keys cited in a .aux or .tex file, depending on its extension.
+       If a 'visited' set is given, adds to it the paths of all files that were read (e.g., to watch them for changes)."""
+    if os.path.splitext(path)[1].lower() == '.aux':
+        return cites_from_aux(path, visited=visited)
+    else:
+        return cites_from_tex(path, visited=visited)
@@ -6,21 +6,24 @@ try:
     import gnureadline as readline
 except ImportError:
     import readline
+import shutil
 import sys
 import traceback
-from collections import defaultdict
-from datetime import datetime
 
 import bibtexparser
 import click
 
-from .bib import bibent_get_url, bibent_get_venue, new_bibtex_parser
+from .bib import new_bibtex_parser
+from .output import render_facets, render_papers
+from .paper import Paper, paper_fields_from_bibent
 from .tags import style_tags, SimpleCompleter
 from .print import print_error
 
 def get_terminal_width():
-    rows, columns = os.popen('stty size', 'r').read().split()
-    return columns
+    return shutil.get_terminal_size().columns
+
+def get_terminal_height():
+    return shutil.get_terminal_size().lines
 
 def notimplemented():
     print()
@@ -94,10 +97,22 @@ def cks_from_tags(ck_tag_dir, tags, recursive=True):
     return cks
 
 # TODO(Alin): Take flags that decide what to print. For now, "title, authors, year"
-def cks_to_tuples(ck_bib_dir, cks, verbosity):
-    ck_tuples = []
+def cks_to_papers(ck_bib_dir, cks, verbosity, snapshot=None):
+    """Returns a list of Paper objects for the specified CKs, parsed from their .bib files.
+       If a LibrarySnapshot is given, papers found in it are built from its cached fields instead, without touching their files."""
+    papers = []
 
     for ck in cks:
+        if snapshot is not None:
+            entry = snapshot.get_paper_fields(ck)
+            if entry is not None:
+                bck, fields = entry
+                if bck != ck:
+                    click.echo("\nWARNING: Expected '" + ck + "' CK in " + ck + ".bib file (got '" + bck + "')\n", err=True)
+
+                papers.append(Paper(ck, *fields, snapshot.has_md(ck)))
+                continue
+
         bibfile = os.path.join(ck_bib_dir, ck + ".bib")
         if verbosity > 1:
             click.echo("Parsing BibTeX for " + ck)
@@ -109,22 +124,16 @@ def cks_to_tuples(ck_bib_dir, cks, verbosity):
             #print(bibtex.entries)
             #print("Comments: ")
             #print(bibtex.comments)
-            bib = defaultdict(lambda: '', bibtex.entries[0])
+            bib = bibtex.entries[0]
 
             # make sure the CK in the .bib matches the filename
-            bck = bib['ID']
+            bck = bib.get('ID', '')
             if bck != ck:
                 click.echo("\nWARNING: Expected '" + ck + "' CK in " + ck + ".bib file (got '" + bck + "')\n", err=True)
 
-            author = bib['author'].replace('\r', '').replace('\n', ' ').strip()
-            title  = bib['title'].strip("{}")
-            year   = bib['year']
-            date   = bib['ckdateadded'] if 'ckdateadded' in bib else ''
-            url    = bibent_get_url(bib)
-            venue  = bibent_get_venue(bib)
             has_md = os.path.exists(os.path.join(ck_bib_dir, ck + ".md"))
 
-            ck_tuples.append((ck, author, title, year, date, url, venue, has_md))
+            papers.append(Paper(ck, *paper_fields_from_bibent(bib), has_md))
 
         except FileNotFoundError:
             click.secho(ck + ": Missing BibTeX file in directory " + ck_bib_dir, fg="red", err=True)
@@ -133,45 +142,24 @@ def cks_to_tuples(ck_bib_dir, cks, verbosity):
             traceback.print_exc()
             raise
 
-    return ck_tuples
-
-def print_ck_tuples(cks, tags, include_url=False, include_venue=True, include_ck=True, include_dateadded=True, include_tags=True):
-    for (ck, author, title, year, date, url, venue, has_md) in cks:
-        if include_ck:
-            click.secho(ck, fg='blue', nl=False)
-            if has_md:
-                click.secho(" + .md", fg=208, nl=False)
-            click.echo(", ", nl=False)
-
-        click.secho(title, fg='green', nl=False)
-
-        click.echo(", ", nl=False)
-        click.secho(year,fg='red', bold=True, nl=False)
-
-        click.echo(", ", nl=False)
-        click.echo(author, nl=False)
-
-        if date and include_dateadded:
-            date = datetime.strftime(datetime.strptime(date, "%Y-%m-%d %H:%M:%S"), "%B %-d, %Y")
-            click.echo(", ", nl=False)
-            click.echo('(', nl=False)
-            click.secho(date, fg='magenta', nl=False)
-            click.echo(')', nl=False)
-
-        if include_tags and ck in tags:
-            click.echo(', ', nl=False)
-            click.echo(style_tags(tags[ck]), nl=False)
+    return papers
 
-        if include_venue and venue is not None:
-            click.echo(', ', nl=False)
-            click.secho(venue, fg='cyan', nl=False)
+def print_papers(papers, tags, include_url=False, include_venue=True, include_ck=True, include_dateadded=True, include_tags=True, max_width=None, page_if_long=False):
+    """Prints one line per paper. Renders all lines first and writes them at once, which is much faster than
+       echoing each field. If 'page_if_long' is set and the lines do not fit in the terminal, shows them in a pager."""
+    lines = render_papers(papers, tags, include_url, include_venue, include_ck, include_dateadded, include_tags, max_width)
+    if len(lines) == 0:
+        return
 
-        if include_url and url is not None:
-            click.echo(', ', nl=False)
-            click.echo(url, nl=False)
-        click.echo()
+    text = '\n'.join(lines)
+    if page_if_long and sys.stdout.isatty() and len(lines) >= get_terminal_height():
+        click.echo_via_pager(text)
+    else:
+        click.echo(text)
 
-        #print(ck + ": " + title + " by " + author + ", " + year + date)
+def print_facets(facets):
+    """Prints the most common values of each facet from query.facet_counts(), along with how many papers have them."""
+    click.echo('\n'.join(render_facets(facets)))
 
 # NOTE: This can be called on the bibdir or on the tagdir and it proceeds recursively
 def list_cks(some_dir, recursive):
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+
+import click
+
+
+# Output formats for commands that list papers or tags; 'text' is the usual colored, human-readable output
+OUTPUT_FORMATS = [ 'text', 'json', 'ndjson', 'csv' ]
+
+# All the fields of a paper record, in the order they are output
+PAPER_FIELDS = [ 'ck', 'title', 'authors', 'year', 'venue', 'url', 'dateadded', 'tags', 'has_md' ]
+
+# Fields that could be linked back to this machine (see 'ck list --anonymize')
+PRIVATE_PAPER_FIELDS = [ 'ck', 'dateadded', 'tags' ]
+
+TAG_FIELDS = [ 'tag', 'count' ]
+
+FACET_RECORD_FIELDS = [ 'facet', 'value', 'count' ]
+
+
+def paper_to_record(paper, tags):
+    """Converts a Paper into a record (i.e., a dict with PAPER_FIELDS as keys)."""
+    return {
+        'ck':        paper.ck,
+        'title':     paper.title,
+        'authors':   paper.author,
+        'year':      paper.year,
+        'venue':     paper.venue,
+        'url':       paper.url,
+        'dateadded': paper.date if paper.date else None,
+        'tags':      sorted(tags.get(paper.ck, [])),
+        'has_md':    paper.has_md,
+    }
+
+
+class BufferedOutput(object):
+    """Accumulates output in memory and writes it to the underlying stream in large chunks, rather than one field at a time."""
+
+    def __init__(self, stream=None, chunk_size=1 << 16):
+        self.stream = stream if stream is not None else sys.stdout
+        self.chunk_size = chunk_size
+        self.buf = io.StringIO()
+
+    def write(self, s):
+        self.buf.write(s)
+        if self.buf.tell() >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(self.buf.getvalue())
+        self.stream.flush()
+        self.buf.seek(0)
+        self.buf.truncate()
+
+
+def write_records(records, fields, fmt, stream=None):
+    """Writes the records (dicts) as JSON, NDJSON (one JSON object per line) or CSV, restricted to the given fields.
+       Records are streamed, so 'records' can be a generator."""
+    out = BufferedOutput(stream)
+
+    if fmt == 'json':
+        out.write('[')
+        first = True
+        for r in records:
+            out.write('\n  ' if first else ',\n  ')
+            out.write(json.dumps({ f: r[f] for f in fields }, ensure_ascii=False))
+            first = False
+        out.write('\n]\n' if not first else ']\n')
+    elif fmt == 'ndjson':
+        for r in records:
+            out.write(json.dumps({ f: r[f] for f in fields }, ensure_ascii=False))
+            out.write('\n')
+    elif fmt == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(fields)
+        for r in records:
+            # NOTE: CSV has no lists, so we join the tags with ';' (tags cannot contain ';' since we split on ',' when prompting)
+            writer.writerow([ ';'.join(r[f]) if isinstance(r[f], list) else ('' if r[f] is None else r[f]) for f in fields ])
+    else:
+        raise ValueError("Unknown output format: " + fmt)
+
+    out.flush()
+
+
+def write_papers(papers, tags, fmt, fields=PAPER_FIELDS, stream=None):
+    write_records((paper_to_record(p, tags) for p in papers), fields, fmt, stream)
+
+
+def write_tags(tag_list, tags, fmt, stream=None):
+    """Writes the tags along with how many papers have each one. 'tags' is the CK to tags map from TagStore.ck_tags()."""
+    counts = {}
+    for cktags in tags.values():
+        for t in cktags:
+            counts[t] = counts.get(t, 0) + 1
+
+    write_records(({ 'tag': t, 'count': counts.get(t, 0) } for t in tag_list), TAG_FIELDS, fmt, stream)
+
+
+
+def sorted_facet_counts(counts):
+    """Returns the (value, count) pairs of a facet's Counter, most common first."""
+    return sorted(counts.items(), key=lambda vc: (-vc[1], vc[0]))
+
+
+def write_facets(facets, fmt, stream=None):
+    """Writes the facet counts from query.facet_counts() as records with FACET_RECORD_FIELDS."""
+    write_records(({ 'facet': f, 'value': v, 'count': c } for f, counts in facets.items() for v, c in sorted_facet_counts(counts)),
+        FACET_RECORD_FIELDS, fmt, stream)
+
+
+
+MONTHS = [ 'January', 'February', 'March', 'April', 'May', 'June',
+           'July', 'August', 'September', 'October', 'November', 'December' ]
+
+
+def format_dateadded(date):
+    """Formats a 'YYYY-MM-DD HH:MM:SS' date (as in 'ckdateadded') like 'January 5, 2024'.
+       Same as strftime's '%B %-d, %Y', but without parsing the whole date, which adds up when listing many papers."""
+    if len(date) >= 10 and date[4] == '-' and date[7] == '-':
+        try:
+            return MONTHS[int(date[5:7]) - 1] + ' ' + str(int(date[8:10])) + ', ' + date[0:4]
+        except (ValueError, IndexError):
+            pass
+
+    return datetime.strftime(datetime.strptime(date, "%Y-%m-%d %H:%M:%S"), "%B %-d, %Y")
+
+
+def style_affixes(**style):
+    """Returns the (prefix, suffix) escape codes that click.style() puts around text, so we can style many strings cheaply."""
+    prefix, suffix = click.style('\0', **style).split('\0')
+    return (prefix, suffix)
+
+
+def render_segments(segments, max_width=None):
+    """Concatenates a list of (text, style) segments, where 'style' is None or a (prefix, suffix) pair from style_affixes().
+       If 'max_width' is given, truncates the (unstyled) text to that many characters."""
+    out = []
+    width = 0
+    for text, style in segments:
+        truncated = max_width is not None and width + len(text) > max_width
+        if truncated:
+            text = text[:max(0, max_width - width - 1)] + '…'
+
+        if style is None:
+            out.append(text)
+        else:
+            out.append(style[0] + text + style[1])
+
+        if truncated:
+            break
+        width += len(text)
+
+    return ''.join(out)
+
+
+STYLE_CK    = style_affixes(fg='blue')
+STYLE_MD    = style_affixes(fg=208)
+STYLE_TITLE = style_affixes(fg='green')
+STYLE_YEAR  = style_affixes(fg='red', bold=True)
+STYLE_DATE  = style_affixes(fg='magenta')
+STYLE_TAG   = style_affixes(fg='yellow')
+STYLE_VENUE = style_affixes(fg='cyan')
+
+
+def render_papers(papers, tags, include_url=False, include_venue=True, include_ck=True, include_dateadded=True, include_tags=True, max_width=None):
+    """Returns the lines (with colors) that print_papers() displays for the given papers, one per paper.
+       The CK column is padded so that titles line up. If 'max_width' is given, lines are truncated to that many characters."""
+    lines = []
+
+    # Compute the CK column width once, for all rows
+    ck_width = 0
+    if include_ck:
+        for p in papers:
+            ck_width = max(ck_width, len(p.ck) + (len(" + .md") if p.has_md else 0))
+
+    for p in papers:
+        segments = []
+        if include_ck:
+            segments.append((p.ck, STYLE_CK))
+            if p.has_md:
+                segments.append((" + .md", STYLE_MD))
+            padding = ck_width - len(p.ck) - (len(" + .md") if p.has_md else 0)
+            segments.append((", " + " " * padding, None))
+
+        segments.append((p.title, STYLE_TITLE))
+        segments.append((", ", None))
+        segments.append((p.year, STYLE_YEAR))
+        segments.append((", " + p.author, None))
+
+        if p.date and include_dateadded:
+            segments.append((", (", None))
+            segments.append((format_dateadded(p.date), STYLE_DATE))
+            segments.append((")", None))
+
+        if include_tags and p.ck in tags:
+            for tag in tags[p.ck]:
+                segments.append((", ", None))
+                segments.append(('#' + tag, STYLE_TAG))
+
+        if include_venue and p.venue is not None:
+            segments.append((", ", None))
+            segments.append((p.venue, STYLE_VENUE))
+
+        if include_url and p.url is not None:
+            segments.append((", " + p.url, None))
+
+        lines.append(render_segments(segments, max_width))
+
+    return lines
+
+
+FACET_STYLES = { 'year': STYLE_YEAR, 'venue': STYLE_VENUE, 'tag': STYLE_TAG }
+
+
+def render_facets(facets, top=10):
+    """Returns the lines (with colors) that print the 'top' most common values of each facet, one facet per line."""
+    lines = []
+    width = max(len(f) for f in facets) + 1
+    for facet, counts in facets.items():
+        style = FACET_STYLES.get(facet)
+        segments = [((facet + ':').ljust(width + 1), None)]
+        for i, (value, count) in enumerate(sorted_facet_counts(counts)[:top]):
+            if i > 0:
+                segments.append((", ", None))
+            segments.append((('#' + value) if facet == 'tag' else value, style))
+            segments.append((" (" + str(count) + ")", None))
+
+        if len(counts) > top:
+            segments.append((", and " + str(len(counts) - top) + " more", None))
+        lines.append(render_segments(segments))
+
+    return lines
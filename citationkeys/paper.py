@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import calendar
+import re
+import time
+from operator import attrgetter
+
+from .bib import bibent_get_url, bibent_get_venue
+
+
+class Paper(object):
+    """A paper in the library, as listed by 'ck list', 'ck search', etc.
+
+    Besides the fields we display, it carries normalized sort keys, computed once when the paper is created,
+    so that sorting (even by several columns) never has to re-derive them.
+    """
+
+    # NOTE(Alin): We create one of these per paper in the library, so __slots__ keeps them small.
+    __slots__ = (
+        'ck', 'author', 'title', 'year', 'date', 'url', 'venue', 'has_md',
+        'author_key', 'title_key', 'year_key', 'date_key', 'venue_key',
+    )
+
+    def __init__(self, ck, author, title, year, date, url, venue, has_md):
+        self.ck     = ck
+        self.author = author
+        self.title  = title
+        self.year   = year
+        self.date   = date      # 'ckdateadded' as found in the .bib file (or '' if missing)
+        self.url    = url       # None if missing
+        self.venue  = venue     # None if missing
+        self.has_md = has_md
+
+        self.author_key = author.casefold()
+        self.title_key  = title.casefold()
+        self.year_key   = int(year) if year.isdigit() else 0
+        self.date_key   = dateadded_to_timestamp(date)
+        self.venue_key  = venue.casefold() if venue is not None else ''
+
+    def __repr__(self):
+        return 'Paper(' + repr(self.ck) + ')'
+
+
+def paper_fields_from_bibent(bibent):
+    """Returns the [author, title, year, date, url, venue] fields of a Paper, as derived from its BibTeX entry.
+       (Kept as a plain list so it can be cached as JSON, e.g., in the library snapshot.)"""
+    author = bibent.get('author', '').replace('\r', '').replace('\n', ' ').strip()
+    title  = bibent.get('title', '').strip("{}")
+    year   = bibent.get('year', '')
+    date   = bibent.get('ckdateadded', '')
+    url    = bibent_get_url(bibent)
+    venue  = bibent_get_venue(bibent)
+
+    return [author, title, year, date, url, venue]
+
+
+def dateadded_to_timestamp(date):
+    """Converts a 'YYYY-MM-DD HH:MM:SS' date (as in 'ckdateadded') into seconds since the epoch, or -1 if the date is missing or malformed."""
+    try:
+        return calendar.timegm((int(date[0:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]), int(date[14:16]), int(date[17:19])))
+    except (ValueError, IndexError):
+        return -1
+
+
+DATE_BOUND_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?)?$')
+DATE_AGO_RE = re.compile(r'^(\d+)([dw])$')
+
+
+def parse_dateadded_bound(spec, end=False, now=None):
+    """Parses a date given to 'ck list --since/--until' into seconds since the epoch, comparable with dateadded_to_timestamp().
+       Takes 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]', or a number of days or weeks ago (e.g., '7d', '2w'). If 'end' is set,
+       a day without a time means its last second, rather than its first. Raises ValueError if the date is malformed."""
+    spec = spec.strip()
+
+    m = DATE_AGO_RE.match(spec)
+    if m is not None:
+        # NOTE: 'ckdateadded' is in local time, and dateadded_to_timestamp() reads it as if it were UTC, so we do the same with 'now'
+        if now is None:
+            now = calendar.timegm(time.localtime())
+        return now - int(m.group(1)) * (86400 if m.group(2) == 'd' else 7 * 86400)
+
+    m = DATE_BOUND_RE.match(spec)
+    if m is None:
+        raise ValueError("Expected a date like 2024-01-31, '2024-01-31 14:00' or 7d, got '" + spec + "'")
+
+    year, month, day = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    if m.group(4) is None:
+        hour, minute, second = (23, 59, 59) if end else (0, 0, 0)
+    else:
+        hour, minute = int(m.group(4)), int(m.group(5))
+        second = int(m.group(6)) if m.group(6) is not None else (59 if end else 0)
+
+    if not (1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1] and hour < 24 and minute < 60 and second < 60):
+        raise ValueError("Invalid date '" + spec + "'")
+    return calendar.timegm((year, month, day, hour, minute, second))
+
+
+# The columns we can sort papers by, mapped to their (precomputed) sort keys
+SORT_KEYS = {
+    'ck':         attrgetter('ck'),
+    'author':     attrgetter('author_key'),
+    'title':      attrgetter('title_key'),
+    'year':       attrgetter('year_key'),
+    'date-added': attrgetter('date_key'),
+    'venue':      attrgetter('venue_key'),
+}
+
+
+def parse_sort_spec(spec):
+    """Parses a comma-separated list of columns to sort by (e.g., 'year,venue'), where a column can be prefixed by '-' to
+       sort by it in descending order (e.g., '-year,title'). Returns a list of (column, descending) pairs.
+       Raises ValueError for unknown columns."""
+    columns = []
+    for column in spec.lower().split(','):
+        column = column.strip()
+        descending = column.startswith('-')
+        column = column.lstrip('-')
+
+        if column not in SORT_KEYS:
+            raise ValueError("Unknown sorting column '" + column + "'")
+        columns.append((column, descending))
+
+    return columns
+
+
+def sort_papers(papers, columns, reverse=False):
+    """Sorts the papers in place by the given (column, descending) pairs, as returned by parse_sort_spec().
+       If 'reverse' is set, reverses the whole order."""
+    # NOTE: Python's sort is stable, so sorting by the least-significant column first gives us a multi-column sort
+    for column, descending in reversed(columns):
+        papers.sort(key=SORT_KEYS[column], reverse=(descending != reverse))
+
+    return papers
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import bisect
+import re
+from collections import Counter
+
+from .bib import author_last_name, strip_accents
+
+
+# NOTE(Alin): 'ck search' queries are lists of terms, all of which a paper must match. A term is either a field term
+# like 'author:goldberg', 'year:2018..', 'venue:crypto', 'title:snark' or 'tag:sigs', which is answered from an index
+# over that field of the papers in the library snapshot, or anything else, which is searched for in the papers' raw
+# BibTeX (i.e., what 'ck search' always did).
+QUERY_FIELDS = ['author', 'title', 'venue', 'year', 'tag']
+
+# The fields 'ck search --facets' counts papers by
+FACET_FIELDS = ['year', 'venue', 'tag']
+
+# When this few papers are left, checking each one's BibTeX for a raw term beats searching the whole snapshot for it
+QUERY_SCAN_MAX = 2048
+
+QUERY_TERM_RE = re.compile(r'^(' + '|'.join(QUERY_FIELDS) + r'):(.*)$', re.DOTALL)
+QUERY_WORD_RE = re.compile(r'\w+')
+
+
+class QueryTerm(object):
+    """One term of a query: a 'field' (or None, for raw BibTeX search) and the value it must match."""
+
+    def __init__(self, field, value):
+        self.field = field
+        self.value = value
+
+    def __repr__(self):
+        return 'QueryTerm(' + repr(self.field) + ', ' + repr(self.value) + ')'
+
+
+def parse_query(args):
+    """Parses each argument of 'ck search' into a QueryTerm. Raises ValueError on malformed field terms."""
+    terms = []
+    for arg in args:
+        m = QUERY_TERM_RE.match(arg)
+        if m is None:
+            terms.append(QueryTerm(None, arg))
+            continue
+
+        field, value = m.group(1), m.group(2).strip()
+        if len(value) == 0:
+            raise ValueError("Missing value in '" + arg + "'")
+        if field == 'year':
+            value = parse_year_range(value)
+        terms.append(QueryTerm(field, value))
+
+    return terms
+
+
+def parse_year_range(value):
+    """Parses '2019', '2018..', '..2015' or '2015..2018' into an inclusive (from, to) range."""
+    lo, sep, hi = value.partition('..')
+    try:
+        lo = int(lo) if len(lo) > 0 else 0
+        hi = (int(hi) if len(hi) > 0 else 9999) if len(sep) > 0 else lo
+    except ValueError:
+        raise ValueError("Expected a year or a range of years (e.g., 2018..2020), got '" + value + "'")
+
+    if lo > hi:
+        raise ValueError("Empty range of years '" + value + "'")
+    return lo, hi
+
+
+def normalize_words(text):
+    return QUERY_WORD_RE.findall(strip_accents(text).casefold())
+
+
+def normalize_last_name(author):
+    return author_last_name(strip_accents(author)).casefold()
+
+
+def normalize_venue(venue):
+    """Returns the venue as we display it in facets, without BibTeX braces and extra whitespace."""
+    return ' '.join(venue.replace('{', '').replace('}', '').split())
+
+
+def paper_authors(author):
+    return [a.strip() for a in author.split(' and ') if len(a.strip()) > 0]
+
+
+class QueryIndex(object):
+    """Per-field indexes over the papers in a LibrarySnapshot (and their tags), for answering queries.
+       Each field's index is built the first time a query needs it, and kept for later queries (e.g., in 'ck serve')."""
+
+    def __init__(self, snapshot, ck_tags):
+        self.snapshot = snapshot
+        self.ck_tags = ck_tags
+        self._indexes = {}
+
+    def _build(self, field):
+        index = {}
+        if field == 'tag':
+            # A paper tagged 'sigs/bls' also matches 'tag:sigs'
+            for ck, tags in self.ck_tags.items():
+                for tag in tags:
+                    parts = tag.split('/')
+                    for i in range(1, len(parts) + 1):
+                        index.setdefault('/'.join(parts[:i]), set()).add(ck)
+            return index
+
+        for ck in self.snapshot.cks():
+            entry = self.snapshot.get_paper_fields(ck)
+            if entry is None:
+                continue
+            author, title, year, _, _, venue = entry[1]
+
+            if field == 'author':
+                keys = [normalize_last_name(a) for a in paper_authors(author)]
+            elif field == 'title':
+                keys = normalize_words(title)
+            elif field == 'venue':
+                keys = normalize_words(venue) if venue is not None else []
+            elif field == 'year':
+                keys = [int(year)] if year.strip().isdigit() else []
+
+            for key in keys:
+                index.setdefault(key, set()).add(ck)
+
+        if field == 'year':
+            # Kept sorted, so year ranges can be looked up by bisection
+            self._years = sorted(index)
+        return index
+
+    def field_index(self, field):
+        if field not in self._indexes:
+            self._indexes[field] = self._build(field)
+        return self._indexes[field]
+
+    def _postings(self, term):
+        """Returns the list of sets of CKs, one of which a paper must be in to match the field term (i.e., their union)
+           or, for terms with several words, all of which it must be in (i.e., their intersection), and which of the two."""
+        index = self.field_index(term.field)
+        if term.field == 'year':
+            lo, hi = term.value
+            years = self._years[bisect.bisect_left(self._years, lo):bisect.bisect_right(self._years, hi)]
+            return [index[y] for y in years], 'union'
+        elif term.field == 'tag':
+            return [index.get(term.value.strip('/'), set())], 'union'
+        elif term.field == 'author':
+            return [index.get(normalize_last_name(term.value), set())], 'union'
+        else:
+            words = normalize_words(term.value)
+            return [index.get(w, set()) for w in words], 'intersection'
+
+    def estimate(self, term):
+        """Returns (an upper bound on) how many papers match the term, which is how the query planner orders terms."""
+        if term.field is None:
+            return len(self.snapshot)
+
+        postings, how = self._postings(term)
+        if len(postings) == 0:
+            return 0
+        return sum(len(p) for p in postings) if how == 'union' else min(len(p) for p in postings)
+
+    def match(self, term):
+        """Returns the set of CKs matching the field term."""
+        postings, how = self._postings(term)
+        if len(postings) == 0:
+            return set()
+        if how == 'union':
+            return set().union(*postings)
+
+        # Intersect the smallest sets first
+        postings = sorted(postings, key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+
+def plan_query(index, terms):
+    """Orders the query's terms so the most selective ones are evaluated first, and raw BibTeX searches last."""
+    return sorted(terms, key=lambda t: (t.field is None, index.estimate(t) if t.field is not None else 0))
+
+
+def run_query(index, terms, case_sensitive=False):
+    """Returns the set of CKs of the papers matching all terms of the query."""
+    snapshot = index.snapshot
+    cks = None
+
+    for term in plan_query(index, terms):
+        if cks is not None and len(cks) == 0:
+            break
+
+        if term.field is not None:
+            matches = index.match(term)
+        elif cks is None or len(cks) > QUERY_SCAN_MAX:
+            matches = snapshot.search(term.value, case_sensitive)
+        else:
+            # Only a few papers are left, so only look at those
+            value = term.value if case_sensitive else term.value.lower()
+            matches = set(ck for ck in cks
+                if value in (snapshot.get_bibtex(ck) if case_sensitive else snapshot.get_bibtex(ck).lower()))
+
+        cks = matches if cks is None else cks & matches
+
+    return cks if cks is not None else set(snapshot.cks())
+
+
+def facet_counts(snapshot, ck_tags, cks):
+    """Returns a dict from each of FACET_FIELDS to a Counter of how many of the papers with the given CKs have each value."""
+    facets = dict((f, Counter()) for f in FACET_FIELDS)
+    for ck in cks:
+        entry = snapshot.get_paper_fields(ck)
+        if entry is not None:
+            _, _, year, _, _, venue = entry[1]
+            if len(year.strip()) > 0:
+                facets['year'][year.strip()] += 1
+            if venue is not None and len(normalize_venue(venue)) > 0:
+                facets['venue'][normalize_venue(venue)] += 1
+
+        for tag in ck_tags.get(ck, []):
+            facets['tag'][tag] += 1
+
+    return facets
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import json
+import os
+import re
+from collections import defaultdict
+
+import click
+
+from .bib import bibent_to_bibtex, bibent_to_default_ck, bibtex_to_bibent, ck_add_suffix, ck_sanitize
+from .print import print_warning
+from .utils import string_to_file_atomic
+
+
+# NOTE(Alin): Re-keying renames files in BibDir, rewrites .bib files and retags many papers.
+# Before touching anything, we write the whole plan to a journal, and we record our progress in it as we go. Every step
+# is idempotent, so if we crash midway, re-running the plan from the last recorded position (i.e., rolling forward)
+# finishes the job without breaking anything.
+REKEY_JOURNAL_FILENAME = 'rekey-journal.json'
+
+# How many papers we re-key between journal updates
+REKEY_JOURNAL_EVERY = 64
+
+# The suffixes ck_add_suffix() adds to colliding CKs
+CK_SUFFIX_RE = re.compile(r'[a-z]+')
+
+
+def ck_follows_policy(ck, policy_ck, taken_cks):
+    """Returns True if the CK is the one the policy gives the paper, or one ck_add_suffix() could have given it instead
+       (e.g., 'KZG10b' for 'KZG10'), which it only does if the policy's CK, or a suffixed one before it, is taken.
+       'taken_cks' is the set of casefolded CKs of the other papers."""
+    if ck == policy_ck:
+        return True
+    if not ck.startswith(policy_ck) or CK_SUFFIX_RE.fullmatch(ck[len(policy_ck):]) is None:
+        return False
+
+    base = policy_ck.casefold()
+    if base in taken_cks:
+        return True
+
+    # NOTE(Alin): ck_add_suffix() tries shorter suffixes first, and suffixes of the same length in alphabetical order.
+    # We compare suffixes rather than try each one before ours, since a long one (e.g., 'KZG10foobar') is far down.
+    suffix = (len(ck) - len(policy_ck), ck[len(policy_ck):])
+    for taken_ck in taken_cks:
+        if taken_ck.startswith(base) and CK_SUFFIX_RE.fullmatch(taken_ck[len(base):]) is not None:
+            if (len(taken_ck) - len(base), taken_ck[len(base):]) < suffix:
+                return True
+    return False
+
+
+def rekey_plan(bibents, policy, all_cks, verbosity):
+    """Returns the list of (old CK, new CK) renames needed so the papers in 'bibents' (a dict from CK to bibentry) follow
+       the given DefaultCk policy, as well as the list of CKs whose new key could not be derived.
+
+       New CKs never collide with 'all_cks' (every CK in the library, including the ones being renamed) or with each
+       other: colliding ones get a suffix (a, b, c, ...). So no CK is both given up and taken by the plan, which is what
+       makes re-applying part of it (see rekey_apply()) safe."""
+    taken_cks = set(ck.casefold() for ck in all_cks)
+    renames = []
+    failed = []
+
+    for old_ck in sorted(bibents):
+        try:
+            new_ck = ck_sanitize(bibent_to_default_ck(defaultdict(lambda: '', bibents[old_ck]), policy, verbosity))
+        except (AssertionError, IndexError, KeyError):
+            new_ck = ''
+
+        if len(new_ck) == 0:
+            failed.append(old_ck)
+            continue
+        # The paper may change the case of its own CK, but any other new CK must not be taken. The paper's own CK does
+        # not count as taken while picking its new one, but stays taken afterwards, so no other paper gets it.
+        taken_cks.discard(old_ck.casefold())
+        # NOTE(Alin): A paper whose CK got a suffix because of a collision still follows the policy, or else re-keying
+        # again would keep moving it to another suffix.
+        if ck_follows_policy(old_ck, new_ck, taken_cks):
+            taken_cks.add(old_ck.casefold())
+            continue
+
+        if new_ck.casefold() != old_ck.casefold():
+            new_ck = ck_add_suffix(new_ck, taken_cks)
+        taken_cks.add(old_ck.casefold())
+        renames.append((old_ck, new_ck))
+
+    return renames, failed
+
+
+def rekey_journal_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, REKEY_JOURNAL_FILENAME)
+
+
+def rekey_journal_load(path):
+    """Returns the (renames, number of renames done) of an interrupted re-keying, or None if there is none."""
+    try:
+        with open(path, 'r') as f:
+            journal = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    return [tuple(r) for r in journal['renames']], journal['done']
+
+
+def rekey_journal_save(path, renames, done):
+    string_to_file_atomic(json.dumps({ 'renames': renames, 'done': done }), path)
+
+
+def ck_files_in_dir(ck_bib_dir):
+    """Returns a dict from each CK in BibDir to the names of its files (e.g., 'KZG10.pdf', 'KZG10.bib', 'KZG10.slides.pdf')."""
+    files = defaultdict(list)
+    for filename in os.listdir(ck_bib_dir):
+        files[filename.split('.', 1)[0]].append(filename)
+    return files
+
+
+def rekey_paper(ck_bib_dir, tag_store, old_ck, new_ck, filenames, tags, verbosity):
+    """Renames one paper's files, rewrites the CK in its .bib file and retags it in the TagStore.
+       Safe to call again on a paper that was (partly) renamed already."""
+    for filename in filenames:
+        src = os.path.join(ck_bib_dir, filename)
+        dst = os.path.join(ck_bib_dir, new_ck + filename[len(old_ck):])
+        # NOTE: On case-insensitive filesystems, a paper that only changes the case of its CK has src and dst be the same file
+        if os.path.lexists(src) and (not os.path.lexists(dst) or os.path.samefile(src, dst)):
+            if verbosity > 0:
+                click.echo("Renaming '" + filename + "' to '" + os.path.basename(dst) + "'")
+            os.rename(src, dst)
+
+    bibpath = os.path.join(ck_bib_dir, new_ck + ".bib")
+    if os.path.exists(bibpath):
+        with open(bibpath, 'r') as f:
+            bibent = bibtex_to_bibent(f.read())
+        if bibent['ID'] != new_ck:
+            bibent['ID'] = new_ck
+            string_to_file_atomic(bibent_to_bibtex(bibent), bibpath)
+
+    tag_store.rename_ck(old_ck, new_ck, tags)
+
+
+def rekey_apply(ck_bib_dir, tag_store, ck_tags, renames, journal_path, start, verbosity):
+    """Applies the renames, starting with the 'start'th, and recording progress in the journal.
+       'ck_tags' maps each CK to its tags, as returned by TagStore.ck_tags(). Deletes the journal when done."""
+    files = ck_files_in_dir(ck_bib_dir)
+    rekey_journal_save(journal_path, renames, start)
+
+    with click.progressbar(renames[start:], label="Re-keying papers", show_pos=True) as bar:
+        for i, (old_ck, new_ck) in enumerate(bar, start):
+            if i > start and (i - start) % REKEY_JOURNAL_EVERY == 0:
+                rekey_journal_save(journal_path, renames, i)
+
+            # NOTE: When rolling forward, the paper's files might already have the new name, in which case there is nothing to rename
+            filenames = files.get(old_ck, [])
+            if len(filenames) == 0 and len(files.get(new_ck, [])) == 0:
+                print_warning("No files found for " + old_ck)
+
+            rekey_paper(ck_bib_dir, tag_store, old_ck, new_ck, filenames, ck_tags.get(old_ck, []), verbosity)
+
+    os.remove(journal_path)
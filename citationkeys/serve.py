@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+import appdirs
+
+
+# NOTE(Alin): 'ck serve' keeps the parsed configuration, the tag map and the library snapshot in memory, and runs
+# read-only commands for other 'ck' invocations, which forward their arguments to it over a Unix socket and print
+# what it sends back. This module is imported by 'ck' before anything else, so it must only import what the client
+# needs to forward a command (i.e., nothing slow like bibtexparser).
+#
+# Protocol: the client sends one JSON request line, { "argv": [...], "cwd": "...", "color": true|false }, and the
+# server replies with one JSON line, either { "fallback": true } if the client should run the command itself, or
+# { "stdout": "...", "stderr": "...", "exit": <exit code> }.
+#
+# Served commands must never prompt the user, nor touch anything on the server's side (e.g., 'ck bib' copies to the
+# clipboard, and asks whether to create missing .bib files), since the server has no terminal the user is looking at.
+SERVED_COMMANDS = ['find', 'info', 'list', 'related', 'search', 'tags']
+
+# Set this environment variable (to anything) to never forward commands to 'ck serve'
+SERVE_DISABLE_ENV = 'CK_NO_SERVE'
+
+
+def default_config_file():
+    return os.path.join(appdirs.user_config_dir('ck'), 'ck.config')
+
+
+def serve_socket_path(config_file):
+    """Returns the path of the Unix socket 'ck serve' listens on for the library with the given configuration file.
+       It lives in the user's runtime directory (or the temporary directory), since it must not be synced, and
+       Unix socket paths must be short."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR', tempfile.gettempdir())
+    digest = hashlib.sha1(os.path.realpath(config_file).encode('utf-8')).hexdigest()[:16]
+    uid = str(os.getuid()) if hasattr(os, 'getuid') else 'user'
+    return os.path.join(runtime_dir, 'ck-' + uid + '-' + digest + '.sock')
+
+
+def serve_config_file(argv):
+    """Returns the configuration file passed via -c/--config-file in the 'ck' arguments (before the command), or the default one."""
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('-c', '--config-file'):
+            return argv[i + 1] if i + 1 < len(argv) else None
+        elif arg.startswith('--config-file='):
+            return arg[len('--config-file='):]
+        elif arg.startswith('-c') and not arg.startswith('--'):
+            return arg[2:]
+        elif not arg.startswith('-'):
+            break
+        i += 1
+
+    return default_config_file()
+
+
+def serve_command_name(argv):
+    """Returns the command name in the 'ck' arguments (i.e., the first argument that is not a global option), or None."""
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ('-c', '--config-file'):
+            i += 2
+        elif arg.startswith('-'):
+            i += 1
+        else:
+            return arg
+    return None
+
+
+def send_json(sock, obj):
+    sock.sendall(json.dumps(obj).encode('utf-8') + b'\n')
+
+
+def recv_json(sock):
+    """Reads one JSON line from the socket. Returns None if the other side closed it before sending a whole line."""
+    chunks = []
+    while True:
+        chunk = sock.recv(1 << 16)
+        if len(chunk) == 0:
+            return None
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def serve_forward(argv):
+    """Asks a running 'ck serve' to run the 'ck' command with the given arguments, and prints its output.
+       Returns the command's exit code, or None if it must be run in-process (e.g., no server is running, or it
+       does not serve this command)."""
+    if os.environ.get(SERVE_DISABLE_ENV) is not None:
+        return None
+
+    config_file = serve_config_file(argv)
+    if config_file is None or serve_command_name(argv) is None:
+        return None
+
+    path = serve_socket_path(config_file)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            send_json(sock, { 'argv': argv, 'cwd': os.getcwd(), 'color': sys.stdout.isatty() })
+            resp = recv_json(sock)
+    except (OSError, ValueError):
+        # e.g., the server died and left its socket behind
+        return None
+
+    if resp is None or resp.get('fallback', False):
+        return None
+
+    sys.stdout.write(resp['stdout'])
+    sys.stdout.flush()
+    sys.stderr.write(resp['stderr'])
+    sys.stderr.flush()
+    return resp['exit']
+
+
+def serve_listen(path):
+    """Returns a socket listening at 'path'. Raises FileExistsError if another server is already listening there."""
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            raise FileExistsError("Another server is listening at " + path)
+        except ConnectionRefusedError:
+            # A server died without cleaning up after itself
+            os.remove(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only we may talk to our server
+    umask = os.umask(0o077)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(umask)
+    sock.listen(16)
+    return sock
+
+
+class ThreadLocalOutput(object):
+    """Stands in for sys.stdout (or sys.stderr), so that a thread can capture what it prints (see capture()), while
+       what other threads print still goes to the real stream."""
+
+    # NOTE(Alin): click.echo() only wraps streams whose encoding it does not trust, and we always write str
+    encoding = 'utf-8'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def _current(self):
+        buf = getattr(self._local, 'buf', None)
+        return buf if buf is not None else self.stream
+
+    @contextlib.contextmanager
+    def capture(self, buf):
+        self._local.buf = buf
+        try:
+            yield buf
+        finally:
+            self._local.buf = None
+
+    def write(self, s):
+        return self._current().write(s)
+
+    def flush(self):
+        return self._current().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+@contextlib.contextmanager
+def serve_capture_output(out, err):
+    """Like contextlib.redirect_stdout() and redirect_stderr(), but only for the calling thread. In 'ck serve', this
+       keeps what the watcher thread prints (e.g., with -v) out of the response to the request being served."""
+    if not isinstance(sys.stdout, ThreadLocalOutput):
+        sys.stdout = ThreadLocalOutput(sys.stdout)
+    if not isinstance(sys.stderr, ThreadLocalOutput):
+        sys.stderr = ThreadLocalOutput(sys.stderr)
+
+    with sys.stdout.capture(out), sys.stderr.capture(err):
+        yield
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import bisect
+import heapq
+import json
+import mmap
+import os
+import re
+import struct
+import time
+
+import click
+
+from .bib import bibtex_to_bibent
+from .paper import dateadded_to_timestamp, paper_fields_from_bibent
+from .utils import bytes_to_file_atomic
+
+
+# NOTE(Alin): The snapshot packs every .bib file in BibDir into a single file in CacheDir, so that commands which
+# look at the whole library (e.g., 'ck search', 'ck list', 'ck genbib') can mmap one file instead of opening,
+# reading and closing tens of thousands of tiny ones. The .bib files remain the source of truth: the snapshot
+# is rebuilt incrementally whenever their mtimes or sizes change, and can always be deleted.
+#
+# Layout:
+#   SNAPSHOT_MAGIC | <index length, as a little-endian uint64> | <JSON index> | <concatenated BibTeX of all entries>
+#
+# The JSON index maps each CK to [offset, length, mtime_ns, size, fields], where offset is relative to the start
+# of the BibTeX data and 'fields' is ['<ID in .bib>', [<paper_fields_from_bibent()>]] (or None, if the .bib
+# did not parse), so listing papers needs no BibTeX parsing either. It also has the date-added index, i.e., the list of
+# [<'ckdateadded' as returned by dateadded_to_timestamp()>, CK] of all entries, sorted, so that recently-added papers
+# (e.g., 'ck list --since', 'ck list --last') are found without looking at all the others.
+SNAPSHOT_MAGIC = b'CKSNAP2\n'
+SNAPSHOT_FILENAME = 'library.snapshot'
+
+# Files modified this close to the time the snapshot was built might be modified again without their mtime
+# changing (e.g., on filesystems with coarse timestamps), so we re-read them on the next update, like git does.
+RACY_WINDOW_NS = 2 * 10**9
+
+
+class LibrarySnapshot(object):
+    """A read-only, mmap'd view of the packed snapshot of all .bib files in a BibDir."""
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            hdr_len = len(SNAPSHOT_MAGIC) + 8
+            if self._mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError("Not a ck library snapshot: " + path)
+
+            (index_len,) = struct.unpack('<Q', self._mm[len(SNAPSHOT_MAGIC):hdr_len])
+            index = json.loads(self._mm[hdr_len:hdr_len + index_len].decode('utf-8'))
+            self._data_start = hdr_len + index_len
+
+            self.built_ns = index['built_ns']
+            self._entries = index['entries']
+            self._md = set(index['md'])
+            self._dates = [d[0] for d in index['dates']]
+            self._dated_cks = [d[1] for d in index['dates']]
+        except (KeyError, TypeError, ValueError, struct.error):
+            self._mm.close()
+            raise ValueError("Corrupted ck library snapshot: " + path)
+
+        # For mapping offsets in the data (e.g., of search matches) back to CKs
+        self._cks = sorted(self._entries, key=lambda ck: self._entries[ck][0])
+        self._offsets = [self._entries[ck][0] for ck in self._cks]
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, ck):
+        return ck in self._entries
+
+    def cks(self):
+        return sorted(self._entries)
+
+    def has_md(self, ck):
+        return ck in self._md
+
+    def fingerprint(self, ck):
+        """Returns the (mtime_ns, size) of the .bib file the entry was read from."""
+        entry = self._entries[ck]
+        return entry[2], entry[3]
+
+    def get_bytes(self, ck):
+        offset, length = self._entries[ck][0:2]
+        start = self._data_start + offset
+        return self._mm[start:start + length]
+
+    def get_bibtex(self, ck):
+        """Returns the BibTeX of the specified CK, exactly as in its .bib file."""
+        return self.get_bytes(ck).decode('utf-8', errors='replace')
+
+    def get_paper_fields(self, ck):
+        """Returns ('<ID in .bib>', [<paper_fields_from_bibent()>]) for the specified CK, or None if the CK is
+           not in the snapshot or its .bib file could not be parsed."""
+        entry = self._entries.get(ck)
+        if entry is None or entry[4] is None:
+            return None
+        return entry[4][0], entry[4][1]
+
+    def date_added(self, ck):
+        """Returns the entry's 'ckdateadded' as returned by dateadded_to_timestamp() (i.e., -1 if it has none)."""
+        entry = self._entries.get(ck)
+        if entry is None or entry[4] is None:
+            return -1
+        return dateadded_to_timestamp(entry[4][1][3])
+
+    def cks_added_between(self, since=None, until=None):
+        """Returns the CKs added between the 'since' and 'until' timestamps (both inclusive, and None meaning
+           unbounded), oldest first. Papers with no 'ckdateadded' are only returned when 'since' is None."""
+        lo = 0 if since is None else bisect.bisect_left(self._dates, since)
+        hi = len(self._dates) if until is None else bisect.bisect_right(self._dates, until)
+        return self._dated_cks[lo:hi]
+
+    def latest_cks(self, n, cks=None):
+        """Returns the (up to) n most recently added CKs, newest first. If 'cks' is given, only considers those."""
+        if cks is None:
+            return self._dated_cks[max(0, len(self._dated_cks) - n):][::-1]
+        return heapq.nlargest(n, cks, key=lambda ck: (self.date_added(ck), ck))
+
+    def search(self, query, case_sensitive=False):
+        """Returns the set of CKs whose BibTeX contains the query string."""
+        if len(query) == 0:
+            return set(self._entries)
+
+        if not case_sensitive and not query.isascii():
+            # NOTE(Alin): re.IGNORECASE on bytes only folds ASCII letters, so for non-ASCII queries we decode and lowercase
+            # each entry, like we used to do for each .bib file.
+            query = query.lower()
+            return set(ck for ck in self._cks if query in self.get_bibtex(ck).lower())
+
+        # re can search the mmap directly, without copying the entries into memory
+        pattern = re.compile(re.escape(query.encode('utf-8')), 0 if case_sensitive else re.IGNORECASE)
+        base = self._data_start
+        pos = base
+
+        cks = set()
+        while True:
+            m = pattern.search(self._mm, pos)
+            if m is None:
+                break
+
+            i = bisect.bisect_right(self._offsets, m.start() - base) - 1
+            ck = self._cks[i]
+            offset, length = self._entries[ck][0:2]
+
+            # A match that straddles two entries does not count, so only skip past the entry it starts in
+            if m.end() - base <= offset + length:
+                cks.add(ck)
+            pos = base + offset + length
+
+        return cks
+
+
+def snapshot_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, SNAPSHOT_FILENAME)
+
+
+def snapshot_load(path):
+    """Returns the LibrarySnapshot at 'path', or None if it is missing or corrupted."""
+    try:
+        return LibrarySnapshot(path)
+    except (OSError, ValueError):
+        return None
+
+
+def bibtex_to_snapshot_fields(data):
+    try:
+        bibent = bibtex_to_bibent(data.decode('utf-8'))
+    except Exception:
+        return None
+
+    return [bibent.get('ID', ''), paper_fields_from_bibent(bibent)]
+
+
+def snapshot_update(ck_bib_dir, ck_cache_dir, verbosity, cks=None):
+    """Brings the snapshot of the .bib files in 'ck_bib_dir' up to date and returns it as a LibrarySnapshot.
+       Only re-reads .bib files whose mtime or size changed since the last update.
+
+       If the list of 'cks' whose files changed is known (e.g., from 'ck watch'), only looks at those papers' files and
+       trusts the snapshot for all others, without scanning BibDir."""
+    path = snapshot_path(ck_cache_dir)
+    old = snapshot_load(path)
+
+    if cks is not None and old is not None:
+        bibs = dict((ck, os.path.join(ck_bib_dir, ck + ".bib")) for ck in old._entries)
+        md = set(old._md)
+        for ck in cks:
+            if os.path.exists(os.path.join(ck_bib_dir, ck + ".bib")):
+                bibs[ck] = os.path.join(ck_bib_dir, ck + ".bib")
+            else:
+                bibs.pop(ck, None)
+
+            if os.path.exists(os.path.join(ck_bib_dir, ck + ".md")):
+                md.add(ck)
+            else:
+                md.discard(ck)
+        trusted = set(bibs) - set(cks)
+        md = list(md)
+    else:
+        bibs = {}
+        md = []
+        trusted = set()
+        with os.scandir(ck_bib_dir) as it:
+            for dirent in it:
+                ck, ext = os.path.splitext(dirent.name)
+
+                # e.g., CMT12.pdf might have CMT12.slides.pdf next to it
+                if '.' in ck:
+                    continue
+
+                ext = ext.lower()
+                if ext == '.bib':
+                    bibs[ck] = dirent.path
+                elif ext == '.md':
+                    md.append(ck)
+
+    built_ns = time.time_ns()
+    changed = old is None or set(md) != old._md or len(bibs) != len(old)
+    entries = {}
+    chunks = []
+    offset = 0
+    num_read = 0
+
+    for ck in sorted(bibs):
+        if ck in trusted:
+            entries[ck] = [offset] + old._entries[ck][1:]
+            data = old.get_bytes(ck)
+            chunks.append(data)
+            offset += len(data)
+            continue
+
+        try:
+            st = os.stat(bibs[ck])
+        except FileNotFoundError:
+            changed = True
+            continue
+
+        fp = (st.st_mtime_ns, st.st_size)
+        reuse = (old is not None and ck in old and old.fingerprint(ck) == fp
+            and st.st_mtime_ns < old.built_ns - RACY_WINDOW_NS)
+
+        if reuse:
+            data = old.get_bytes(ck)
+            fields = old._entries[ck][4]
+        else:
+            try:
+                with open(bibs[ck], 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                changed = True
+                continue
+
+            fields = bibtex_to_snapshot_fields(data)
+            num_read += 1
+
+            if old is None or ck not in old or old.get_bytes(ck) != data or old.fingerprint(ck) != fp:
+                changed = True
+
+            if verbosity > 1:
+                click.echo("Updated snapshot entry for " + ck)
+
+        entries[ck] = [offset, len(data), fp[0], fp[1], fields]
+        chunks.append(data)
+        offset += len(data)
+
+    # NOTE(Alin): Even if nothing changed, entries we re-read because they were racy need to be re-stamped, or we would
+    # keep re-reading them on every update.
+    if changed or num_read > 0:
+        dates = sorted([dateadded_to_timestamp(e[4][1][3]) if e[4] is not None else -1, ck] for ck, e in entries.items())
+        index = json.dumps({ 'built_ns': built_ns, 'entries': entries, 'md': sorted(md), 'dates': dates }, separators=(',', ':')).encode('utf-8')
+        snapshot = b''.join([SNAPSHOT_MAGIC, struct.pack('<Q', len(index)), index] + chunks)
+
+        if old is not None:
+            old.close()
+
+        bytes_to_file_atomic(snapshot, path)
+
+        if verbosity > 0:
+            click.echo("Updated library snapshot (" + str(num_read) + " of " + str(len(entries)) + " .bib files re-read)")
+
+        return LibrarySnapshot(path)
+
+    return old
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import math
+import os
+import re
+import zlib
+from collections import deque
+
+from .cache import file_fingerprint, json_cache_load, json_cache_save
+
+# pypdf is optional: it extracts text from more PDFs (e.g., ones with CID fonts) than our own extractor does
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+
+# NOTE(Alin): 'ck tag' suggests tags for a paper by looking for the words in the library's tags (e.g., 'accumulators'
+# and 'merkle' for 'accumulators/merkle') in the text of its PDF. The text is extracted once and cached in CacheDir,
+# and all the words are looked for in a single pass over it, via an Aho-Corasick automaton.
+PDF_TEXT_DIRNAME = 'pdf-text'
+
+# How many tags 'ck tag' suggests
+SUGGEST_MAX_TAGS = 10
+
+PDF_STREAM_RE = re.compile(rb'<<((?:[^<>]|<<(?:[^<>]|<<[^<>]*>>)*>>|<[^<>]*>)*)>>\s*stream\r?\n')
+PDF_TEXT_OBJECT_RE = re.compile(rb'BT\b(.*?)\bET\b', re.DOTALL)
+# A string shown by Tj, ' or ", or an array of strings (and kerning numbers) shown by TJ
+PDF_SHOW_TEXT_RE = re.compile(rb'(\((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\))\s*(?:Tj|\'|")|\[((?:[^\]\\]|\\.)*)\]\s*TJ', re.DOTALL)
+PDF_TJ_ITEM_RE = re.compile(rb'\(((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*)\)|(-?\d*\.?\d+)', re.DOTALL)
+PDF_ESCAPES = { b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f', b'(': b'(', b')': b')', b'\\': b'\\' }
+PDF_ESCAPE_RE = re.compile(rb'\\([0-7]{1,3}|.)', re.DOTALL)
+
+# In a TJ array, a kerning adjustment this negative (in thousandths of an em) is a space between words
+PDF_TJ_SPACE = -200
+
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def pdf_unescape(s):
+    def unescape(m):
+        c = m.group(1)
+        if c[0:1].isdigit():
+            return bytes([int(c, 8) & 0xff])
+        # A backslash before a newline continues the string on the next line
+        if c in (b'\n', b'\r'):
+            return b''
+        return PDF_ESCAPES.get(c, c)
+    return PDF_ESCAPE_RE.sub(unescape, s)
+
+
+def pdf_text_from_content(content):
+    """Returns the text shown by the Tj, TJ, ' and " operators in a PDF content stream, one line per text object.
+       Good enough to find words in most LaTeX-generated papers, but not a general PDF text extractor."""
+    lines = []
+    for bt in PDF_TEXT_OBJECT_RE.finditer(content):
+        pieces = []
+        for m in PDF_SHOW_TEXT_RE.finditer(bt.group(1)):
+            if m.group(1) is not None:
+                pieces.append(pdf_unescape(m.group(1)[1:-1]))
+                pieces.append(b' ')
+                continue
+
+            for item in PDF_TJ_ITEM_RE.finditer(m.group(2)):
+                if item.group(1) is not None:
+                    pieces.append(pdf_unescape(item.group(1)))
+                elif float(item.group(2)) < PDF_TJ_SPACE:
+                    pieces.append(b' ')
+            pieces.append(b' ')
+        lines.append(b''.join(pieces).decode('latin-1'))
+
+    return '\n'.join(lines)
+
+
+def pdf_extract_text(pdfpath):
+    """Returns the text in the PDF, with pypdf if it is installed, or else by decompressing its content streams ourselves."""
+    if pypdf is not None:
+        try:
+            return '\n'.join(page.extract_text() or '' for page in pypdf.PdfReader(pdfpath).pages)
+        except Exception:
+            # Fall back to our own extractor, which is more forgiving with broken PDFs
+            pass
+
+    with open(pdfpath, 'rb') as f:
+        data = f.read()
+
+    texts = []
+    for m in PDF_STREAM_RE.finditer(data):
+        stream = data[m.end():data.find(b'endstream', m.end())]
+        if b'/FlateDecode' in m.group(1):
+            try:
+                stream = zlib.decompressobj().decompress(stream)
+            except zlib.error:
+                continue
+        elif b'/Filter' in m.group(1):
+            # e.g., images
+            continue
+
+        if b'BT' in stream:
+            texts.append(pdf_text_from_content(stream))
+
+    return '\n'.join(t for t in texts if len(t.strip()) > 0)
+
+
+def pdf_text(pdfpath, ck_cache_dir):
+    """Returns the text in the PDF, extracting it only if it changed since we last cached it."""
+    ck = os.path.splitext(os.path.basename(pdfpath))[0]
+    cache_path = os.path.join(ck_cache_dir, PDF_TEXT_DIRNAME, ck + '.json')
+    fingerprint = file_fingerprint(pdfpath)
+
+    cached = json_cache_load(cache_path)
+    if cached.get('fingerprint') == fingerprint and 'text' in cached:
+        return cached['text']
+
+    text = pdf_extract_text(pdfpath)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    json_cache_save(cache_path, { 'fingerprint': fingerprint, 'text': text })
+    return text
+
+
+def normalize_text(text):
+    """Lowercases the text and turns everything but letters and digits into single spaces (e.g., 'Zero-Knowledge' into 'zero knowledge')."""
+    return NON_WORD_RE.sub(' ', text.casefold())
+
+
+class TermMatcher(object):
+    """An Aho-Corasick automaton that counts how often each of a set of terms appears in a text, in one pass over it.
+       Terms match at the start of a word and up to its end, or up to a plural 's' or 'es' ending (e.g., 'commitment'
+       matches 'commitments', but not 'commitmentx' or 'precommitment')."""
+
+    def __init__(self, terms):
+        self.terms = sorted(set(t for t in (normalize_text(t).strip() for t in terms) if len(t) > 0))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]    # the indices of the terms ending at each state (including via failure links)
+
+        # Every term starts at a word boundary, so the automaton looks for ' <term>'
+        for i, term in enumerate(self.terms):
+            state = 0
+            for c in ' ' + term:
+                nxt = self._goto[state].get(c)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][c] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(i)
+
+        # Breadth-first, so a state's failure link is computed after those of all shorter states
+        queue = deque(self._goto[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f != 0 and c not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(c, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def count(self, text):
+        """Returns a dict from each term found in the text to how many times it was found."""
+        text = ' ' + normalize_text(text) + ' '
+        goto, fail, out = self._goto, self._fail, self._out
+        counts = {}
+
+        state = 0
+        for pos, c in enumerate(text):
+            while state != 0 and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+
+            for i in out[state]:
+                # The match ends at 'pos', so check that it also ends a word (or is followed by a plural ending)
+                end = pos + 1
+                if text[end] == ' ' or text.startswith('s ', end) or text.startswith('es ', end):
+                    term = self.terms[i]
+                    counts[term] = counts.get(term, 0) + 1
+
+        return counts
+
+
+class TagSuggester(object):
+    """Suggests tags for papers, given all the tags in the library. Built once and reused for many papers (e.g., in 'ck untag')."""
+
+    def __init__(self, tags):
+        self.tags = sorted(tags)
+        self.matcher = TermMatcher(c for tag in self.tags for c in tag.split('/'))
+
+    def score(self, counts):
+        """Returns a dict from each tag to its score, given how many times each term was found in the paper.
+
+           A tag is scored by how often its last component (e.g., 'merkle' for 'accumulators/merkle') appears, plus
+           half of how often its other components do, on average, all on a log scale, so that a word mentioned many times
+           does not drown out all others. So a subtag whose components all appear ranks above its parent tag. A tag whose
+           last component does not appear does not score at all, since then its parent tag is the better suggestion."""
+        scores = {}
+        for tag in self.tags:
+            components = [normalize_text(c).strip() for c in tag.split('/')]
+            if counts.get(components[-1], 0) == 0:
+                continue
+
+            scores[tag] = math.log1p(counts[components[-1]])
+            if len(components) > 1:
+                scores[tag] += 0.5 * sum(math.log1p(counts.get(c, 0)) for c in components[:-1]) / (len(components) - 1)
+        return scores
+
+    def suggest(self, text, limit=SUGGEST_MAX_TAGS):
+        """Returns up to 'limit' tags for a paper with the given text, best first."""
+        scores = self.score(self.matcher.count(text))
+        return sorted(scores, key=lambda tag: (-scores[tag], tag))[:limit]
+
+
+# The TagSuggester of a 'ck untag' worker process, built once per process by suggest_worker_init()
+_worker_suggester = None
+
+
+def suggest_worker_init(tags):
+    global _worker_suggester
+    _worker_suggester = TagSuggester(tags)
+
+
+def suggest_tags_for_pdf(pdfpath, ck_cache_dir, limit=SUGGEST_MAX_TAGS):
+    """Returns the tags suggested for the PDF (extracting and caching its text first, if needed). Runs in a worker
+       process set up by suggest_worker_init(), so that 'ck untag' can suggest tags for the next papers while the user
+       tags the current one."""
+    return _worker_suggester.suggest(pdf_text(pdfpath, ck_cache_dir), limit)
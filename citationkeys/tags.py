@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
 # NOTE: Alphabetical order please
+from collections import Counter
 from datetime import datetime
 from pprint import pprint
 
 # NOTE: Alphabetical order please
 import bibtexparser
+import bisect
 import click
 import os
 # Use gnureadline on macOS for proper tab completion (libedit has issues)
@@ -20,28 +22,84 @@ from .utils import readline_enable_tab_autocompletion
 
 
 class SimpleCompleter(object):
+    """Readline completer over a fixed set of options (e.g., tags or CKs), built once and reused across prompts.
 
-    def __init__(self, options, spliter):
-        # print("Options (i.e., tags):", options)
+    Options are kept sorted, so the ones starting with the typed text are found by bisection rather than by scanning
+    all of them. If 'separator' is set (e.g., '/' for hierarchical tags), completes one segment at a time, like a shell
+    completes paths: 'crypto/acc' completes to 'crypto/accumulators/' if that tag has subtags. If 'fuzzy' is set and
+    no option starts with the typed text, falls back to the options that contain it, and then to the ones that
+    contain its characters in order (e.g., 'acmerk' for 'accumulators/merkle'). Matches are listed most popular first,
+    according to 'popularity' (e.g., how many papers have each tag)."""
+
+    # How many substring or fuzzy matches we offer, since these can match most options for short texts
+    MAX_FUZZY_MATCHES = 32
+
+    def __init__(self, options, spliter, popularity=None, separator=None, fuzzy=False):
         self.matches = None
-        self.options = sorted(options)
+        self.options = sorted(set(o for o in options if o))
         self.spliter = spliter
-        return
+        self.separator = separator
+        self.fuzzy = fuzzy
+        self.popularity = Counter()
+        for option, count in (popularity or {}).items():
+            self.add(option, count)
+
+    def add(self, option, count=0):
+        """Adds an option (if new), and adds 'count' to its popularity and to that of the segments it is in."""
+        if not option:
+            return
+
+        i = bisect.bisect_left(self.options, option)
+        if i == len(self.options) or self.options[i] != option:
+            self.options.insert(i, option)
+
+        self.popularity[option] += count
+        if self.separator is not None:
+            pos = option.find(self.separator)
+            while pos != -1:
+                self.popularity[option[:pos + 1]] += count
+                pos = option.find(self.separator, pos + 1)
+
+    def _rank(self, matches):
+        return sorted(matches, key=lambda m: (-self.popularity[m], m))
+
+    def prefix_matches(self, prefix):
+        lo = bisect.bisect_left(self.options, prefix)
+        hi = bisect.bisect_left(self.options, prefix + '\U0010ffff', lo)
+        if self.separator is None:
+            return self._rank(self.options[lo:hi])
+
+        # Complete up to (and including) the next separator, so 'sigs/bls' and 'sigs/schnorr' both complete to 'sigs/'
+        matches = set()
+        for option in self.options[lo:hi]:
+            pos = option.find(self.separator, len(prefix))
+            matches.add(option if pos == -1 else option[:pos + 1])
+
+        # NOTE(Alin): A tag with subtags is offered as 'sigs/', not 'sigs', like the bash completion does
+        matches = [m for m in matches if m + self.separator not in matches]
+
+        # If only one segment matches, also offer what is in it, so readline does not end the tag with a space
+        if len(matches) == 1 and matches[0].endswith(self.separator) and matches[0] != prefix:
+            return matches + self.prefix_matches(matches[0])
+        return self._rank(matches)
+
+    def fuzzy_matches(self, text):
+        matches = [o for o in self.options if text in o]
+        if len(matches) == 0:
+            matches = [o for o in self.options if is_subsequence(text, o)]
+        return self._rank(matches)[:self.MAX_FUZZY_MATCHES]
+
+    def get_matches(self, text):
+        matches = self.prefix_matches(text)
+        if len(matches) == 0 and self.fuzzy and len(text) > 0:
+            matches = self.fuzzy_matches(text)
+        return matches
 
     def complete(self, text, state):
-        # print("Complete(text:", text, ", state: ", state)
-
         if state == 0:
             # This is the first time for this text, so build a match list.
             current_item = text.split(self.spliter)[-1].strip()
-            # print("current_item:", current_item)
-            if current_item:
-                self.matches = [s
-                                for s in self.options
-                                if s and s.startswith(current_item)]
-            else:
-                self.matches = self.options[:]
-            # print("matches:", self.matches)
+            self.matches = self.get_matches(current_item)
 
         # Return the state'th item from the match list, if we have that many.
         try:
@@ -49,11 +107,15 @@ class SimpleCompleter(object):
         except IndexError:
             response = None
 
-        # print("response:", response)
-
         return response
 
 
+def is_subsequence(text, option):
+    """Returns True if the characters of 'text' appear in 'option' in the same order (e.g., 'acmk' in 'accumulators/merkle')."""
+    it = iter(option)
+    return all(c in it for c in text)
+
+
 # returns a map of CK to its list of tags
 def find_tagged_pdfs(ck_tag_subdir, verbosity):
     pdfs = dict()
@@ -166,8 +228,21 @@ def parse_tags(tags_str, splitter=','):
     return tags
 
 
+def tag_popularity(ck_tags):
+    """Returns a Counter of how many papers have each tag, given the map of each CK to its tags."""
+    return Counter(tag for tags in ck_tags.values() for tag in tags)
+
+
+def get_tag_completer(ctx):
+    """Returns the completer for tags, building it the first time (e.g., rather than once per paper in 'ck untag')."""
+    if ctx.obj.get('tag_completer') is None:
+        ctx.obj['tag_completer'] = SimpleCompleter(ctx.obj['tag_store'].tags(), ',', tag_popularity(ctx.obj['tags']), separator='/', fuzzy=True)
+
+    return ctx.obj['tag_completer']
+
+
 def prompt_for_tags(ctx, prompt):
-    completer = SimpleCompleter(get_all_tags(ctx.obj['TagDir']), ',')
+    completer = get_tag_completer(ctx)
     readline.set_completer(completer.complete)
 
     # NOTE(Alin): For hierarchical tags like 'arguments/sigma/hidden-order' or 'signatures/blind', the '/' in the tag
@@ -178,14 +253,17 @@ def prompt_for_tags(ctx, prompt):
     # NOTE: On macOS, we use gnureadline instead of libedit for proper tab completion.
     # TODO: Consider switching to prompt_toolkit for a better UX:
     #   - Dropdown menu showing available completions
-    #   - Fuzzy matching support
-    #   - NestedCompleter for hierarchical tags (e.g., accumulators/merkle)
     #   - Pure Python (no compilation issues)
     #   - See: https://python-prompt-toolkit.readthedocs.io/en/master/pages/asking_for_input.html#autocompletion
     readline_enable_tab_autocompletion()
 
     tags_str = input(prompt + ' (use Tab to autocomplete): ')
-    return parse_tags(tags_str)
+    tags = parse_tags(tags_str)
+
+    # The paper is about to get these tags, so the next prompt should offer them (even if they are new)
+    for tag in tags:
+        completer.add(tag, 1)
+    return tags
 
 
 # if tag is None, removes all tags for the paper
@@ -211,13 +289,27 @@ def untag_paper(ck_tag_dir, citation_key, tag=None):
         return untagged
 
 
-def tag_paper(ck_tag_dir, ck_bib_dir, citation_key, tag):
+def tag_link_target(ck_bib_dir, link_dir, pdfname, relative):
+    """Returns what a tag symlink in 'link_dir' to the 'pdfname' PDF in BibDir should point to.
+
+       Absolute links break when the library is synced to a machine where BibDir is at a different path. Relative
+       links (e.g., '../../Papers/KZG10.pdf') keep working as long as BibDir and TagDir stay next to each other."""
+    pdfpath = os.path.join(ck_bib_dir, pdfname)
+    if not relative:
+        return pdfpath
+
+    # NOTE(Alin): The OS resolves relative links from the link's real directory, so compute them between real paths
+    # (e.g., in case TagDir is itself reached via a symlink)
+    return os.path.relpath(os.path.join(os.path.realpath(ck_bib_dir), pdfname), os.path.realpath(link_dir))
+
+
+def tag_paper(ck_tag_dir, ck_bib_dir, citation_key, tag, relative=False):
     pdf_tag_dir = os.path.join(ck_tag_dir, tag)
     os.makedirs(pdf_tag_dir, exist_ok=True)
 
     pdfname = citation_key + ".pdf"
     try:
-        os.symlink(os.path.join(ck_bib_dir, pdfname), os.path.join(pdf_tag_dir, pdfname))
+        os.symlink(tag_link_target(ck_bib_dir, pdf_tag_dir, pdfname, relative), os.path.join(pdf_tag_dir, pdfname))
         return True
     except FileExistsError:
         return False
@@ -225,3 +317,183 @@ def tag_paper(ck_tag_dir, ck_bib_dir, citation_key, tag):
         print("Unexpected error while tagging " + citation_key + " with '" + tag)
         traceback.print_exc()
         raise
+
+
+def tag_dir_is_inside(ck_tag_dir, tag, other_tag):
+    """Returns True if 'tag' is 'other_tag' or one of its subtags (e.g., 'sigs/bls' is inside 'sigs')."""
+    path = os.path.normpath(os.path.join(ck_tag_dir, tag))
+    other_path = os.path.normpath(os.path.join(ck_tag_dir, other_tag))
+    return path == other_path or path.startswith(other_path + os.sep)
+
+
+def count_tag_links(tag_dir):
+    return sum(len(pdfs) for pdfs in find_tagged_pdfs(tag_dir, 0).values())
+
+
+def move_tag_link(src_link, dst_link):
+    """Moves a tag symlink. Absolute links are renamed as they are; relative links are recreated so they still point
+       to the same PDF from their new directory."""
+    target = os.readlink(src_link)
+    if os.path.isabs(target):
+        os.rename(src_link, dst_link)
+    else:
+        pdfpath = os.path.normpath(os.path.join(os.path.dirname(src_link), target))
+        os.symlink(os.path.relpath(pdfpath, os.path.dirname(dst_link)), dst_link)
+        os.remove(src_link)
+
+
+def retarget_relative_links(new_dir, old_dir):
+    """After a tag directory was renamed from 'old_dir' to 'new_dir', fixes the relative symlinks in it, which broke if
+       the directory moved to a different depth. Returns the number of links fixed."""
+    num_fixed = 0
+    for root, dirs, files in os.walk(new_dir):
+        old_root = os.path.join(old_dir, os.path.relpath(root, new_dir))
+        for name in files:
+            link = os.path.join(root, name)
+            if not os.path.islink(link):
+                continue
+
+            target = os.readlink(link)
+            if os.path.isabs(target):
+                continue
+
+            new_target = os.path.relpath(os.path.normpath(os.path.join(old_root, target)), root)
+            if new_target != target:
+                os.remove(link)
+                os.symlink(new_target, link)
+                num_fixed += 1
+
+    return num_fixed
+
+
+def tag_merge(ck_tag_dir, src_tag, dst_tag):
+    """Merges tag 'src_tag' (and its subtags) into 'dst_tag': e.g., a paper tagged with 'src_tag/sub' ends up tagged with
+       'dst_tag/sub'. Papers already in the destination are left alone, so only the symlinks that differ are touched.
+       Subtags that do not exist in the destination are moved over with a single rename. Removes 'src_tag' at the end.
+       Returns the number of (moved, already present) tag links."""
+    src_dir = os.path.join(ck_tag_dir, src_tag)
+    dst_dir = os.path.join(ck_tag_dir, dst_tag)
+    if not os.path.isdir(src_dir):
+        raise ValueError("Tag '" + src_tag + "' does not exist")
+    # NOTE: Merging a subtag into its parent (e.g., 'sigs/bls' into 'sigs') is fine, but not the other way around
+    if tag_dir_is_inside(ck_tag_dir, dst_tag, src_tag):
+        raise ValueError("Cannot merge tag '" + src_tag + "' into its own subtag '" + dst_tag + "'")
+
+    os.makedirs(dst_dir, exist_ok=True)
+    num_moved, num_skipped = 0, 0
+
+    for name in sorted(os.listdir(src_dir)):
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+
+        if os.path.islink(src_path):
+            if os.path.lexists(dst_path):
+                os.remove(src_path)
+                num_skipped += 1
+            else:
+                move_tag_link(src_path, dst_path)
+                num_moved += 1
+        elif os.path.isdir(src_path):
+            if os.path.lexists(dst_path):
+                moved, skipped = tag_merge(ck_tag_dir, os.path.join(src_tag, name), os.path.join(dst_tag, name))
+                num_moved += moved
+                num_skipped += skipped
+            else:
+                os.rename(src_path, dst_path)
+                retarget_relative_links(dst_path, src_path)
+                num_moved += count_tag_links(dst_path)
+        elif not os.path.lexists(dst_path):
+            # e.g., a .gitignore file or notes the user keeps in the tag directory
+            os.rename(src_path, dst_path)
+
+    # NOTE: Anything left over (e.g., a file that exists in both tags) keeps the source tag around, rather than be lost
+    try:
+        os.rmdir(src_dir)
+    except OSError:
+        pass
+
+    return num_moved, num_skipped
+
+
+def tag_move(ck_tag_dir, old_tag, new_tag):
+    """Renames tag 'old_tag' (and its subtags) to 'new_tag', which can be anywhere in the tag hierarchy
+       (e.g., 'accumulators/merkle' to 'merkle'). If 'new_tag' does not exist, this is a single (atomic) rename of the
+       tag directory. Otherwise, 'old_tag' is merged into it via tag_merge().
+       Returns the number of (moved, already present) tag links."""
+    old_dir = os.path.join(ck_tag_dir, old_tag)
+    new_dir = os.path.join(ck_tag_dir, new_tag)
+    if not os.path.isdir(old_dir):
+        raise ValueError("Tag '" + old_tag + "' does not exist")
+    if tag_dir_is_inside(ck_tag_dir, new_tag, old_tag):
+        raise ValueError("Cannot move tag '" + old_tag + "' inside itself")
+
+    if os.path.lexists(new_dir):
+        return tag_merge(ck_tag_dir, old_tag, new_tag)
+
+    os.makedirs(os.path.dirname(os.path.normpath(new_dir)), exist_ok=True)
+    os.rename(old_dir, new_dir)
+    retarget_relative_links(new_dir, old_dir)
+    return count_tag_links(new_dir), 0
+
+
+def retag_renamed_paper(ck_tag_dir, old_ck, new_ck, tags):
+    """Retargets the paper's symlinks in the specified tags after its CK changed from 'old_ck' to 'new_ck'.
+       Keeps each link's style (absolute or relative). Safe to call again on a paper that was (partly) retagged already."""
+    for tag in tags:
+        old_link = os.path.join(ck_tag_dir, tag, old_ck + ".pdf")
+        new_link = os.path.join(ck_tag_dir, tag, new_ck + ".pdf")
+        if not os.path.islink(old_link):
+            continue
+
+        if not os.path.lexists(new_link):
+            target = os.readlink(old_link)
+            os.symlink(os.path.join(os.path.dirname(target), new_ck + ".pdf"), new_link)
+        os.remove(old_link)
+
+
+def relink_tags(ck_tag_dir, ck_bib_dir, relative, dry_run=False):
+    """Points every '<CK>.pdf' tag symlink in TagDir at the PDF with the same name in 'ck_bib_dir', as an absolute or
+       relative link. Fixes links made absolute on another machine, or into an old BibDir, in a single pass over TagDir.
+       Returns (number of links rewritten, number already correct, list of links whose PDF is not in BibDir)."""
+    num_relinked, num_ok = 0, 0
+    missing = []
+
+    dirs = [ck_tag_dir]
+    while len(dirs) > 0:
+        tag_dir = dirs.pop()
+        with os.scandir(tag_dir) as it:
+            for dirent in it:
+                if dirent.is_dir(follow_symlinks=False):
+                    if not dirent.name.startswith('.git'):
+                        dirs.append(dirent.path)
+                    continue
+                if not dirent.is_symlink():
+                    continue
+                # NOTE(Alin): A '.<name>.relink' link is left behind only if an earlier run was interrupted
+                if dirent.name.startswith('.') and dirent.name.endswith('.relink'):
+                    # (It may already be gone, if it was reused when relinking '<name>' earlier in this scan.)
+                    if not dry_run and os.path.lexists(dirent.path):
+                        os.remove(dirent.path)
+                    continue
+                # Only '<CK>.pdf' links are tags; leave any other symlink the user put in TagDir alone
+                if not dirent.name.endswith('.pdf') or dirent.name.startswith('.'):
+                    continue
+
+                target = tag_link_target(ck_bib_dir, tag_dir, dirent.name, relative)
+                if not os.path.exists(os.path.join(ck_bib_dir, dirent.name)):
+                    missing.append(dirent.path)
+
+                if os.readlink(dirent.path) == target:
+                    num_ok += 1
+                    continue
+
+                if not dry_run:
+                    # Replace the link atomically, so it is never missing (e.g., while Dropbox is syncing TagDir)
+                    tmppath = os.path.join(tag_dir, '.' + dirent.name + '.relink')
+                    if os.path.lexists(tmppath):
+                        os.remove(tmppath)
+                    os.symlink(target, tmppath)
+                    os.replace(tmppath, dirent.path)
+                num_relinked += 1
+
+    return num_relinked, num_ok, sorted(missing)
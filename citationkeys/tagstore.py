@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import os
+import shutil
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .misc import cks_from_tags
+from .print import print_error
+from .tags import (
+    find_tagged_pdfs, get_all_tags, retag_renamed_paper, style_tags, tag_merge, tag_move, tag_paper, untag_paper
+)
+from .utils import string_to_file_atomic
+
+
+# Where tags are stored, as set by the TagStore option in the configuration file
+TAG_STORES = ['symlinks', 'manifest']
+
+# NOTE(Alin): The manifest is a single text file in TagDir that stores every (CK, tag) pair. Dropbox syncs it as
+# one small file (rather than a tree of thousands of symlinks) and we load all tags with a single read. It is an
+# append-only log of operations, one per line, with tab-separated fields:
+#
+#   +   <ck>   <tag>        tags the paper
+#   -   <ck>   <tag>        untags the paper (with an empty tag, removes all of the paper's tags)
+#   t   <tag>               creates a tag, even if no paper has it yet
+#   rm  <tag>               removes the tag and its subtags
+#   mv  <old>  <new>        moves (or merges) the tag and its subtags, like tag_move()
+#   ck  <old>  <new>        renames a paper in all its tags
+#
+# Appending is cheap but the log grows, so once it has many more lines than live (CK, tag) pairs, we compact it by
+# atomically rewriting it as just 't' and '+' lines. Appends hold a shared lock on the manifest and compaction an
+# exclusive one, under which it replays the manifest from disk, so it keeps what other 'ck' commands appended.
+TAG_MANIFEST_FILENAME = '.cktags'
+TAG_MANIFEST_MAGIC = 'CKTAGS1'
+
+# Compact the log once it has this many lines and more than twice as many lines as it would after compaction
+TAG_MANIFEST_COMPACT_MIN = 1024
+
+
+class TagStore(ABC):
+    """Where the library's tags are stored. Subclasses implement the actual storage."""
+
+    @abstractmethod
+    def tags(self):
+        """Returns the sorted list of all tags, including parent tags of hierarchical ones (e.g., 'sigs' for 'sigs/bls')."""
+        pass
+
+    @abstractmethod
+    def ck_tags(self):
+        """Returns a map of each tagged CK to its list of tags."""
+        pass
+
+    def has_tag(self, tag):
+        return tag in self.tags()
+
+    @abstractmethod
+    def cks_with_tags(self, tags, recursive=True):
+        """Returns the set of CKs with any of the given tags. If recursive is True, also includes CKs tagged with their subtags."""
+        pass
+
+    @abstractmethod
+    def tag(self, ck, tag):
+        """Tags the paper. Returns False if it already had the tag."""
+        pass
+
+    @abstractmethod
+    def untag(self, ck, tag=None):
+        """Untags the paper (if tag is None, removes all its tags). Returns False if there was nothing to untag."""
+        pass
+
+    @abstractmethod
+    def remove_tag(self, tag):
+        """Removes the tag and its subtags."""
+        pass
+
+    @abstractmethod
+    def move_tag(self, old_tag, new_tag):
+        """Like tag_move(), returns the number of (moved, already present) tag links."""
+        pass
+
+    @abstractmethod
+    def merge_tag(self, src_tag, dst_tag):
+        """Like tag_merge(), returns the number of (moved, already present) tag links."""
+        pass
+
+    @abstractmethod
+    def rename_ck(self, old_ck, new_ck, tags):
+        """Retags a paper whose CK changed from 'old_ck' to 'new_ck' in the specified tags. Safe to call again."""
+        pass
+
+    def reload(self):
+        """Re-reads the tags, if the store keeps them in memory (e.g., after another 'ck' process changed them)."""
+        pass
+
+
+class SymlinkTagStore(TagStore):
+    """Stores tags as a tree of directories in TagDir, with a symlink to each paper's PDF in each of its tags' directories."""
+
+    def __init__(self, ck_tag_dir, ck_bib_dir, verbosity=0, relative_links=False):
+        self.ck_tag_dir = ck_tag_dir
+        self.ck_bib_dir = ck_bib_dir
+        self.verbosity = verbosity
+        self.relative_links = relative_links
+
+    def tags(self):
+        return get_all_tags(self.ck_tag_dir)
+
+    def ck_tags(self):
+        return find_tagged_pdfs(self.ck_tag_dir, self.verbosity)
+
+    def has_tag(self, tag):
+        return os.path.isdir(os.path.join(self.ck_tag_dir, tag))
+
+    def cks_with_tags(self, tags, recursive=True):
+        return cks_from_tags(self.ck_tag_dir, tags, recursive)
+
+    def tag(self, ck, tag):
+        return tag_paper(self.ck_tag_dir, self.ck_bib_dir, ck, tag, self.relative_links)
+
+    def untag(self, ck, tag=None):
+        return untag_paper(self.ck_tag_dir, ck, tag)
+
+    def remove_tag(self, tag):
+        shutil.rmtree(os.path.join(self.ck_tag_dir, tag))
+
+    def move_tag(self, old_tag, new_tag):
+        return tag_move(self.ck_tag_dir, old_tag, new_tag)
+
+    def merge_tag(self, src_tag, dst_tag):
+        return tag_merge(self.ck_tag_dir, src_tag, dst_tag)
+
+    def rename_ck(self, old_ck, new_ck, tags):
+        retag_renamed_paper(self.ck_tag_dir, old_ck, new_ck, tags)
+
+
+def tag_parents(tag):
+    """Returns the parent tags of a hierarchical tag, e.g., ['a', 'a/b'] for 'a/b/c'."""
+    parts = tag.split('/')
+    return ['/'.join(parts[:i]) for i in range(1, len(parts))]
+
+
+def tag_normalize(tag):
+    tag = tag.strip('/')
+    if len(tag) == 0 or '\t' in tag or '\n' in tag:
+        raise ValueError("Invalid tag name: '" + tag + "'")
+    return tag
+
+
+def tag_is_inside(tag, other_tag):
+    return tag == other_tag or tag.startswith(other_tag + '/')
+
+
+class ManifestTagStore(TagStore):
+    """Stores tags in a single manifest file (see TAG_MANIFEST_FILENAME). If 'view_dir' is given, also keeps the
+       usual symlink tree up to date there, so the tags can still be browsed (e.g., with 'ck l' inside TagDir)."""
+
+    def __init__(self, manifest_path, ck_bib_dir, view_dir=None, relative_links=False):
+        self.path = manifest_path
+        self.ck_bib_dir = ck_bib_dir
+        self.view = SymlinkTagStore(view_dir, ck_bib_dir, 0, relative_links) if view_dir is not None else None
+
+        # Maps each tag to the set of CKs with that tag (the set is empty for tags without papers)
+        self._tags = {}
+        self._num_lines = 0
+        self._load()
+
+    def _load(self, text=None):
+        """Replays the manifest (or the given contents of it) into the in-memory tags."""
+        if text is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            except FileNotFoundError:
+                text = ''
+
+        # An empty manifest was just created by a compaction (see _locked()) that has not written it yet
+        lines = text.split('\n') if len(text) > 0 else [TAG_MANIFEST_MAGIC, '']
+
+        if lines[0] != TAG_MANIFEST_MAGIC:
+            raise ValueError("Not a ck tag manifest: " + self.path)
+
+        # NOTE: The last line has no '\n' after it, so it is either empty or was cut short (e.g., by a crash or a
+        # partial sync), in which case we ignore it
+        ops = [line.split('\t') for line in lines[1:-1] if len(line) > 0]
+
+        # Replay the log on the side and only then swap it in, so readers in other threads (e.g., in 'ck serve')
+        # never see half-loaded tags
+        tags = {}
+        for op in ops:
+            self._apply(op, tags)
+
+        self._tags = tags
+        self._num_lines = len(ops)
+
+    def reload(self):
+        self._load()
+
+    def _apply(self, op, tags=None):
+        """Applies an operation from the log to the in-memory tags (or to 'tags', if given). Returns what the
+           corresponding method returns."""
+        if tags is None:
+            tags = self._tags
+
+        if op[0] == '+':
+            ck, tag = op[1], op[2]
+            cks = tags.setdefault(tag, set())
+            if ck in cks:
+                return False
+            cks.add(ck)
+            return True
+        elif op[0] == '-':
+            ck, tag = op[1], op[2]
+            untagged = False
+            for t, cks in tags.items():
+                if (len(tag) == 0 or t == tag) and ck in cks:
+                    cks.remove(ck)
+                    untagged = True
+            return untagged
+        elif op[0] == 't':
+            tags.setdefault(op[1], set())
+        elif op[0] == 'rm':
+            for t in [t for t in tags if tag_is_inside(t, op[1])]:
+                del tags[t]
+        elif op[0] == 'mv':
+            old_tag, new_tag = op[1], op[2]
+            num_moved, num_skipped = 0, 0
+            for t in sorted(t for t in tags if tag_is_inside(t, old_tag)):
+                cks = tags.pop(t)
+                dst = tags.setdefault(new_tag + t[len(old_tag):], set())
+                num_skipped += len(cks & dst)
+                num_moved += len(cks - dst)
+                dst.update(cks)
+            return num_moved, num_skipped
+        elif op[0] == 'ck':
+            old_ck, new_ck = op[1], op[2]
+            for cks in tags.values():
+                if old_ck in cks:
+                    cks.remove(old_ck)
+                    cks.add(new_ck)
+        else:
+            raise ValueError("Unknown operation in ck tag manifest " + self.path + ": " + '\t'.join(op))
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Opens the manifest (creating it empty, if needed) for reading and appending, and locks it. Compaction
+           replaces the file, so if it did while we waited for the lock, locks the new file instead."""
+        while True:
+            f = open(self.path, 'a+', encoding='utf-8')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    replaced = os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    replaced = True
+                if not replaced:
+                    yield f
+                    return
+            finally:
+                f.close()
+
+    def _log(self, *op):
+        """Applies the operation and appends it to the manifest."""
+        if not os.path.exists(self.path):
+            return self.compact([op])[0]
+
+        result = self._apply(op)
+
+        # NOTE(Alin): Small appends to a file opened with O_APPEND are atomic, so concurrent 'ck' commands do not
+        # clobber each other's operations.
+        with self._locked(exclusive=False) as f:
+            if f.tell() == 0:
+                f.write(TAG_MANIFEST_MAGIC + '\n')
+            f.write('\t'.join(op) + '\n')
+        self._num_lines += 1
+
+        num_live = len(self._tags) + sum(len(cks) for cks in self._tags.values())
+        if self._num_lines >= TAG_MANIFEST_COMPACT_MIN and self._num_lines > 2 * num_live:
+            self.compact()
+
+        return result
+
+    def compact(self, ops=()):
+        """Atomically rewrites the manifest as one line per tag and per (CK, tag) pair, after applying the operations
+           in 'ops' to it. Returns what each of them returned (see _apply())."""
+        with self._locked(exclusive=True) as f:
+            # NOTE(Alin): Other 'ck' commands (or Dropbox) may have changed the manifest since we loaded it, so start
+            # over from what is on disk now, or we would lose their operations
+            f.seek(0)
+            self._load(f.read())
+            results = [self._apply(op) for op in ops]
+
+            lines = [TAG_MANIFEST_MAGIC]
+            for tag in sorted(self._tags):
+                lines.append('t\t' + tag)
+                for ck in sorted(self._tags[tag]):
+                    lines.append('+\t' + ck + '\t' + tag)
+
+            string_to_file_atomic('\n'.join(lines) + '\n', self.path)
+            self._num_lines = len(lines) - 1
+
+        return results
+
+    def tags(self):
+        tags = set()
+        for tag in self._tags:
+            tags.add(tag)
+            tags.update(tag_parents(tag))
+        return sorted(tags)
+
+    def ck_tags(self):
+        ck_tags = {}
+        for tag in sorted(self._tags):
+            for ck in self._tags[tag]:
+                ck_tags.setdefault(ck, []).append(tag)
+        return ck_tags
+
+    def has_tag(self, tag):
+        tag = tag.strip('/')
+        return any(tag_is_inside(t, tag) for t in self._tags)
+
+    def cks_with_tags(self, tags, recursive=True):
+        cks = set()
+        for tag in tags:
+            tag = tag.strip('/')
+            if not self.has_tag(tag):
+                print_error(style_tags([tag]) + " does not exist as a tag")
+            for t, tcks in self._tags.items():
+                if t == tag or (recursive and tag_is_inside(t, tag)):
+                    cks.update(tcks)
+        return cks
+
+    def tag(self, ck, tag):
+        tag = tag_normalize(tag)
+        if self.view is not None:
+            self.view.tag(ck, tag)
+        if ck in self._tags.get(tag, set()):
+            return False
+        return self._log('+', ck, tag)
+
+    def untag(self, ck, tag=None):
+        if self.view is not None:
+            self.view.untag(ck, tag)
+        if tag is None:
+            tag = ''
+        else:
+            tag = tag_normalize(tag)
+
+        if not any(ck in cks for t, cks in self._tags.items() if len(tag) == 0 or t == tag):
+            return False
+        return self._log('-', ck, tag)
+
+    def add_tag(self, tag):
+        tag = tag_normalize(tag)
+        if tag not in self._tags:
+            self._log('t', tag)
+
+    def remove_tag(self, tag):
+        tag = tag_normalize(tag)
+        if self.view is not None and os.path.isdir(os.path.join(self.view.ck_tag_dir, tag)):
+            self.view.remove_tag(tag)
+        self._log('rm', tag)
+
+    def move_tag(self, old_tag, new_tag):
+        old_tag, new_tag = tag_normalize(old_tag), tag_normalize(new_tag)
+        if not self.has_tag(old_tag):
+            raise ValueError("Tag '" + old_tag + "' does not exist")
+        if tag_is_inside(new_tag, old_tag):
+            raise ValueError("Cannot move tag '" + old_tag + "' inside itself")
+
+        if self.view is not None and os.path.isdir(os.path.join(self.view.ck_tag_dir, old_tag)):
+            self.view.move_tag(old_tag, new_tag)
+        return self._log('mv', old_tag, new_tag)
+
+    def merge_tag(self, src_tag, dst_tag):
+        src_tag, dst_tag = tag_normalize(src_tag), tag_normalize(dst_tag)
+        if not self.has_tag(src_tag):
+            raise ValueError("Tag '" + src_tag + "' does not exist")
+        if tag_is_inside(dst_tag, src_tag):
+            raise ValueError("Cannot merge tag '" + src_tag + "' into its own subtag '" + dst_tag + "'")
+
+        if self.view is not None and os.path.isdir(os.path.join(self.view.ck_tag_dir, src_tag)):
+            self.view.merge_tag(src_tag, dst_tag)
+        return self._log('mv', src_tag, dst_tag)
+
+    def rename_ck(self, old_ck, new_ck, tags):
+        if self.view is not None:
+            self.view.rename_ck(old_ck, new_ck, tags)
+        if any(old_ck in cks for cks in self._tags.values()):
+            self._log('ck', old_ck, new_ck)
+
+    def sync_view(self):
+        """Makes the symlink view match the manifest: adds missing symlinks and removes the ones for papers no longer
+           tagged. Returns the number of (added, removed) symlinks."""
+        if self.view is None:
+            return 0, 0
+
+        num_added, num_removed = 0, 0
+        wanted = set((ck, tag) for tag, cks in self._tags.items() for ck in cks)
+
+        for ck, tags in self.view.ck_tags().items():
+            for tag in tags:
+                if (ck, tag) in wanted:
+                    wanted.remove((ck, tag))
+                else:
+                    self.view.untag(ck, tag)
+                    num_removed += 1
+
+        for ck, tag in sorted(wanted):
+            if self.view.tag(ck, tag):
+                num_added += 1
+        for tag in self._tags:
+            os.makedirs(os.path.join(self.view.ck_tag_dir, tag), exist_ok=True)
+
+        return num_added, num_removed
+
+
+def tag_manifest_path(ck_tag_dir):
+    return os.path.join(ck_tag_dir, TAG_MANIFEST_FILENAME)
+
+
+def tag_store_open(kind, ck_tag_dir, ck_bib_dir, symlink_view=False, verbosity=0, relative_links=False):
+    """Returns the TagStore of the given kind (one of TAG_STORES) for the library. For the 'manifest' store, the
+       manifest lives in TagDir and, if 'symlink_view' is set, a symlink view of the tags is kept in TagDir too.
+       If 'relative_links' is set, new symlinks point to PDFs via relative paths (see tag_link_target())."""
+    if kind == 'symlinks':
+        return SymlinkTagStore(ck_tag_dir, ck_bib_dir, verbosity, relative_links)
+    elif kind == 'manifest':
+        view_dir = ck_tag_dir if symlink_view else None
+        return ManifestTagStore(tag_manifest_path(ck_tag_dir), ck_bib_dir, view_dir, relative_links)
+    else:
+        raise ValueError("Unknown TagStore '" + kind + "' (expected one of: " + ', '.join(TAG_STORES) + ")")
+
+
+def tag_store_migrate(src, dst):
+    """Copies all tags (including ones without papers) from TagStore 'src' to TagStore 'dst'.
+       Returns the number of (CK, tag) pairs copied."""
+    num_copied = 0
+
+    if isinstance(dst, ManifestTagStore):
+        # Build the whole manifest in memory and write it once, rather than append one line per (CK, tag) pair
+        ops = [('t', tag) for tag in src.tags()]
+        ops += [('+', ck, tag) for ck, tags in src.ck_tags().items() for tag in tags]
+        num_copied = sum(1 for op, copied in zip(ops, dst.compact(ops)) if op[0] == '+' and copied)
+        dst.sync_view()
+    else:
+        for tag in src.tags():
+            os.makedirs(os.path.join(dst.ck_tag_dir, tag), exist_ok=True)
+        for ck, tags in sorted(src.ck_tags().items()):
+            for tag in tags:
+                if dst.tag(ck, tag):
+                    num_copied += 1
+
+    return num_copied
@@ -2,6 +2,7 @@
 
 # NOTE: Alphabetical order please
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from fake_useragent import UserAgent
@@ -18,14 +19,90 @@ import bs4
 import click
 import configparser
 import datetime
+import email.utils
+import http.client
 import os
 import pyperclip
+import random
 import smtplib
 import sys
 import tempfile
+import threading
+import time
 import urllib
 
 
+# Network policy for get_url(), shared by all URL handlers during one 'ck' command.
+# NOTE(Alin): Handlers have a fixed signature and do not get the policy as an argument, so we set it once via
+# set_download_policy() after reading ck.config.
+download_policy = {
+    'connect_timeout': 10.0,    # seconds to wait for the connection to be established
+    'read_timeout':    30.0,    # seconds to wait for each read from the connection
+    'retries':         3,       # how many times to retry after a transient error
+    'backoff':         1.0,     # base delay (in seconds) for exponential backoff
+    'deadline':        None,    # time.monotonic() value after which we stop downloading, or None
+}
+
+# HTTP error codes that are likely to go away if we retry a bit later
+RETRIABLE_HTTP_CODES = [ 429, 500, 502, 503, 504 ]
+
+# The longest we wait when a server asks us to retry later (via 'Retry-After'). If it asks for longer (e.g., a day), we give up.
+RETRY_AFTER_MAX = 60
+
+
+def set_download_policy(connect_timeout, read_timeout, retries, backoff, deadline_secs):
+    """Sets the timeouts and retries for all downloads. A 'deadline_secs' of None or 0 means there is no overall deadline."""
+    download_policy['connect_timeout'] = connect_timeout
+    download_policy['read_timeout']    = read_timeout
+    download_policy['retries']         = retries
+    download_policy['backoff']         = backoff
+    download_policy['deadline']        = time.monotonic() + deadline_secs if deadline_secs else None
+
+
+def download_time_left(timeout):
+    """Returns the given timeout, capped to the time left until the download deadline. Raises TimeoutError if the deadline passed."""
+    deadline = download_policy['deadline']
+    if deadline is None:
+        return timeout
+
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("Download deadline exceeded")
+
+    return min(timeout, left)
+
+
+def parse_retry_after(value):
+    """Parses the value of a 'Retry-After' HTTP header (either seconds or an HTTP date) into a number of seconds, or None."""
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (when - datetime.datetime.now(when.tzinfo)).total_seconds())
+
+
+def backoff_delay(attempt):
+    """Returns a random delay in [0, backoff * 2^attempt) (i.e., exponential backoff with "full jitter")."""
+    return random.uniform(0, download_policy['backoff'] * (2 ** attempt))
+
+
+def is_transient_url_error(err):
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code in RETRIABLE_HTTP_CODES
+    if isinstance(err, urllib.error.URLError):
+        return isinstance(err.reason, (TimeoutError, ConnectionError))
+
+    return isinstance(err, (TimeoutError, ConnectionError, http.client.IncompleteRead))
+
+
 def get_url(opener, url, verbosity, user_agent, restrict_content_type=None, extra_headers={}):
     # TODO(Alin): handle 403 error and display HTML returned
     if verbosity > 0:
@@ -34,37 +111,41 @@ def get_url(opener, url, verbosity, user_agent, restrict_content_type=None, extr
     if user_agent is None:
         raise ValueError("Please specify a user agent")
 
-    try:
-        extra_headers['User-Agent'] = user_agent
-        req = Request(url, headers=extra_headers)
-        response = opener.open(req)
-        content_type = response.getheader("Content-Type")
-        # click.echo("Content-Type: " + str(content_type))
-        # throw if bad content type
-        found = False
-        if restrict_content_type is not None:
-            # we allow user to either pass a string, or a list of strings for this
-            if not isinstance(restrict_content_type, list):
-                restrict_content_type = [restrict_content_type]
-
-            for r in restrict_content_type:
-                if content_type.startswith(r):
-                    found = True
-
-            if not found:
-                raise RuntimeError("Expected this to be URL to " + str(
-                    restrict_content_type) + " but got '" + content_type + "' Content-Type")
-    except urllib.error.HTTPError as err:
-        if verbosity > 0:
-            print("HTTP Error Code: ", err.code)
-            print("HTTP Error Reason: ", err.reason)
-            print("HTTP Error Headers: ", err.headers)
-        raise
+    # NOTE: Copy the headers, since the default argument is shared across calls
+    headers = dict(extra_headers)
+    headers['User-Agent'] = user_agent
 
-    if response.getcode() != 200:
-        raise RuntimeError("ERROR: Got " + str(response.getcode()) + " response code")
+    retries = download_policy['retries']
+    attempt = 0
+    while True:
+        try:
+            html = get_url_once(opener, url, verbosity, headers, restrict_content_type)
+            break
+        except Exception as err:
+            if isinstance(err, urllib.error.HTTPError) and verbosity > 0:
+                print("HTTP Error Code: ", err.code)
+                print("HTTP Error Reason: ", err.reason)
+                print("HTTP Error Headers: ", err.headers)
+
+            if attempt >= retries or not is_transient_url_error(err):
+                raise
+
+            delay = None
+            if isinstance(err, urllib.error.HTTPError):
+                delay = parse_retry_after(err.headers.get('Retry-After') if err.headers else None)
+            if delay is not None and delay > RETRY_AFTER_MAX:
+                raise TimeoutError("Server asked to retry " + url + " in " + str(int(delay)) + " seconds, which is too long to wait") from err
+            if delay is None:
+                delay = backoff_delay(attempt)
 
-    html = response.read()
+            # Do not sleep past the deadline: if we cannot retry in time, we might as well fail now
+            if download_time_left(delay) < delay:
+                raise TimeoutError("Download deadline exceeded while waiting to retry " + url) from err
+
+            attempt += 1
+            if verbosity > 0:
+                print("Transient error (%s), retrying in %.1f seconds (attempt %d of %d)..." % (err, delay, attempt, retries))
+            time.sleep(delay)
 
     if verbosity > 2:
         print("Downloaded:")
@@ -76,6 +157,40 @@ def get_url(opener, url, verbosity, user_agent, restrict_content_type=None, extr
     return html
 
 
+def get_url_once(opener, url, verbosity, headers, restrict_content_type):
+    req = Request(url, headers=headers)
+    response = opener.open(req, timeout=download_time_left(download_policy['connect_timeout']))
+
+    # NOTE(Alin): urllib only has a single socket timeout, which we used above for connecting. Now that we are
+    # connected, we switch the socket to the read timeout, if the response exposes it (http.client's responses do, via
+    # a private attribute, so we look for it carefully and otherwise keep the connect timeout).
+    sock = getattr(getattr(getattr(response, 'fp', None), 'raw', None), '_sock', None)
+    if callable(getattr(sock, 'settimeout', None)):
+        sock.settimeout(download_time_left(download_policy['read_timeout']))
+
+    content_type = response.getheader("Content-Type")
+    # click.echo("Content-Type: " + str(content_type))
+    # throw if bad content type
+    found = False
+    if restrict_content_type is not None:
+        # we allow user to either pass a string, or a list of strings for this
+        if not isinstance(restrict_content_type, list):
+            restrict_content_type = [restrict_content_type]
+
+        for r in restrict_content_type:
+            if content_type.startswith(r):
+                found = True
+
+        if not found:
+            raise RuntimeError("Expected this to be URL to " + str(
+                restrict_content_type) + " but got '" + content_type + "' Content-Type")
+
+    if response.getcode() != 200:
+        raise RuntimeError("ERROR: Got " + str(response.getcode()) + " response code")
+
+    return response.read()
+
+
 def download_bib(opener, user_agent, biburl, verbosity):
     if biburl is not None:
         bib_data = get_url(opener, biburl, verbosity, user_agent)
@@ -139,6 +254,57 @@ def handle_url(url, handlers, opener, user_agent, verbosity, bib_downl, pdf_down
         return False, None, None
 
 
+class DomainRateLimiter(object):
+    """Spaces out requests to the same domain by at least 'min_interval' seconds, even across threads."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, domain):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(domain, now))
+            self.next_slot[domain] = slot + self.min_interval
+
+        if slot > now:
+            time.sleep(slot - now)
+
+
+# Re-downloads the BibTeX for many papers concurrently, given a map of CK to the paper's URL.
+# Returns a map of CK to a tuple <bib_data, error>, where exactly one of the two is None.
+#
+# NOTE(Alin): Requests to the same website are rate-limited via 'min_interval', so we don't get banned for hammering it.
+def refresh_bibtex_concurrently(urls, handlers, opener, user_agent, verbosity, jobs, min_interval, on_done=None):
+    rate_limiter = DomainRateLimiter(min_interval)
+
+    def refresh_one(url):
+        rate_limiter.wait(urlparse(url).netloc)
+        is_handled, bib_data, _ = handle_url(url, handlers, opener, user_agent, verbosity, True, False)
+        if not is_handled:
+            raise RuntimeError("No handler for URL " + url)
+        if bib_data is None:
+            raise RuntimeError("Handler returned no BibTeX for URL " + url)
+        return bib_data
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = { executor.submit(refresh_one, url): ck for ck, url in urls.items() }
+        for future in as_completed(futures):
+            ck = futures[future]
+            try:
+                results[ck] = (future.result(), None)
+            # NOTE: Some handlers call sys.exit() when scraping fails, so we catch SystemExit too
+            except (Exception, SystemExit) as e:
+                results[ck] = (None, e)
+
+            if on_done is not None:
+                on_done(ck, results[ck])
+
+    return results
+
+
 def dlacm_handler(opener, soup, parsed_url, parser, user_agent, verbosity, bib_downl, pdf_downl):
     path = parsed_url.path.split('/')[2:]
     if len(path) > 1:
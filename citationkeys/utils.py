@@ -1,3 +1,5 @@
+import os
+import tempfile
 # Use gnureadline on macOS for proper tab completion (libedit has issues)
 try:
     import gnureadline as readline
@@ -11,3 +13,32 @@ def readline_enable_tab_autocompletion():
         readline.parse_and_bind("bind '\t' rl_complete")
     else:
         readline.parse_and_bind('tab: complete')
+
+
+def bytes_to_file_atomic(data, path):
+    """Writes the data to a temporary file next to 'path' and then renames it over 'path', so that readers
+       (and Dropbox) never see a half-written file."""
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # NOTE: mkstemp() creates the file as 0600, but we want the permissions a regular open() would have given us
+        if os.path.exists(path):
+            os.chmod(tmppath, os.stat(path).st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmppath, 0o666 & ~umask)
+
+        os.replace(tmppath, path)
+    except:
+        os.remove(tmppath)
+        raise
+
+
+def string_to_file_atomic(string, path):
+    bytes_to_file_atomic(string.encode('utf-8'), path)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import json
+import os
+import re
+import struct
+
+import click
+
+from .cache import json_cache_load
+from .fuzzy import fuzzy_normalize
+from .suggest import PDF_TEXT_DIRNAME
+from .utils import bytes_to_file_atomic
+
+# numpy is optional: without it, 'ck tag' only suggests the tags whose words appear in the paper's PDF
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# NOTE(Alin): The vector index has a TF-IDF vector for every paper in the library, made from the words in its title,
+# abstract and venue, as well as in its PDF's text, if 'ck tag' already extracted it (see suggest.py). Papers with
+# similar vectors are about similar things, so the tags of a paper's nearest tagged neighbors are good suggestions for it.
+# It lives in CacheDir and is updated incrementally: only papers whose .bib file or PDF text changed are re-read.
+#
+# Layout:
+#   VECTORS_MAGIC | <header length, as a little-endian uint64> | <JSON header> | <uint32 arrays, in the machine's byte order>
+#
+# The JSON header has the 'built_ns' of the snapshot the index was built from, the list of 'cks', their 'fingerprints'
+# (i.e., [<.bib mtime_ns>, <.bib size>, <PDF text mtime_ns, or 0>]) and the list of 'terms', as well as the [offset, length]
+# in the uint32 arrays of the 'indptr', 'indices' and 'counts' arrays of the (CSR) matrix of each paper's term counts.
+VECTORS_MAGIC = b'CKVECS1\n'
+VECTORS_INDEX_FILENAME = 'vectors.index'
+
+# How many of a paper's most frequent words (besides those in its title, abstract and venue) we keep from its PDF
+# text, which bounds the size of the index without losing what the paper is about
+VECTORS_MAX_PDF_TERMS = 200
+
+# How many of a paper's most similar tagged papers 'ck tag' takes suggestions from
+VECTORS_NEIGHBORS = 10
+
+# Papers less similar than this are not considered neighbors at all
+VECTORS_MIN_SIMILARITY = 0.05
+
+VECTORS_WORD_RE = re.compile(r'[a-z][a-z0-9]+')
+VECTORS_MIN_WORD_LEN = 3
+VECTORS_MAX_WORD_LEN = 30
+
+BIBTEX_FIELD_START_RE = re.compile(r'[,\s](\w+)\s*=\s*')
+BIBTEX_BRACE_OR_QUOTE_RE = re.compile(r'[{}"]')
+
+STOP_WORDS = frozenset("""
+    about above after again against all also although among and another any are around because been before being below
+    between both but can cannot could did does doing done down during each either else even every few for from further
+    had has have having her here hers him his how however into its itself just less many may might more most much must
+    near neither new nor not now off once one only other our ours out over own paper per rather same several she should
+    show shows shown since some such than that the their them then there these they this those through thus too two under
+    until upon using very via was way well were what when where whether which while who whom whose why will with within
+    without would yet you your
+""".split())
+
+
+def bibtex_field(bibtex, name):
+    """Returns the value of the field (e.g., 'abstract') in the BibTeX, without its outer braces or quotes, or None
+       if it has none. Much faster than parsing the whole BibTeX, which matters when vectorizing the whole library."""
+    for m in BIBTEX_FIELD_START_RE.finditer(bibtex):
+        if m.group(1).lower() != name:
+            continue
+
+        start = m.end()
+        if start >= len(bibtex) or bibtex[start] not in '{"':
+            # e.g., 'year = 2010' or a @string macro
+            end = bibtex.find(',', start)
+            return bibtex[start:end if end >= 0 else len(bibtex)].strip().rstrip('}').strip()
+
+        depth = 0
+        for b in BIBTEX_BRACE_OR_QUOTE_RE.finditer(bibtex, start):
+            c = b.group(0)
+            if c == '{':
+                depth += 1
+            elif c == '}':
+                depth -= 1
+            # A quoted value ends at the first quote outside of braces
+            if (depth == 0 and b.start() > start) and (c == '}' if bibtex[start] == '{' else c == '"'):
+                return bibtex[start + 1:b.start()]
+        return bibtex[start + 1:]
+
+    return None
+
+
+def vector_terms(text):
+    """Returns the words in the text we build vectors from: lowercased, without accents, short or very long words, and stop words."""
+    return [w for w in VECTORS_WORD_RE.findall(fuzzy_normalize(text))
+        if VECTORS_MIN_WORD_LEN <= len(w) <= VECTORS_MAX_WORD_LEN and w not in STOP_WORDS]
+
+
+def paper_term_counts(snapshot, ck, pdf_text=None):
+    """Returns a dict from each word of the paper to how many times it appears in its title, abstract, venue and PDF text."""
+    counts = {}
+    entry = snapshot.get_paper_fields(ck)
+    if entry is not None:
+        _, title, _, _, _, venue = entry[1]
+        abstract = bibtex_field(snapshot.get_bibtex(ck), 'abstract')
+        for text in (title, abstract, venue):
+            for term in vector_terms(text or ''):
+                counts[term] = counts.get(term, 0) + 1
+
+    if pdf_text is not None:
+        pdf_counts = {}
+        for term in vector_terms(pdf_text):
+            pdf_counts[term] = pdf_counts.get(term, 0) + 1
+        for term in sorted(pdf_counts, key=lambda t: (-pdf_counts[t], t))[:VECTORS_MAX_PDF_TERMS]:
+            counts[term] = counts.get(term, 0) + pdf_counts[term]
+
+    return counts
+
+
+class VectorIndex(object):
+    """The TF-IDF vectors of the papers in the library, as rows of a sparse matrix."""
+
+    def __init__(self, built_ns, cks, fingerprints, terms, indptr, indices, counts):
+        self.built_ns = built_ns
+        self.cks = cks
+        self.fingerprints = fingerprints
+        self.terms = terms
+        self._rows = dict((ck, i) for i, ck in enumerate(cks))
+        self._term_ids = dict((t, i) for i, t in enumerate(terms))
+        self._indptr = np.asarray(indptr, dtype=np.int64)
+        self._indices = np.asarray(indices, dtype=np.int64)
+        self._counts = np.asarray(counts, dtype=np.uint32)
+
+        # Each row is weighted by (1 + log(tf)) * idf, and then normalized, so that cosine similarity is a dot product
+        df = np.bincount(self._indices, minlength=len(terms))
+        self._idf = (np.log((1 + len(cks)) / (1 + df)) + 1).astype(np.float32)
+        self._row_ids = np.repeat(np.arange(len(cks)), np.diff(self._indptr))
+        weights = (1 + np.log(np.maximum(self._counts, 1))).astype(np.float32) * self._idf[self._indices]
+        norms = np.sqrt(np.bincount(self._row_ids, weights=weights * weights, minlength=len(cks)))
+        self._weights = (weights / np.maximum(norms, 1e-12)[self._row_ids]).astype(np.float32)
+
+    def __len__(self):
+        return len(self.cks)
+
+    def __contains__(self, ck):
+        return ck in self._rows
+
+    def pdf_text_changed(self, ck, ck_cache_dir):
+        """Returns True if the paper's PDF text was cached (or re-cached) after this index was built from it."""
+        try:
+            mtime = os.stat(os.path.join(ck_cache_dir, PDF_TEXT_DIRNAME, ck + '.json')).st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        return ck in self._rows and self.fingerprints[self._rows[ck]][2] != mtime
+
+    def row(self, ck):
+        """Returns the paper's term counts, as a dict from each word to its count."""
+        i = self._rows[ck]
+        lo, hi = self._indptr[i], self._indptr[i + 1]
+        return dict((self.terms[t], int(c)) for t, c in zip(self._indices[lo:hi], self._counts[lo:hi]))
+
+    def vector(self, ck):
+        """Returns the paper's (dense) TF-IDF vector."""
+        i = self._rows[ck]
+        lo, hi = self._indptr[i], self._indptr[i + 1]
+        q = np.zeros(len(self.terms), dtype=np.float32)
+        q[self._indices[lo:hi]] = self._weights[lo:hi]
+        return q
+
+    def text_vector(self, text):
+        """Returns the (dense) TF-IDF vector of some text (e.g., a paper not in the library). Words no paper has are ignored."""
+        q = np.zeros(len(self.terms), dtype=np.float32)
+        for term in vector_terms(text):
+            t = self._term_ids.get(term)
+            if t is not None:
+                q[t] += 1
+        nz = q > 0
+        q[nz] = (1 + np.log(q[nz])) * self._idf[nz]
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def similarities(self, q):
+        """Returns the cosine similarity of the vector to every paper's, in the order of 'cks'."""
+        return np.bincount(self._row_ids, weights=self._weights * q[self._indices], minlength=len(self.cks))
+
+    def nearest(self, q, limit, cks=None, exclude=()):
+        """Returns up to 'limit' (CK, similarity) pairs for the papers most similar to the vector, most similar first.
+           If 'cks' is given, only considers those papers."""
+        sims = self.similarities(q)
+        if cks is not None:
+            mask = np.zeros(len(self.cks), dtype=bool)
+            mask[[self._rows[ck] for ck in cks if ck in self._rows]] = True
+            sims = np.where(mask, sims, 0)
+        for ck in exclude:
+            if ck in self._rows:
+                sims[self._rows[ck]] = 0
+
+        top = np.flatnonzero(sims >= VECTORS_MIN_SIMILARITY)
+        if len(top) > limit:
+            top = top[np.argpartition(-sims[top], limit - 1)[:limit]]
+        top = sorted(top, key=lambda i: (-sims[i], self.cks[i]))
+        return [(self.cks[i], float(sims[i])) for i in top]
+
+    def suggest_tags(self, ck, ck_tags, limit, neighbors=VECTORS_NEIGHBORS):
+        """Returns up to 'limit' tags for the paper, best first: those of its most similar tagged papers, each scored
+           by the total similarity of the neighbors that have it."""
+        if ck not in self._rows:
+            return []
+
+        scores = {}
+        for other, sim in self.nearest(self.vector(ck), neighbors, cks=ck_tags.keys(), exclude=(ck,)):
+            for tag in ck_tags[other]:
+                scores[tag] = scores.get(tag, 0) + sim
+        return sorted(scores, key=lambda tag: (-scores[tag], tag))[:limit]
+
+
+def vectors_index_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, VECTORS_INDEX_FILENAME)
+
+
+def vectors_index_save(index, path):
+    header = { 'built_ns': index.built_ns, 'cks': index.cks, 'fingerprints': index.fingerprints, 'terms': index.terms }
+    arrays = [a.astype(np.uint32) for a in (index._indptr, index._indices, index._counts)]
+
+    offset = 0
+    for name, a in zip(('indptr', 'indices', 'counts'), arrays):
+        header[name] = [offset, len(a)]
+        offset += len(a)
+
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    bytes_to_file_atomic(b''.join([VECTORS_MAGIC, struct.pack('<Q', len(header)), header] + [a.tobytes() for a in arrays]), path)
+
+
+def vectors_index_load(path):
+    """Returns the VectorIndex saved at 'path', or None if it is missing or corrupted (or numpy is not installed)."""
+    if np is None:
+        return None
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        hdr_len = len(VECTORS_MAGIC) + 8
+        if data[:len(VECTORS_MAGIC)] != VECTORS_MAGIC:
+            return None
+
+        (header_len,) = struct.unpack('<Q', data[len(VECTORS_MAGIC):hdr_len])
+        header = json.loads(data[hdr_len:hdr_len + header_len].decode('utf-8'))
+
+        uints = np.frombuffer(data, dtype=np.uint32, offset=hdr_len + header_len)
+        arrays = []
+        for name in ('indptr', 'indices', 'counts'):
+            offset, length = header[name]
+            if offset + length > len(uints):
+                return None
+            arrays.append(uints[offset:offset + length])
+
+        indptr = arrays[0]
+        if len(indptr) != len(header['cks']) + 1 or indptr[-1] != len(arrays[1]) or len(arrays[1]) != len(arrays[2]):
+            return None
+
+        return VectorIndex(header['built_ns'], header['cks'], header['fingerprints'], header['terms'], *arrays)
+    except (OSError, KeyError, TypeError, ValueError, struct.error):
+        return None
+
+
+def pdf_text_mtimes(ck_cache_dir):
+    """Returns a dict from each CK whose PDF text is cached to the mtime_ns of its cache file."""
+    mtimes = {}
+    try:
+        with os.scandir(os.path.join(ck_cache_dir, PDF_TEXT_DIRNAME)) as it:
+            for dirent in it:
+                if dirent.name.endswith('.json'):
+                    mtimes[dirent.name[:-len('.json')]] = dirent.stat().st_mtime_ns
+    except FileNotFoundError:
+        pass
+    return mtimes
+
+
+def vectors_index_update(ck_cache_dir, snapshot, verbosity=0):
+    """Returns the VectorIndex of the papers in the LibrarySnapshot, updating the one in CacheDir first if any paper's
+       .bib file or PDF text changed. Returns None if numpy is not installed."""
+    if np is None:
+        return None
+
+    path = vectors_index_path(ck_cache_dir)
+    old = vectors_index_load(path)
+    pdf_mtimes = pdf_text_mtimes(ck_cache_dir)
+
+    cks = snapshot.cks()
+    fingerprints = [list(snapshot.fingerprint(ck)) + [pdf_mtimes.get(ck, 0)] for ck in cks]
+    if old is not None and old.cks == cks and old.fingerprints == fingerprints:
+        return old
+
+    # NOTE(Alin): New words are appended to the old index's terms, so the rows of unchanged papers are copied as is.
+    terms = list(old.terms) if old is not None else []
+    term_ids = dict((t, i) for i, t in enumerate(terms))
+    indices = []
+    counts = []
+    num_read = 0
+
+    for ck, fp in zip(cks, fingerprints):
+        if old is not None and ck in old and old.fingerprints[old._rows[ck]] == fp:
+            i = old._rows[ck]
+            lo, hi = old._indptr[i], old._indptr[i + 1]
+            indices.append(old._indices[lo:hi])
+            counts.append(old._counts[lo:hi])
+            continue
+
+        text = None
+        if fp[2] != 0:
+            text = json_cache_load(os.path.join(ck_cache_dir, PDF_TEXT_DIRNAME, ck + '.json')).get('text')
+        row = paper_term_counts(snapshot, ck, text)
+        num_read += 1
+
+        for term in row:
+            if term not in term_ids:
+                term_ids[term] = len(terms)
+                terms.append(term)
+        indices.append(np.array([term_ids[t] for t in row], dtype=np.int64))
+        counts.append(np.array(list(row.values()), dtype=np.uint32))
+
+    indptr = np.concatenate([[0], np.cumsum([len(a) for a in indices])]).astype(np.int64)
+    indices = np.concatenate(indices).astype(np.int64) if len(indices) > 0 else np.zeros(0, dtype=np.int64)
+    counts = np.concatenate(counts) if len(counts) > 0 else np.zeros(0, dtype=np.uint32)
+
+    # Forget the words of papers that were removed (or changed)
+    used = np.unique(indices)
+    if len(used) < len(terms):
+        terms = [terms[t] for t in used]
+        indices = np.searchsorted(used, indices)
+
+    index = VectorIndex(snapshot.built_ns, cks, fingerprints, terms, indptr, indices, counts)
+    vectors_index_save(index, path)
+    if verbosity > 0:
+        click.echo("Updated vector index (" + str(num_read) + " of " + str(len(cks)) + " papers re-read)")
+    return index
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+# NOTE: Alphabetical order please
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .cache import json_cache_load, json_cache_save
+
+
+# NOTE(Alin): 'ck watch' keeps the library's indexes (the snapshot of all .bib files and the map of CKs to their tags)
+# up to date as files change, including when Dropbox syncs changes from other machines. While it runs, it keeps its
+# PID in WATCH_PID_FILENAME, which tells other 'ck' commands they can use the indexes as they are, without first
+# checking BibDir and TagDir for changes. They lag behind the files by at most the watcher's debounce delay.
+# The watcher also holds a lock on that file, which the OS releases when it exits (even on a crash or SIGKILL), so a
+# PID file left behind (whose PID may since have been reused by another process) is never mistaken for a watcher.
+WATCH_PID_FILENAME = 'watch.pid'
+
+# The CK to tags map of the symlink tag store, as of the watcher's last update
+TAG_INDEX_FILENAME = 'tag-index.json'
+
+# Returned by the watchers when they lost track of what changed, in which case everything must be rescanned
+RESCAN = None
+
+# From <sys/inotify.h>
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_MOVE_SELF    = 0x00000800
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ONLYDIR      = 0x01000000
+IN_ISDIR        = 0x40000000
+
+INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def watch_pid_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, WATCH_PID_FILENAME)
+
+
+def watch_pid_lock(ck_cache_dir):
+    """Writes our PID to the PID file and locks it for as long as we run. Returns the file's descriptor, to pass to
+       watch_pid_unlock() when done, or None if another watcher holds the lock."""
+    fd = os.open(watch_pid_path(ck_cache_dir), os.O_RDWR | os.O_CREAT, 0o644)
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode('utf-8'))
+    return fd
+
+
+def watch_pid_unlock(ck_cache_dir, fd):
+    """Removes the PID file and releases the lock taken by watch_pid_lock()."""
+    # NOTE(Alin): Remove it while still holding the lock, so no other 'ck' sees an unlocked PID file in between
+    try:
+        os.remove(watch_pid_path(ck_cache_dir))
+    except FileNotFoundError:
+        pass
+    os.close(fd)
+
+
+def watch_is_running(ck_cache_dir):
+    """Returns True if a 'ck watch' is keeping this library's indexes up to date."""
+    try:
+        with open(watch_pid_path(ck_cache_dir), 'r') as f:
+            if fcntl is not None:
+                # Whoever wrote the PID file holds its lock for as long as it runs
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return True
+                return False
+
+            pid = int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return False
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to someone else
+        pass
+    return True
+
+
+def tag_index_path(ck_cache_dir):
+    return os.path.join(ck_cache_dir, TAG_INDEX_FILENAME)
+
+
+def tag_index_load(ck_cache_dir):
+    """Returns the CK to tags map saved by 'ck watch', or None if there is none."""
+    index = json_cache_load(tag_index_path(ck_cache_dir))
+    if 'tags' not in index:
+        return None
+    return index['tags']
+
+
+def tag_index_save(ck_cache_dir, ck_tags):
+    json_cache_save(tag_index_path(ck_cache_dir), { 'tags': ck_tags })
+
+
+def inotify_available():
+    return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+
+class InotifyWatcher(object):
+    """Watches directories (and, if recursive, their subdirectories) for changes via Linux's inotify, through ctypes."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, "inotify_init1: " + os.strerror(e))
+
+        # Maps each watch descriptor to (directory, whether to also watch its new subdirectories)
+        self._watches = {}
+
+    def close(self):
+        os.close(self._fd)
+
+    def add(self, path, recursive=False):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), INOTIFY_MASK | IN_ONLYDIR)
+        if wd < 0:
+            e = ctypes.get_errno()
+            # e.g., the directory was deleted right after it was created
+            if e in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(e, "inotify_add_watch(" + path + "): " + os.strerror(e))
+        self._watches[wd] = (path, recursive)
+
+        if recursive:
+            try:
+                it = os.scandir(path)
+            except (FileNotFoundError, NotADirectoryError):
+                return
+
+            with it:
+                for dirent in it:
+                    if dirent.is_dir(follow_symlinks=False) and not dirent.name.startswith('.git'):
+                        self.add(dirent.path, recursive)
+
+    def wait(self, timeout):
+        """Waits up to 'timeout' seconds for changes. Returns the list of changed paths, or RESCAN if some changes
+           were lost (e.g., the kernel's event queue overflowed)."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if len(readable) == 0:
+            return []
+
+        try:
+            buf = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        rescan = False
+        pos = 0
+        while pos < len(buf):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(buf, pos)
+            name = buf[pos + INOTIFY_EVENT.size:pos + INOTIFY_EVENT.size + length].rstrip(b'\0')
+            pos += INOTIFY_EVENT.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                rescan = True
+                continue
+            if wd not in self._watches:
+                continue
+
+            dirpath, recursive = self._watches[wd]
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+
+            path = os.path.join(dirpath, os.fsdecode(name)) if len(name) > 0 else dirpath
+            paths.append(path)
+
+            if recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add(path, recursive)
+                # Files might have appeared in the new directory before we started watching it
+                for root, dirs, files in os.walk(path):
+                    paths.extend(os.path.join(root, f) for f in files)
+
+        return RESCAN if rescan else paths
+
+
+class PollingWatcher(object):
+    """Watches directories for changes by periodically comparing the (mtime, size) of everything in them. Slower
+       than inotify, but works everywhere (e.g., on macOS or on network filesystems)."""
+
+    def __init__(self, interval=2):
+        self.interval = interval
+        self._dirs = []
+        self._state = {}
+
+    def close(self):
+        pass
+
+    def add(self, path, recursive=False):
+        self._dirs.append((path, recursive))
+        self._state.update(self._scan(path, recursive))
+
+    def _scan(self, path, recursive):
+        state = {}
+        dirs = [path]
+        while len(dirs) > 0:
+            try:
+                it = os.scandir(dirs.pop())
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+            with it:
+                for dirent in it:
+                    try:
+                        st = dirent.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    state[dirent.path] = (st.st_mtime_ns, st.st_size, st.st_mode)
+
+                    if recursive and dirent.is_dir(follow_symlinks=False) and not dirent.name.startswith('.git'):
+                        dirs.append(dirent.path)
+        return state
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+        state = {}
+        for path, recursive in self._dirs:
+            state.update(self._scan(path, recursive))
+
+        old = self._state
+        self._state = state
+        return sorted(p for p in set(old) | set(state) if old.get(p) != state.get(p))
+
+
+def watch_batches(watcher, debounce, max_delay):
+    """Yields batches of changes from the watcher: a set of changed paths, or RESCAN. A batch is yielded once no
+       changes happened for 'debounce' seconds, or 'max_delay' seconds after its first change, so a large sync
+       (e.g., Dropbox downloading hundreds of papers) is handled as a few batches rather than hundreds."""
+    while True:
+        changes = watcher.wait(3600)
+        if changes is not RESCAN and len(changes) == 0:
+            continue
+
+        batch = RESCAN if changes is RESCAN else set(changes)
+        deadline = time.monotonic() + max_delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            changes = watcher.wait(min(debounce, remaining))
+            if changes is RESCAN:
+                batch = RESCAN
+            elif len(changes) == 0:
+                break
+            elif batch is not RESCAN:
+                batch.update(changes)
+
+        yield batch
+
+
+def split_changes(ck_bib_dir, ck_tag_dir, paths):
+    """Splits changed paths into (CKs whose .bib or .md file changed in BibDir, changed paths in TagDir)."""
+    ck_bib_dir = os.path.normpath(ck_bib_dir)
+    ck_tag_dir = os.path.normpath(ck_tag_dir)
+
+    cks = set()
+    tag_paths = []
+    for path in paths:
+        path = os.path.normpath(path)
+        dirname, filename = os.path.split(path)
+        if dirname == ck_bib_dir:
+            ck, ext = os.path.splitext(filename)
+            if '.' not in ck and ext.lower() in ('.bib', '.md'):
+                cks.add(ck)
+        elif path == ck_tag_dir or path.startswith(ck_tag_dir + os.sep):
+            tag_paths.append(path)
+
+    return cks, tag_paths
+
+
+def tag_index_update(ck_tag_dir, ck_tags, paths):
+    """Applies changes to the tag symlinks at 'paths' to the CK to tags map. Returns False if some change (e.g., to a
+       whole directory) cannot be applied one symlink at a time, in which case the map must be rebuilt."""
+    ck_tag_dir = os.path.normpath(ck_tag_dir)
+
+    for path in paths:
+        path = os.path.normpath(path)
+        if not path.startswith(ck_tag_dir + os.sep):
+            return False
+
+        ck, ext = os.path.splitext(os.path.basename(path))
+        if ext.lower() != '.pdf':
+            # A tag directory that was created, moved or deleted, along with all the symlinks in it
+            if os.path.isdir(path) or (not os.path.lexists(path) and tag_index_has_tag(ck_tags, os.path.relpath(path, ck_tag_dir))):
+                return False
+            continue
+
+        tag = os.path.relpath(os.path.dirname(path), ck_tag_dir)
+        tags = ck_tags.setdefault(ck, [])
+        if os.path.islink(path):
+            if tag not in tags:
+                tags.append(tag)
+        elif tag in tags:
+            tags.remove(tag)
+        if len(tags) == 0:
+            del ck_tags[ck]
+
+    return True
+
+
+def tag_index_has_tag(ck_tags, tag):
+    """Returns True if some paper in the CK to tags map has the tag or one of its subtags."""
+    return any(t == tag or t.startswith(tag + '/') for tags in ck_tags.values() for t in tags)
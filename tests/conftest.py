@@ -1,5 +1,7 @@
 import configparser
 import os
+import subprocess
+import sys
 import tempfile
 
 import pytest
@@ -15,6 +17,14 @@ def ck_dirs(tmp_path):
     return str(bib_dir), str(tag_dir)
 
 
+@pytest.fixture
+def cache_dir(tmp_path):
+    """Creates a temporary CacheDir for testing."""
+    path = tmp_path / "cache"
+    path.mkdir()
+    return str(path)
+
+
 @pytest.fixture
 def ck_config(tmp_path, ck_dirs):
     """Creates a temporary ck config file pointing to temp dirs."""
@@ -110,3 +120,32 @@ def populated_library(ck_dirs):
     )
 
     return bib_dir, tag_dir
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CK_SCRIPT = os.path.join(REPO_DIR, "ck")
+
+
+@pytest.fixture
+def run_ck(tmp_path, populated_library):
+    """Returns a function that runs the ck script in a subprocess on the populated library, with the given input
+       (or none) on its stdin."""
+    bib_dir, tag_dir = populated_library
+    config_path = tmp_path / "ck.config"
+    config_path.write_text(f"""[default]
+BibDir                = {bib_dir}
+TagDir                = {tag_dir}
+DefaultCk             = InitialsShortYear
+TextEditor            = vim
+MarkdownEditor        = vim
+TagAfterCkAddConflict = false
+CacheDir              = {tmp_path / "cache"}
+""")
+
+    def run(*args, input=None):
+        env = dict(os.environ, CK_NO_SERVE="1")
+        stdin = subprocess.DEVNULL if input is None else None
+        return subprocess.run([sys.executable, CK_SCRIPT, "-c", str(config_path)] + list(args),
+            cwd=str(tmp_path), env=env, capture_output=True, text=True, stdin=stdin, input=input)
+
+    return run
@@ -4,6 +4,10 @@ import pytest
 from collections import defaultdict
 
 from citationkeys.bib import (
+    bibtex_blocks_to_bibents,
+    bibtex_iter_blocks,
+    ck_add_suffix,
+    ck_sanitize,
     strip_accents,
     bibtex_to_bibent,
     bibtex_to_bibdb,
@@ -23,6 +27,9 @@ from citationkeys.bib import (
     bibent_to_markdown,
     bibent_to_text,
     bibpath_rename_ck,
+    bibent_refresh,
+    bibent_diff,
+    bibpath_canonicalize,
 )
 
 
@@ -272,3 +279,134 @@ class TestBibentFormatting:
         txt = bibent_to_text(sample_bibent)
         assert "[KZG10]" in txt
         assert "Kate" in txt
+
+
+class TestBibentRefresh:
+    def test_keeps_ck_and_dateadded(self, sample_bibent):
+        sample_bibent["ckdateadded"] = "2024-01-15 10:30:00"
+        new_bibent = {"ID": "kate2010constant", "ENTRYTYPE": "article", "journal": "J. Cryptology",
+                      "ckdateadded": "2026-01-01 00:00:00"}
+        refreshed = bibent_refresh(sample_bibent, new_bibent)
+        assert refreshed["ID"] == "KZG10"
+        assert refreshed["ckdateadded"] == "2024-01-15 10:30:00"
+        assert refreshed["ENTRYTYPE"] == "article"
+        assert refreshed["journal"] == "J. Cryptology"
+
+    def test_keeps_fields_missing_from_new(self, sample_bibent):
+        sample_bibent["note"] = "my notes"
+        refreshed = bibent_refresh(sample_bibent, {"ID": "X", "year": "2011"})
+        assert refreshed["note"] == "my notes"
+        assert refreshed["year"] == "2011"
+
+    def test_does_not_modify_old(self, sample_bibent):
+        bibent_refresh(sample_bibent, {"ID": "X", "year": "2011"})
+        assert sample_bibent["year"] == "2010"
+
+
+class TestBibentDiff:
+    def test_no_diff(self, sample_bibent):
+        assert bibent_diff(sample_bibent, dict(sample_bibent)) == []
+
+    def test_changed_added_removed(self):
+        old = {"ID": "X", "year": "2010", "eprint": "1234"}
+        new = {"ID": "X", "year": "2011", "doi": "10.1/2"}
+        assert bibent_diff(old, new) == [
+            ("doi", None, "10.1/2"),
+            ("eprint", "1234", None),
+            ("year", "2010", "2011"),
+        ]
+
+
+class TestBibpathCanonicalize:
+    def test_updates_file(self, tmp_path):
+        bibfile = str(tmp_path / "X.bib")
+        with open(bibfile, "w") as f:
+            f.write("@article{wrong, author={ Alice }, title={Title}, year={2000}}")
+        assert bibpath_canonicalize("X", bibfile, 0) is True
+        bibent = bibent_from_file(bibfile)
+        assert bibent["ID"] == "X"
+        assert bibent["title"] == "{Title}"
+        # Second time, there should be nothing left to do
+        assert bibpath_canonicalize("X", bibfile, 0) is False
+
+    def test_dry_run_does_not_write(self, tmp_path):
+        bibfile = str(tmp_path / "X.bib")
+        bibtex = "@article{wrong, author={Alice}, title={Title}, year={2000}}"
+        with open(bibfile, "w") as f:
+            f.write(bibtex)
+        assert bibpath_canonicalize("X", bibfile, 0, dry_run=True) is True
+        with open(bibfile) as f:
+            assert f.read() == bibtex
+
+
+class TestCkSuffixes:
+    def test_sanitize(self):
+        assert ck_sanitize("TCZ+19") == "TCZ+19"
+        assert ck_sanitize("smith:2010/x y") == "smith2010xy"
+
+    def test_untaken_ck_is_kept(self):
+        taken = {"kzg10"}
+        assert ck_add_suffix("BLS01", taken) == "BLS01"
+        assert "bls01" in taken
+
+    def test_suffixes_are_deterministic(self):
+        taken = {"kzg10"}
+        assert [ck_add_suffix("KZG10", taken) for _ in range(3)] == ["KZG10a", "KZG10b", "KZG10c"]
+
+    def test_case_insensitive(self):
+        assert ck_add_suffix("kzg10", {"kzg10"}) == "kzg10a"
+
+    def test_past_z(self):
+        taken = {"x"} | {"x" + c for c in "abcdefghijklmnopqrstuvwxyz"}
+        assert ck_add_suffix("x", taken) == "xaa"
+
+
+class TestBibtexIterBlocks:
+    def test_blocks(self):
+        bibtex = """% a comment
+@string{ac = "ASIACRYPT"}
+@inproceedings{KZG10,
+  title = {Constant-Size {Commitments}},
+  booktitle = ac,
+} @article(X, title = {a(b)})
+@comment{ignored}
+"""
+        blocks = list(bibtex_iter_blocks(iter(bibtex.splitlines(keepends=True))))
+        assert [kind for kind, _ in blocks] == ["string", "inproceedings", "article", "comment"]
+        assert blocks[1][1] == "@inproceedings{KZG10,\n  title = {Constant-Size {Commitments}},\n  booktitle = ac,\n}"
+        assert blocks[2][1] == "@article(X, title = {a(b)})"
+
+    def test_unterminated(self):
+        with pytest.raises(ValueError):
+            list(bibtex_iter_blocks(iter(["@misc{X, title = {a}\n"])))
+
+
+class TestBibtexBlocksToBibents:
+    def test_cks_strings_and_dateadded(self):
+        blocks = [
+            "@inproceedings{x, author = {Kate, Aniket and Zaverucha, Gregory}, title = {T}, booktitle = ac, year = {2010}}",
+            "@misc{y, title = {No authors}, ckdateadded = {2020-01-01 00:00:00}}",
+        ]
+        results = bibtex_blocks_to_bibents(blocks, '@string{ac = "ASIACRYPT"}\n', "InitialsShortYear", "2024-01-01 10:00:00")
+
+        (ck1, bibent1, bibtex1), (ck2, bibent2, bibtex2) = results
+        assert ck1 == "KZ10"
+        assert bibent1["ID"] == "KZ10"
+        assert bibent1["booktitle"] == "ASIACRYPT"
+        assert bibent1["ckdateadded"] == "2024-01-01 10:00:00"
+        assert bibtex1.startswith("@inproceedings{KZ10,")
+
+        # Falls back to the entry's own key, and keeps its date
+        assert ck2 == "y"
+        assert bibent2["ckdateadded"] == "2020-01-01 00:00:00"
+
+    def test_malformed_entry_does_not_shift_others(self):
+        blocks = [
+            "@misc{a, title = {A}, year = {2001}}",
+            "@misc{b, title = }",
+            "@misc{c, title = {C}, year = {2003}}",
+        ]
+        results = bibtex_blocks_to_bibents(blocks, "", "KeepBibtex", "2024-01-01 10:00:00")
+
+        assert [r[0] for r in results] == ["a", None, "c"]
+        assert results[2][1]["year"] == "2003"
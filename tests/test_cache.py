@@ -0,0 +1,106 @@
+"""Unit tests for citationkeys/cache.py"""
+
+import os
+
+from citationkeys import cache as cache_mod
+from citationkeys.bib import bibent_to_markdown, bibent_to_text, bibtex_to_bibent
+from citationkeys.cache import (
+    CitationCache,
+    file_fingerprint,
+    file_sha1,
+    json_cache_load,
+    json_cache_save,
+    library_cache_dir,
+)
+
+
+class TestLibraryCacheDir:
+    def test_creates_dir(self, tmp_path, ck_dirs):
+        bib_dir, _ = ck_dirs
+        path = library_cache_dir(str(tmp_path / "cache"), bib_dir)
+        assert os.path.isdir(path)
+
+    def test_different_libraries_get_different_dirs(self, tmp_path):
+        cache_root = str(tmp_path / "cache")
+        assert library_cache_dir(cache_root, "/a/papers") != library_cache_dir(cache_root, "/b/papers")
+        assert library_cache_dir(cache_root, "/a/papers") == library_cache_dir(cache_root, "/a/papers")
+
+
+class TestFileFingerprint:
+    def test_changes_with_content(self, tmp_path):
+        path = str(tmp_path / "X.bib")
+        with open(path, "w") as f:
+            f.write("a")
+        before = file_fingerprint(path)
+        sha1_before = file_sha1(path)
+        with open(path, "w") as f:
+            f.write("ab")
+        assert file_fingerprint(path) != before
+        assert file_sha1(path) != sha1_before
+
+
+class TestJsonCache:
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "cache.json")
+        json_cache_save(path, {"KZG10": [1, 2, "abc"]})
+        assert json_cache_load(path) == {"KZG10": [1, 2, "abc"]}
+
+    def test_missing_file(self, tmp_path):
+        assert json_cache_load(str(tmp_path / "nope.json")) == {}
+
+    def test_corrupted_file(self, tmp_path):
+        path = str(tmp_path / "cache.json")
+        with open(path, "w") as f:
+            f.write("{not json")
+        assert json_cache_load(path) == {}
+
+
+class TestCitationCache:
+    BIBTEX = """@article{BLS01,
+  author = {Boneh, Dan and Lynn, Ben and Shacham, Hovav},
+  title = {Short Signatures from the Weil Pairing},
+  journal = {Journal of Cryptology},
+  year = {2001},
+}"""
+
+    def test_matches_uncached_rendering(self, tmp_path):
+        bibent = bibtex_to_bibent(self.BIBTEX)
+        cache = CitationCache(str(tmp_path))
+        assert cache.get("BLS01", self.BIBTEX, "markdown") == bibent_to_markdown(bibent)
+        assert cache.get("BLS01", self.BIBTEX, "text") == bibent_to_text(bibent)
+
+    def test_persists_and_skips_parsing(self, tmp_path, monkeypatch):
+        cache = CitationCache(str(tmp_path))
+        expected = cache.get("BLS01", self.BIBTEX, "markdown")
+        cache.save()
+
+        def fail(bibtex):
+            raise AssertionError("re-rendered a cached citation")
+        monkeypatch.setattr(cache_mod, "bibtex_to_bibent", fail)
+
+        cache = CitationCache(str(tmp_path))
+        assert cache.get("BLS01", self.BIBTEX, "markdown") == expected
+        assert cache.dirty is False
+
+    def test_invalidated_when_bibtex_changes(self, tmp_path):
+        cache = CitationCache(str(tmp_path))
+        cache.get("BLS01", self.BIBTEX, "text")
+        cache.save()
+
+        cache = CitationCache(str(tmp_path))
+        changed = self.BIBTEX.replace("2001", "2004")
+        assert cache.get("BLS01", changed, "text").endswith("; 2004")
+        assert cache.dirty is True
+
+    def test_invalidated_when_renderers_change(self, tmp_path, monkeypatch):
+        cache = CitationCache(str(tmp_path))
+        cache.get("BLS01", self.BIBTEX, "text")
+        cache.save()
+
+        monkeypatch.setitem(cache_mod.CITATION_RENDERERS, "text", lambda bibent: "new")
+        cache = CitationCache(str(tmp_path))
+        assert cache.get("BLS01", self.BIBTEX, "text") != "new"
+
+        monkeypatch.setattr(cache_mod, "CITATION_RENDERERS_VERSION", cache_mod.CITATION_RENDERERS_VERSION + 1)
+        assert cache.get("BLS01", self.BIBTEX, "text") == "new"
+        assert cache.dirty is True
@@ -0,0 +1,24 @@
+"""Tests for 'ck cleanbib', which run the ck script in a subprocess on a temporary library."""
+
+import json
+import os
+
+from citationkeys.cache import library_cache_dir
+
+
+class TestCleanbib:
+    def test_cache_forgets_deleted_bib_files(self, tmp_path, populated_library, run_ck):
+        bib_dir, _ = populated_library
+        cache_path = os.path.join(library_cache_dir(str(tmp_path / "cache"), bib_dir), "cleanbib.json")
+
+        result = run_ck("cleanbib")
+        assert result.returncode == 0, result.stderr
+        with open(cache_path) as f:
+            assert sorted(json.load(f)) == ["BLS01", "GMR85", "KZG10"]
+
+        os.rename(os.path.join(bib_dir, "GMR85.bib"), os.path.join(bib_dir, "GMR86.bib"))
+        result = run_ck("cleanbib")
+        assert result.returncode == 0, result.stderr
+        assert "Checked 1 .bib files (2 unchanged since last run)" in result.stdout
+        with open(cache_path) as f:
+            assert sorted(json.load(f)) == ["BLS01", "GMR86", "KZG10"]
@@ -0,0 +1,159 @@
+"""Unit tests for the download helpers in citationkeys/urlhandlers.py
+
+Unlike tests/test_urlhandlers.py, these do not hit the network: they use a fake URL opener.
+"""
+
+import io
+import time
+import types
+import urllib.error
+
+import pytest
+
+import citationkeys.urlhandlers as urlhandlers
+from citationkeys.urlhandlers import (
+    DomainRateLimiter,
+    get_url,
+    parse_retry_after,
+    set_download_policy,
+)
+
+
+class FakeResponse:
+    def __init__(self, body, content_type="text/html"):
+        self.body = body
+        self.content_type = content_type
+
+    def getheader(self, name):
+        return self.content_type if name == "Content-Type" else None
+
+    def getcode(self):
+        return 200
+
+    def read(self):
+        return self.body
+
+
+class FakeOpener:
+    """Replays a list of responses (or exceptions to raise), recording the timeouts it was called with."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.timeouts = []
+
+    def open(self, req, timeout=None):
+        self.timeouts.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def http_error(code, headers=None):
+    return urllib.error.HTTPError("http://example.com", code, "error", headers or {}, io.BytesIO(b""))
+
+
+@pytest.fixture(autouse=True)
+def fast_policy(monkeypatch):
+    """No real sleeping and a default policy for every test."""
+    sleeps = []
+    monkeypatch.setattr(urlhandlers.time, "sleep", lambda secs: sleeps.append(secs))
+    set_download_policy(5, 7, 3, 0.01, 0)
+    yield sleeps
+    set_download_policy(10, 30, 3, 1, 0)
+
+
+class TestGetUrl:
+    def test_passes_connect_timeout(self):
+        opener = FakeOpener([FakeResponse(b"ok")])
+        assert get_url(opener, "http://example.com", 0, "agent") == b"ok"
+        assert opener.timeouts == [5]
+
+    def test_retries_transient_http_errors(self, fast_policy):
+        opener = FakeOpener([http_error(503), http_error(429), FakeResponse(b"ok")])
+        assert get_url(opener, "http://example.com", 0, "agent") == b"ok"
+        assert len(fast_policy) == 2
+
+    def test_honors_retry_after(self, fast_policy):
+        opener = FakeOpener([http_error(429, {"Retry-After": "4"}), FakeResponse(b"ok")])
+        get_url(opener, "http://example.com", 0, "agent")
+        assert fast_policy == [4.0]
+
+    def test_gives_up_after_retries(self):
+        opener = FakeOpener([http_error(503)] * 4)
+        with pytest.raises(urllib.error.HTTPError):
+            get_url(opener, "http://example.com", 0, "agent")
+        assert len(opener.outcomes) == 0
+
+    def test_does_not_retry_permanent_errors(self):
+        opener = FakeOpener([http_error(404), FakeResponse(b"ok")])
+        with pytest.raises(urllib.error.HTTPError):
+            get_url(opener, "http://example.com", 0, "agent")
+        assert len(opener.outcomes) == 1
+
+    def test_retries_timeouts(self):
+        opener = FakeOpener([urllib.error.URLError(TimeoutError("timed out")), FakeResponse(b"ok")])
+        assert get_url(opener, "http://example.com", 0, "agent") == b"ok"
+
+    def test_deadline_exceeded(self):
+        set_download_policy(5, 7, 3, 0.01, 60)
+        urlhandlers.download_policy["deadline"] = time.monotonic() - 1
+        with pytest.raises(TimeoutError):
+            get_url(FakeOpener([FakeResponse(b"ok")]), "http://example.com", 0, "agent")
+
+    def test_deadline_stops_retries(self):
+        set_download_policy(5, 7, 3, 0.01, 60)
+        opener = FakeOpener([http_error(503, {"Retry-After": "120"}), FakeResponse(b"ok")])
+        with pytest.raises(TimeoutError):
+            get_url(opener, "http://example.com", 0, "agent")
+
+    def test_gives_up_on_long_retry_after(self, fast_policy):
+        opener = FakeOpener([http_error(503, {"Retry-After": "86400"}), FakeResponse(b"ok")])
+        with pytest.raises(TimeoutError):
+            get_url(opener, "http://example.com", 0, "agent")
+        assert fast_policy == []
+
+    def test_sets_read_timeout(self):
+        class FakeSocket:
+            timeout = None
+
+            def settimeout(self, timeout):
+                self.timeout = timeout
+
+        sock = FakeSocket()
+        response = FakeResponse(b"ok")
+        response.fp = types.SimpleNamespace(raw=types.SimpleNamespace(_sock=sock))
+        get_url(FakeOpener([response]), "http://example.com", 0, "agent")
+        assert sock.timeout == 7
+
+    def test_does_not_modify_extra_headers(self):
+        headers = {"Accept": "application/x-bibtex"}
+        get_url(FakeOpener([FakeResponse(b"ok")]), "http://example.com", 0, "agent", None, headers)
+        assert headers == {"Accept": "application/x-bibtex"}
+
+
+class TestParseRetryAfter:
+    def test_seconds(self):
+        assert parse_retry_after("120") == 120.0
+
+    def test_http_date_in_the_past(self):
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+    def test_garbage(self):
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+
+
+class TestDomainRateLimiter:
+    def test_spaces_out_same_domain(self, fast_policy):
+        limiter = DomainRateLimiter(10)
+        limiter.wait("arxiv.org")
+        limiter.wait("arxiv.org")
+        assert len(fast_policy) == 1
+        assert fast_policy[0] > 9
+
+    def test_does_not_delay_other_domains(self, fast_policy):
+        limiter = DomainRateLimiter(10)
+        limiter.wait("arxiv.org")
+        limiter.wait("eprint.iacr.org")
+        assert fast_policy == []
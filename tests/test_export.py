@@ -0,0 +1,147 @@
+"""Unit tests for citationkeys/export.py"""
+
+import errno
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from citationkeys import export
+from citationkeys.export import archive_format, export_files, link_or_copy, write_archive
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    src_dir = tmp_path / "papers"
+    dst_dir = tmp_path / "out"
+    src_dir.mkdir()
+    dst_dir.mkdir()
+
+    srcs = []
+    for ck in ["A01", "B02", "C03"]:
+        path = src_dir / (ck + ".pdf")
+        path.write_bytes(b"%PDF " + ck.encode())
+        srcs.append(str(path))
+    return srcs, str(dst_dir)
+
+
+class TestLinkOrCopy:
+    def test_copy(self, pdfs):
+        srcs, dst_dir = pdfs
+        dst = os.path.join(dst_dir, "A01.pdf")
+        assert link_or_copy(srcs[0], dst, "copy") == "copy"
+        assert open(dst, "rb").read() == b"%PDF A01"
+        assert not os.path.samefile(srcs[0], dst)
+
+    def test_hard(self, pdfs):
+        srcs, dst_dir = pdfs
+        dst = os.path.join(dst_dir, "A01.pdf")
+        assert link_or_copy(srcs[0], dst, "hard") == "hard"
+        assert os.path.samefile(srcs[0], dst)
+
+    def test_sym(self, pdfs):
+        srcs, dst_dir = pdfs
+        dst = os.path.join(dst_dir, "A01.pdf")
+        assert link_or_copy(srcs[0], dst, "sym") == "sym"
+        assert os.path.islink(dst)
+        assert os.readlink(dst) == os.path.abspath(srcs[0])
+
+    def test_hard_falls_back_to_copy_across_devices(self, pdfs, monkeypatch):
+        srcs, dst_dir = pdfs
+
+        def cross_device_link(src, dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        monkeypatch.setattr(export.os, "link", cross_device_link)
+
+        dst = os.path.join(dst_dir, "A01.pdf")
+        assert link_or_copy(srcs[0], dst, "hard") == "copy"
+        assert open(dst, "rb").read() == b"%PDF A01"
+
+    def test_reflink_falls_back_without_leaving_files(self, pdfs, monkeypatch):
+        srcs, dst_dir = pdfs
+
+        def unsupported(src, dst):
+            raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+        monkeypatch.setattr(export, "reflink_file", unsupported)
+
+        dst = os.path.join(dst_dir, "A01.pdf")
+        assert link_or_copy(srcs[0], dst, "reflink") == "copy"
+        assert open(dst, "rb").read() == b"%PDF A01"
+
+    def test_other_errors_are_raised(self, pdfs):
+        srcs, dst_dir = pdfs
+        with pytest.raises(FileNotFoundError):
+            link_or_copy(srcs[0] + ".missing", os.path.join(dst_dir, "X.pdf"), "hard")
+
+
+class TestExportFiles:
+    @pytest.mark.parametrize("jobs", [1, 4])
+    def test_copies_all(self, pdfs, jobs):
+        srcs, dst_dir = pdfs
+        pairs = [(src, os.path.join(dst_dir, os.path.basename(src))) for src in srcs]
+
+        results = export_files(pairs, "copy", jobs)
+        assert [r[0] for r in results] == srcs
+        assert all(r[2] == "copy" and r[3] is None for r in results)
+        assert sorted(os.listdir(dst_dir)) == ["A01.pdf", "B02.pdf", "C03.pdf"]
+
+    def test_reports_errors(self, pdfs):
+        srcs, dst_dir = pdfs
+        pairs = [(srcs[0] + ".missing", os.path.join(dst_dir, "X.pdf"))]
+
+        (src, dst, mode, err), = export_files(pairs, "copy", 4)
+        assert mode is None
+        assert isinstance(err, OSError)
+
+
+class TestArchive:
+    def test_archive_format(self):
+        assert archive_format("out.zip") == "zip"
+        assert archive_format("out.TAR.GZ") == "tar.gz"
+        assert archive_format("out.tgz") == "tar.gz"
+        assert archive_format("out.tar.zst") == "tar.zst"
+        assert archive_format("out.tar") == "tar"
+        assert archive_format("out.rar") is None
+
+    def test_zip(self, pdfs, tmp_path):
+        srcs, _ = pdfs
+        path = str(tmp_path / "out.zip")
+        write_archive(path, [(src, os.path.basename(src)) for src in srcs], {"out.bib": b"@misc{A01}"})
+
+        with zipfile.ZipFile(path) as zf:
+            assert sorted(zf.namelist()) == ["A01.pdf", "B02.pdf", "C03.pdf", "out.bib"]
+            assert zf.read("B02.pdf") == b"%PDF B02"
+            assert zf.read("out.bib") == b"@misc{A01}"
+
+    @pytest.mark.parametrize("name", ["out.tar", "out.tar.gz"])
+    def test_tar(self, pdfs, tmp_path, name):
+        srcs, _ = pdfs
+        path = str(tmp_path / name)
+        write_archive(path, [(src, os.path.basename(src)) for src in srcs], {"out.bib": b"@misc{A01}"})
+
+        with tarfile.open(path) as tar:
+            assert sorted(tar.getnames()) == ["A01.pdf", "B02.pdf", "C03.pdf", "out.bib"]
+            assert tar.extractfile("C03.pdf").read() == b"%PDF C03"
+            assert tar.extractfile("out.bib").read() == b"@misc{A01}"
+
+    def test_tar_zst(self, pdfs, tmp_path):
+        zstandard = pytest.importorskip("zstandard")
+        srcs, _ = pdfs
+        path = str(tmp_path / "out.tar.zst")
+        write_archive(path, [(srcs[0], "A01.pdf")])
+
+        with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                assert [m.name for m in tar] == ["A01.pdf"]
+
+    def test_unsupported_format(self, tmp_path):
+        with pytest.raises(ValueError):
+            write_archive(str(tmp_path / "out.rar"), [])
+        assert not os.path.exists(str(tmp_path / "out.rar"))
+
+    def test_failure_removes_partial_archive(self, tmp_path):
+        path = str(tmp_path / "out.zip")
+        with pytest.raises(FileNotFoundError):
+            write_archive(path, [(str(tmp_path / "missing.pdf"), "missing.pdf")])
+        assert not os.path.exists(path)
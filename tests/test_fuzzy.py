@@ -0,0 +1,107 @@
+"""Unit tests for citationkeys/fuzzy.py"""
+
+import os
+
+import pytest
+
+from citationkeys.fuzzy import (
+    fuzzy_index_build,
+    fuzzy_index_load,
+    fuzzy_index_path,
+    fuzzy_index_save,
+    fuzzy_index_update,
+    trigrams,
+)
+from citationkeys.snapshot import snapshot_update
+
+
+@pytest.fixture
+def snapshot(populated_library, cache_dir):
+    bib_dir, _ = populated_library
+    with snapshot_update(bib_dir, cache_dir, 0) as snap:
+        yield snap
+
+
+class TestTrigrams:
+    def test_padding(self):
+        assert trigrams("ab") == {"  a", " ab", "ab "}
+
+    def test_case_and_accents(self):
+        assert trigrams("Schnörr") == trigrams("schnorr")
+
+    def test_words(self):
+        assert trigrams("a-b") == trigrams("b a") == {"  a", " a ", "  b", " b "}
+
+    def test_empty(self):
+        assert trigrams("") == set()
+        assert trigrams("{}") == set()
+
+
+class TestSearch:
+    def test_exact_ck_first(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        matches = index.search("KZG10")
+        assert matches[0] == ("KZG10", 1.0)
+
+    def test_misspelled_ck(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert index.search("KZG1")[0][0] == "KZG10"
+        assert index.search("BSL01", fields=("ck",))[0][0] == "BLS01"
+
+    def test_title_words(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert index.search("weil pairng")[0][0] == "BLS01"
+        assert index.search("commitments polynomials")[0][0] == "KZG10"
+
+    def test_ck_only(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert index.search("weil pairing", fields=("ck",)) == []
+
+    def test_no_match(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert index.search("zzzzzz") == []
+        assert index.search("") == []
+
+    def test_limit(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert len(index.search("0", min_score=0)) <= 10
+        assert len(index.search("BLS01 KZG10 GMR85", limit=2, min_score=0)) == 2
+
+    def test_suggest(self, snapshot):
+        index = fuzzy_index_build(snapshot)
+        assert index.suggest("KZG11") == ["KZG10"]
+        assert "KZG10" not in index.suggest("KZG10")
+
+
+class TestPersistence:
+    def test_roundtrip(self, snapshot, cache_dir):
+        index = fuzzy_index_build(snapshot)
+        path = fuzzy_index_path(cache_dir)
+        fuzzy_index_save(index, path)
+
+        loaded = fuzzy_index_load(path)
+        assert loaded.built_ns == index.built_ns
+        assert loaded.cks == index.cks
+        for query in ["KZG1", "weil pairing", "GMR"]:
+            assert loaded.search(query) == index.search(query)
+
+    def test_missing_or_corrupted(self, cache_dir):
+        path = fuzzy_index_path(cache_dir)
+        assert fuzzy_index_load(path) is None
+        with open(path, "wb") as f:
+            f.write(b"not an index")
+        assert fuzzy_index_load(path) is None
+
+    def test_rebuilt_when_snapshot_changes(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert "XYZ20" not in fuzzy_index_update(cache_dir, snap).cks
+
+        with open(os.path.join(bib_dir, "XYZ20.bib"), "w") as f:
+            f.write("@misc{XYZ20,\n  title = {Something New},\n}\n")
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            index = fuzzy_index_update(cache_dir, snap)
+            assert "XYZ20" in index.cks
+            assert index.search("somthing new")[0][0] == "XYZ20"
+            assert fuzzy_index_load(fuzzy_index_path(cache_dir)).built_ns == snap.built_ns
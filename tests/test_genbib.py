@@ -0,0 +1,34 @@
+"""Tests for 'ck genbib', which run the ck script in a subprocess on a temporary library."""
+
+import os
+
+
+class TestGenbib:
+    def test_also_with_the_same_format(self, tmp_path, run_ck):
+        out1, out2 = str(tmp_path / "out.bib"), str(tmp_path / "out2.bib")
+        result = run_ck("genbib", out1, "-b", "--also", "bibtex", out2, "commitments")
+        assert result.returncode == 0, result.stderr
+
+        for path in (out1, out2):
+            with open(path) as f:
+                assert f.read().count("@inproceedings") == 1
+        assert result.stdout.count("Wrote 1 BibTeX entries") == 2
+
+    def test_also_with_another_format(self, tmp_path, run_ck):
+        out1, out2 = str(tmp_path / "out.bib"), str(tmp_path / "out.md")
+        result = run_ck("genbib", out1, "--also", "markdown", out2, "sigs")
+        assert result.returncode == 0, result.stderr
+
+        with open(out1) as f:
+            assert f.read().count("@article") == 1
+        with open(out2) as f:
+            assert "Short Signatures from the Weil Pairing" in f.read()
+        assert "Wrote 1 BibTeX entries to '" + out1 + "'" in result.stdout
+        assert "Wrote 1 Markdown citations to '" + out2 + "'" in result.stdout
+
+    def test_stdout(self, tmp_path, run_ck):
+        result = run_ck("genbib", "-", "sigs")
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.count("@article{BLS01") == 1
+        assert "Wrote 1 BibTeX entries to stdout" in result.stderr
+        assert not os.path.exists(tmp_path / "-")
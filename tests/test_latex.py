@@ -0,0 +1,63 @@
+"""Unit tests for citationkeys/latex.py"""
+
+import os
+
+from citationkeys.latex import cites_from_aux, cites_from_latex, cites_from_tex
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+class TestCitesFromAux:
+    def test_citations_in_order(self, tmp_path):
+        aux = str(tmp_path / "main.aux")
+        write(aux, "\\relax\n\\citation{KZG10}\n\\citation{BLS01,GMR85}\n\\citation{KZG10}\n\\bibcite{KZG10}{1}\n")
+        assert cites_from_aux(aux) == ["KZG10", "BLS01", "GMR85"]
+
+    def test_follows_input(self, tmp_path):
+        write(str(tmp_path / "main.aux"), "\\citation{KZG10}\n\\@input{ch1.aux}\n\\@input{missing.aux}\n")
+        write(str(tmp_path / "ch1.aux"), "\\citation{BLS01}\n\\@input{main.aux}\n")
+        assert cites_from_aux(str(tmp_path / "main.aux")) == ["KZG10", "BLS01"]
+
+    def test_biblatex(self, tmp_path):
+        aux = str(tmp_path / "main.aux")
+        write(aux, "\\abx@aux@cite{KZG10}\n\\abx@aux@cite{0}{BLS01}\n")
+        assert cites_from_aux(aux) == ["KZG10", "BLS01"]
+
+    def test_nocite_star(self, tmp_path):
+        aux = str(tmp_path / "main.aux")
+        write(aux, "\\citation{*}\n")
+        assert cites_from_aux(aux) == ["*"]
+
+
+class TestCitesFromTex:
+    def test_cite_variants(self, tmp_path):
+        tex = str(tmp_path / "main.tex")
+        write(tex, "\\cite{A01} \\citep[p.~3]{B02, C03} \\citet*{D04} \\textcite[see][12]{E05} \\nocite{F06}\n")
+        assert cites_from_tex(tex) == ["A01", "B02", "C03", "D04", "E05", "F06"]
+
+    def test_ignores_comments(self, tmp_path):
+        tex = str(tmp_path / "main.tex")
+        write(tex, "\\cite{A01} % \\cite{B02}\n50\\% of \\cite{C03}\n")
+        assert cites_from_tex(tex) == ["A01", "C03"]
+
+    def test_follows_input_and_include(self, tmp_path):
+        write(str(tmp_path / "main.tex"), "\\cite{A01}\n\\input{sections/intro}\n\\include{sections/end.tex}\n\\cite{D04}\n")
+        write(str(tmp_path / "sections" / "intro.tex"), "\\cite{B02}\n\\input{main}\n")
+        write(str(tmp_path / "sections" / "end.tex"), "\\cite{C03}\n")
+        assert cites_from_tex(str(tmp_path / "main.tex")) == ["A01", "B02", "C03", "D04"]
+
+
+class TestCitesFromLatex:
+    def test_dispatches_on_extension_and_records_files(self, tmp_path):
+        write(str(tmp_path / "main.aux"), "\\citation{A01}\n\\@input{ch1.aux}\n")
+        write(str(tmp_path / "ch1.aux"), "\\citation{B02}\n")
+        write(str(tmp_path / "main.tex"), "\\cite{C03}\n")
+
+        visited = set()
+        assert cites_from_latex(str(tmp_path / "main.aux"), visited) == ["A01", "B02"]
+        assert visited == set([os.path.realpath(str(tmp_path / "main.aux")), os.path.realpath(str(tmp_path / "ch1.aux"))])
+        assert cites_from_latex(str(tmp_path / "main.tex")) == ["C03"]
@@ -0,0 +1,169 @@
+"""Unit tests for citationkeys/output.py"""
+
+import csv
+import io
+import json
+from collections import Counter
+
+import click
+import pytest
+
+from citationkeys.output import (
+    PAPER_FIELDS,
+    BufferedOutput,
+    paper_to_record,
+    format_dateadded,
+    render_facets,
+    render_papers,
+    render_segments,
+    style_affixes,
+    write_facets,
+    write_papers,
+    write_tags,
+)
+from citationkeys.paper import Paper
+
+PAPERS = [
+    Paper("KZG10", "Kate, Aniket and Zaverucha, Gregory M.", "Constant-Size Commitments", "2010",
+          "2024-01-15 10:30:00", None, "ASIACRYPT", False),
+    Paper("BLS01", "Boneh, Dan", "Short Signatures", "2001", "", "https://example.com", None, True),
+]
+
+TAGS = {"BLS01": ["sigs/bls", "sigs"]}
+
+
+class TestPaperToRecord:
+    def test_all_fields(self):
+        record = paper_to_record(PAPERS[1], TAGS)
+        assert list(record.keys()) == PAPER_FIELDS
+        assert record["tags"] == ["sigs", "sigs/bls"]
+        assert record["dateadded"] is None
+        assert record["has_md"] is True
+
+
+class TestWritePapers:
+    def test_json(self):
+        out = io.StringIO()
+        write_papers(PAPERS, TAGS, "json", stream=out)
+        records = json.loads(out.getvalue())
+        assert [r["ck"] for r in records] == ["KZG10", "BLS01"]
+        assert records[0]["venue"] == "ASIACRYPT"
+
+    def test_json_empty(self):
+        out = io.StringIO()
+        write_papers([], TAGS, "json", stream=out)
+        assert json.loads(out.getvalue()) == []
+
+    def test_ndjson(self):
+        out = io.StringIO()
+        write_papers(PAPERS, TAGS, "ndjson", stream=out)
+        lines = out.getvalue().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[1])["tags"] == ["sigs", "sigs/bls"]
+
+    def test_csv(self):
+        out = io.StringIO()
+        write_papers(PAPERS, TAGS, "csv", stream=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        assert rows[0] == PAPER_FIELDS
+        assert rows[1][1] == "Constant-Size Commitments"
+        assert rows[2][PAPER_FIELDS.index("tags")] == "sigs;sigs/bls"
+
+    def test_restricted_fields(self):
+        out = io.StringIO()
+        write_papers(PAPERS, TAGS, "ndjson", fields=["ck"], stream=out)
+        assert out.getvalue() == '{"ck": "KZG10"}\n{"ck": "BLS01"}\n'
+
+    def test_unknown_format(self):
+        with pytest.raises(ValueError):
+            write_papers(PAPERS, TAGS, "xml", stream=io.StringIO())
+
+
+class TestWriteTags:
+    def test_counts(self):
+        out = io.StringIO()
+        write_tags(["sigs", "sigs/bls", "zk"], TAGS, "ndjson", stream=out)
+        records = [json.loads(l) for l in out.getvalue().splitlines()]
+        assert records == [{"tag": "sigs", "count": 1}, {"tag": "sigs/bls", "count": 1}, {"tag": "zk", "count": 0}]
+
+
+class TestWriteFacets:
+    def test_most_common_first(self):
+        out = io.StringIO()
+        facets = {"year": Counter({"2010": 1, "2001": 2}), "tag": Counter({"sigs": 1})}
+        write_facets(facets, "ndjson", stream=out)
+        records = [json.loads(l) for l in out.getvalue().splitlines()]
+        assert records == [
+            {"facet": "year", "value": "2001", "count": 2},
+            {"facet": "year", "value": "2010", "count": 1},
+            {"facet": "tag", "value": "sigs", "count": 1},
+        ]
+
+    def test_render_top(self):
+        facets = {"year": Counter(dict((str(y), 1) for y in range(2000, 2015))), "tag": Counter({"sigs": 3})}
+        lines = [click.unstyle(l) for l in render_facets(facets, top=2)]
+        assert lines == ["year: 2000 (1), 2001 (1), and 13 more", "tag:  #sigs (3)"]
+
+
+class TestBufferedOutput:
+    def test_writes_in_chunks(self):
+        class CountingStream(io.StringIO):
+            writes = 0
+
+            def write(self, s):
+                CountingStream.writes += 1
+                return super().write(s)
+
+        stream = CountingStream()
+        out = BufferedOutput(stream, chunk_size=100)
+        for _ in range(100):
+            out.write("0123456789")
+        out.flush()
+        assert stream.getvalue() == "0123456789" * 100
+        assert CountingStream.writes <= 11
+
+
+class TestFormatDateadded:
+    def test_matches_strftime(self):
+        assert format_dateadded("2024-01-05 10:30:00") == "January 5, 2024"
+        assert format_dateadded("2023-12-25 00:00:00") == "December 25, 2023"
+
+    def test_bad_date_raises(self):
+        with pytest.raises(ValueError):
+            format_dateadded("yesterday")
+
+
+class TestRenderSegments:
+    def test_styles(self):
+        assert render_segments([("a", style_affixes(fg="blue")), ("b", None)]) == click.style("a", fg="blue") + "b"
+
+    def test_no_truncation_when_fits(self):
+        assert render_segments([("abc", None), ("def", None)], max_width=6) == "abcdef"
+
+    def test_truncates_to_width(self):
+        line = render_segments([("abc", None), ("defgh", style_affixes(fg="red"))], max_width=6)
+        assert click.unstyle(line) == "abcde…"
+
+
+class TestRenderPapers:
+    def test_same_text_as_before(self):
+        lines = render_papers(PAPERS[:1], TAGS, include_url=True)
+        assert click.unstyle(lines[0]) == ("KZG10, Constant-Size Commitments, 2010, Kate, Aniket and Zaverucha, Gregory M., "
+                                           "(January 15, 2024), ASIACRYPT")
+
+    def test_aligns_titles(self):
+        lines = [click.unstyle(l) for l in render_papers(PAPERS, TAGS)]
+        assert lines[0].index("Constant") == lines[1].index("Short")
+
+    def test_tags_and_url(self):
+        line = click.unstyle(render_papers(PAPERS[1:], TAGS, include_url=True)[0])
+        assert line.endswith("#sigs/bls, #sigs, https://example.com")
+
+    def test_anonymized(self):
+        line = click.unstyle(render_papers(PAPERS[:1], TAGS, include_ck=False, include_dateadded=False, include_tags=False)[0])
+        assert "KZG10" not in line
+        assert "2024" not in line
+
+    def test_max_width(self):
+        for line in render_papers(PAPERS, TAGS, max_width=30):
+            assert len(click.unstyle(line)) <= 30
@@ -0,0 +1,105 @@
+"""Unit tests for citationkeys/paper.py"""
+
+import pytest
+
+from citationkeys.paper import (
+    Paper,
+    dateadded_to_timestamp,
+    parse_dateadded_bound,
+    parse_sort_spec,
+    sort_papers,
+)
+
+
+def paper(ck, year="2000", date="", venue=None, title="T", author="A"):
+    return Paper(ck, author, title, year, date, None, venue, False)
+
+
+class TestPaper:
+    def test_sort_keys(self):
+        p = Paper("KZG10", "Kate, Aniket", "Constant-Size", "2010", "2024-01-15 10:30:00", None, "ASIACRYPT", False)
+        assert p.author_key == "kate, aniket"
+        assert p.title_key == "constant-size"
+        assert p.year_key == 2010
+        assert p.venue_key == "asiacrypt"
+        assert p.date_key > 0
+
+    def test_missing_fields(self):
+        p = paper("X", year="", date="", venue=None)
+        assert p.year_key == 0
+        assert p.date_key == -1
+        assert p.venue_key == ""
+
+    def test_has_no_dict(self):
+        with pytest.raises(AttributeError):
+            paper("X").some_new_attribute = 1
+
+
+class TestDateaddedToTimestamp:
+    def test_ordering(self):
+        assert dateadded_to_timestamp("2024-01-15 10:30:00") < dateadded_to_timestamp("2024-01-15 10:30:01")
+        assert dateadded_to_timestamp("2023-12-31 23:59:59") < dateadded_to_timestamp("2024-01-01 00:00:00")
+
+    def test_malformed(self):
+        assert dateadded_to_timestamp("") == -1
+        assert dateadded_to_timestamp("January 2024") == -1
+
+
+class TestParseDateaddedBound:
+    def test_day(self):
+        assert parse_dateadded_bound("2024-01-15") == dateadded_to_timestamp("2024-01-15 00:00:00")
+        assert parse_dateadded_bound("2024-01-15", end=True) == dateadded_to_timestamp("2024-01-15 23:59:59")
+
+    def test_time(self):
+        assert parse_dateadded_bound("2024-01-15 10:30") == dateadded_to_timestamp("2024-01-15 10:30:00")
+        assert parse_dateadded_bound("2024-01-15 10:30", end=True) == dateadded_to_timestamp("2024-01-15 10:30:59")
+        assert parse_dateadded_bound("2024-01-15 10:30:05", end=True) == dateadded_to_timestamp("2024-01-15 10:30:05")
+
+    def test_ago(self):
+        now = dateadded_to_timestamp("2024-01-15 10:30:00")
+        assert parse_dateadded_bound("7d", now=now) == dateadded_to_timestamp("2024-01-08 10:30:00")
+        assert parse_dateadded_bound("2w", now=now) == dateadded_to_timestamp("2024-01-01 10:30:00")
+
+    @pytest.mark.parametrize("spec", ["", "yesterday", "2024-1-15", "2024-02-30", "2024-01-15 25:00", "7y"])
+    def test_malformed(self, spec):
+        with pytest.raises(ValueError):
+            parse_dateadded_bound(spec)
+
+
+class TestParseSortSpec:
+    def test_single(self):
+        assert parse_sort_spec("year") == [("year", False)]
+
+    def test_multiple_and_descending(self):
+        assert parse_sort_spec("-Year, venue") == [("year", True), ("venue", False)]
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            parse_sort_spec("year,pages")
+
+
+class TestSortPapers:
+    def test_multi_key(self):
+        papers = [paper("A", "2020", venue="CRYPTO"), paper("B", "2019", venue="STOC"), paper("C", "2020", venue="ASIACRYPT")]
+        sort_papers(papers, parse_sort_spec("year,venue"))
+        assert [p.ck for p in papers] == ["B", "C", "A"]
+
+    def test_mixed_directions(self):
+        papers = [paper("A", "2020", venue="CRYPTO"), paper("B", "2019", venue="STOC"), paper("C", "2020", venue="ASIACRYPT")]
+        sort_papers(papers, parse_sort_spec("-year,venue"))
+        assert [p.ck for p in papers] == ["C", "A", "B"]
+
+    def test_reverse(self):
+        papers = [paper("A", "2020"), paper("B", "2019"), paper("C", "2021")]
+        sort_papers(papers, parse_sort_spec("year"), reverse=True)
+        assert [p.ck for p in papers] == ["C", "A", "B"]
+
+    def test_date_added_missing_first(self):
+        papers = [paper("A", date="2024-01-01 00:00:00"), paper("B", date="")]
+        sort_papers(papers, parse_sort_spec("date-added"))
+        assert [p.ck for p in papers] == ["B", "A"]
+
+    def test_case_insensitive_title(self):
+        papers = [paper("A", title="beta"), paper("B", title="Alpha")]
+        sort_papers(papers, parse_sort_spec("title"))
+        assert [p.ck for p in papers] == ["B", "A"]
@@ -0,0 +1,94 @@
+"""Unit tests for citationkeys/query.py"""
+
+import pytest
+
+from citationkeys.query import (
+    QueryIndex,
+    facet_counts,
+    parse_query,
+    parse_year_range,
+    plan_query,
+    run_query,
+)
+from citationkeys.snapshot import snapshot_update
+
+CK_TAGS = {"BLS01": ["sigs", "sigs/bls"], "KZG10": ["commitments"]}
+
+
+@pytest.fixture
+def index(populated_library, tmp_path):
+    bib_dir, _ = populated_library
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    with snapshot_update(bib_dir, str(cache_dir), 0) as snap:
+        yield QueryIndex(snap, CK_TAGS)
+
+
+def search(index, *args, case_sensitive=False):
+    return run_query(index, parse_query(args), case_sensitive)
+
+
+class TestParseQuery:
+    def test_fields_and_text(self):
+        terms = parse_query(["author:goldberg", "zero knowledge", "https://eprint.iacr.org"])
+        assert [(t.field, t.value) for t in terms] == [
+            ("author", "goldberg"), (None, "zero knowledge"), (None, "https://eprint.iacr.org")]
+
+    def test_year_ranges(self):
+        assert parse_year_range("2019") == (2019, 2019)
+        assert parse_year_range("2018..") == (2018, 9999)
+        assert parse_year_range("..2015") == (0, 2015)
+        assert parse_year_range("2015..2018") == (2015, 2018)
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            parse_query(["year:abc"])
+        with pytest.raises(ValueError):
+            parse_query(["year:2020..2010"])
+        with pytest.raises(ValueError):
+            parse_query(["author:"])
+
+
+class TestRunQuery:
+    def test_author_last_name(self, index):
+        assert search(index, "author:goldberg") == {"KZG10"}
+        assert search(index, "author:Ian Goldberg") == {"KZG10"}
+        assert search(index, "author:gold") == set()
+
+    def test_year(self, index):
+        assert search(index, "year:2001") == {"BLS01"}
+        assert search(index, "year:2000..") == {"BLS01", "KZG10"}
+        assert search(index, "year:..2000") == {"GMR85"}
+
+    def test_venue_and_title_words(self, index):
+        assert search(index, "venue:cryptology") == {"BLS01"}
+        assert search(index, "venue:crypto") == set()
+        assert search(index, "title:pairing short") == {"BLS01"}
+
+    def test_tags_include_subtags(self, index):
+        assert search(index, "tag:sigs") == {"BLS01"}
+        assert search(index, "tag:sigs/bls") == {"BLS01"}
+        assert search(index, "tag:zk") == set()
+
+    def test_all_terms_must_match(self, index):
+        assert search(index, "author:goldberg", "year:2010") == {"KZG10"}
+        assert search(index, "author:goldberg", "year:2011..") == set()
+
+    def test_raw_text(self, index):
+        assert search(index, "weil") == {"BLS01"}
+        assert search(index, "weil", case_sensitive=True) == set()
+        assert search(index, "year:1985", "Knowledge Complexity") == {"GMR85"}
+        # Raw text matches anywhere in the BibTeX, unlike field terms
+        assert search(index, "2010") == {"KZG10"}
+
+    def test_plan_puts_selective_terms_first(self, index):
+        terms = parse_query(["weil", "year:1900..", "author:boneh"])
+        assert [t.field for t in plan_query(index, terms)] == ["author", "year", None]
+
+
+class TestFacets:
+    def test_counts(self, index):
+        facets = facet_counts(index.snapshot, CK_TAGS, search(index, "year:2000.."))
+        assert facets["year"] == {"2001": 1, "2010": 1}
+        assert facets["venue"] == {"Journal of Cryptology": 1, "ASIACRYPT": 1}
+        assert facets["tag"] == {"sigs": 1, "sigs/bls": 1, "commitments": 1}
@@ -0,0 +1,164 @@
+"""Unit tests for citationkeys/rekey.py"""
+
+import os
+
+import pytest
+
+from citationkeys.bib import bibent_from_file, bibtex_to_bibent
+from citationkeys.misc import list_cks
+from citationkeys.rekey import (
+    rekey_apply,
+    rekey_journal_load,
+    rekey_journal_save,
+    rekey_plan,
+)
+from citationkeys.tags import find_tagged_pdfs
+from citationkeys.tagstore import SymlinkTagStore
+
+
+def library_bibents(bib_dir):
+    bibents = {}
+    for ck in list_cks(bib_dir, False):
+        with open(os.path.join(bib_dir, ck + ".bib")) as f:
+            bibents[ck] = bibtex_to_bibent(f.read())
+    return bibents
+
+
+class TestRekeyPlan:
+    def test_plan(self, populated_library):
+        bib_dir, _ = populated_library
+        renames, failed = rekey_plan(library_bibents(bib_dir), "FirstAuthorYearTitle", list_cks(bib_dir, False), 0)
+
+        assert renames == [
+            ("BLS01", "boneh2001short"),
+            ("GMR85", "goldwasser1985the"),
+            ("KZG10", "kate2010constantsize"),
+        ]
+        assert failed == []
+
+    def test_papers_already_following_policy_are_kept(self, populated_library):
+        bib_dir, _ = populated_library
+        renames, _ = rekey_plan(library_bibents(bib_dir), "KeepBibtex", list_cks(bib_dir, False), 0)
+        assert renames == []
+
+    def test_collisions_get_suffixes(self):
+        bibents = {
+            "A": {"ID": "A", "author": "Boneh, Dan", "year": "2001"},
+            "B": {"ID": "B", "author": "Boneh, Dan", "year": "2001"},
+            "C": {"ID": "C", "author": "Boneh, Dan", "year": "2001"},
+        }
+        renames, _ = rekey_plan(bibents, "InitialsShortYear", ["A", "B", "C", "Bone01"], 0)
+        assert renames == [("A", "Bone01a"), ("B", "Bone01b"), ("C", "Bone01c")]
+
+    def test_never_takes_a_ck_being_given_up(self):
+        bibents = {
+            "Bone01": {"ID": "Bone01", "author": "Lynn, Ben", "year": "2001"},
+            "X": {"ID": "X", "author": "Boneh, Dan", "year": "2001"},
+        }
+        renames, _ = rekey_plan(bibents, "InitialsShortYear", ["Bone01", "X"], 0)
+        assert renames == [("Bone01", "Lynn01"), ("X", "Bone01a")]
+
+    def test_suffixed_papers_already_following_policy_are_kept(self):
+        bibents = {
+            "Bone01": {"ID": "Bone01", "author": "Boneh, Dan", "year": "2001"},
+            "Bone01b": {"ID": "Bone01b", "author": "Boneh, Dan", "year": "2001"},
+            "Bone01X": {"ID": "Bone01X", "author": "Boneh, Dan", "year": "2001"},
+            "Lynn01a": {"ID": "Lynn01a", "author": "Lynn, Ben", "year": "2001"},
+            "Lynn01aa": {"ID": "Lynn01aa", "author": "Lynn, Ben", "year": "2001"},
+        }
+        renames, _ = rekey_plan(bibents, "InitialsShortYear", list(bibents), 0)
+        # 'Lynn01aa' comes after 'Lynn01a', which is taken, but 'Lynn01a' comes first, so it should have been 'Lynn01'
+        assert renames == [("Bone01X", "Bone01a"), ("Lynn01a", "Lynn01")]
+
+    def test_tails_that_are_not_collision_suffixes_are_rekeyed(self, populated_library):
+        bibents = {"Bone01foo": {"ID": "Bone01foo", "author": "Boneh, Dan", "year": "2001"}}
+        renames, _ = rekey_plan(bibents, "InitialsShortYear", list(bibents), 0)
+        assert renames == [("Bone01foo", "Bone01")]
+
+        bib_dir, _ = populated_library
+        bibents = {"kate2010constantsizex": library_bibents(bib_dir)["KZG10"]}
+        renames, _ = rekey_plan(bibents, "FirstAuthorYearTitle", list(bibents), 0)
+        assert renames == [("kate2010constantsizex", "kate2010constantsize")]
+
+    def test_plan_is_idempotent(self, populated_library, tmp_path):
+        bib_dir, tag_dir = populated_library
+        # Another paper by the same authors, in the same year, as KZG10
+        for ext in (".bib", ".pdf"):
+            with open(os.path.join(bib_dir, "KZG10" + ext), "rb") as f:
+                data = f.read()
+            with open(os.path.join(bib_dir, "Other" + ext), "wb") as f:
+                f.write(data.replace(b"KZG10", b"Other"))
+
+        renames, _ = rekey_plan(library_bibents(bib_dir), "InitialsShortYear", list_cks(bib_dir, False), 0)
+        assert renames == [("Other", "KZG10a")]
+
+        journal = str(tmp_path / "journal.json")
+        rekey_apply(bib_dir, SymlinkTagStore(tag_dir, bib_dir), find_tagged_pdfs(tag_dir, 0), renames, journal, 0, 0)
+
+        renames, _ = rekey_plan(library_bibents(bib_dir), "InitialsShortYear", list_cks(bib_dir, False), 0)
+        assert renames == []
+
+
+class TestRekeyApply:
+    def test_renames_files_bibs_and_links(self, populated_library, tmp_path):
+        bib_dir, tag_dir = populated_library
+        with open(os.path.join(bib_dir, "BLS01.slides.pdf"), "wb") as f:
+            f.write(b"slides")
+
+        journal = str(tmp_path / "journal.json")
+        rekey_apply(bib_dir, SymlinkTagStore(tag_dir, bib_dir), find_tagged_pdfs(tag_dir, 0), [("BLS01", "BLS04"), ("KZG10", "KZG10a")], journal, 0, 0)
+
+        assert sorted(os.listdir(bib_dir)) == [
+            "BLS04.bib", "BLS04.pdf", "BLS04.slides.pdf",
+            "GMR85.bib", "GMR85.pdf",
+            "KZG10a.bib", "KZG10a.pdf",
+        ]
+        assert bibent_from_file(os.path.join(bib_dir, "BLS04.bib"))["ID"] == "BLS04"
+
+        tags = { ck: sorted(tags) for ck, tags in find_tagged_pdfs(tag_dir, 0).items() }
+        assert tags == {"BLS04": ["sigs", "sigs/bls"], "KZG10a": ["commitments"]}
+        link = os.path.join(tag_dir, "sigs", "BLS04.pdf")
+        assert os.readlink(link) == os.path.join(bib_dir, "BLS04.pdf")
+        assert os.path.exists(link)
+        assert not os.path.exists(journal)
+
+    def test_rolls_forward_after_crash(self, populated_library, tmp_path, monkeypatch):
+        bib_dir, tag_dir = populated_library
+        journal = str(tmp_path / "journal.json")
+        renames = [("BLS01", "BLS04"), ("GMR85", "GMR89"), ("KZG10", "KZG10a")]
+
+        from citationkeys import rekey
+        real_rekey_paper = rekey.rekey_paper
+
+        def crashing_rekey_paper(ck_bib_dir, tag_store, old_ck, new_ck, filenames, tags, verbosity):
+            if old_ck == "KZG10":
+                # Crash after renaming only some of the paper's files
+                os.rename(os.path.join(ck_bib_dir, "KZG10.pdf"), os.path.join(ck_bib_dir, "KZG10a.pdf"))
+                raise KeyboardInterrupt()
+            real_rekey_paper(ck_bib_dir, tag_store, old_ck, new_ck, filenames, tags, verbosity)
+
+        monkeypatch.setattr(rekey, "rekey_paper", crashing_rekey_paper)
+        with pytest.raises(KeyboardInterrupt):
+            rekey_apply(bib_dir, SymlinkTagStore(tag_dir, bib_dir), find_tagged_pdfs(tag_dir, 0), renames, journal, 0, 0)
+        monkeypatch.setattr(rekey, "rekey_paper", real_rekey_paper)
+
+        # The journal was not updated after every paper, so rolling forward re-applies some finished ones too
+        saved_renames, done = rekey_journal_load(journal)
+        assert saved_renames == renames
+        assert done == 0
+
+        rekey_apply(bib_dir, SymlinkTagStore(tag_dir, bib_dir), find_tagged_pdfs(tag_dir, 0), saved_renames, journal, done, 0)
+
+        assert sorted(list_cks(bib_dir, False)) == ["BLS04", "GMR89", "KZG10a"]
+        assert bibent_from_file(os.path.join(bib_dir, "KZG10a.bib"))["ID"] == "KZG10a"
+        assert os.path.exists(os.path.join(tag_dir, "commitments", "KZG10a.pdf"))
+        assert not os.path.lexists(os.path.join(tag_dir, "commitments", "KZG10.pdf"))
+        assert rekey_journal_load(journal) is None
+
+
+class TestRekeyJournal:
+    def test_roundtrip(self, tmp_path):
+        path = str(tmp_path / "journal.json")
+        assert rekey_journal_load(path) is None
+        rekey_journal_save(path, [("A", "B")], 0)
+        assert rekey_journal_load(path) == ([("A", "B")], 0)
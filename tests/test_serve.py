@@ -0,0 +1,136 @@
+"""Unit tests for citationkeys/serve.py"""
+
+import io
+import os
+import sys
+import threading
+
+import click
+import pytest
+
+from citationkeys.serve import (
+    SERVED_COMMANDS,
+    SERVE_DISABLE_ENV,
+    default_config_file,
+    recv_json,
+    send_json,
+    serve_capture_output,
+    serve_command_name,
+    serve_config_file,
+    serve_forward,
+    serve_listen,
+    serve_socket_path,
+)
+
+
+@pytest.fixture
+def runtime_dir(tmp_path, monkeypatch):
+    path = tmp_path / "run"
+    path.mkdir()
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(path))
+    monkeypatch.delenv(SERVE_DISABLE_ENV, raising=False)
+    return str(path)
+
+
+def start_server(path, respond):
+    """Serves one request with respond(request) on a background thread. Returns the thread and a list that will hold the request."""
+    sock = serve_listen(path)
+    requests = []
+
+    def run():
+        conn, _ = sock.accept()
+        with conn:
+            req = recv_json(conn)
+            requests.append(req)
+            send_json(conn, respond(req))
+        sock.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, requests
+
+
+class TestArgs:
+    def test_config_file(self):
+        assert serve_config_file(["-c", "my.config", "info", "KZG10"]) == "my.config"
+        assert serve_config_file(["-v", "--config-file=my.config", "bib"]) == "my.config"
+        assert serve_config_file(["info", "-c", "not-mine"]) == default_config_file()
+
+    def test_command_name(self):
+        assert serve_command_name(["-vv", "-c", "my.config", "l", "-t", "sigs"]) == "l"
+        assert serve_command_name(["--help"]) is None
+
+
+class TestServedCommands:
+    def test_no_command_that_prompts_or_touches_the_clipboard(self):
+        # 'ck bib' asks whether to create missing .bib files, and copies to the (server's) clipboard
+        assert "bib" not in SERVED_COMMANDS
+        assert "open" not in SERVED_COMMANDS
+
+
+class TestCaptureOutput:
+    def test_only_captures_the_calling_thread(self, monkeypatch):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        monkeypatch.setattr(sys, "stdout", stdout)
+        monkeypatch.setattr(sys, "stderr", stderr)
+
+        out, err = io.StringIO(), io.StringIO()
+        with serve_capture_output(out, err):
+            click.echo("served")
+            click.echo("served error", err=True)
+            # e.g., the watcher thread, while a request is being served
+            thread = threading.Thread(target=lambda: click.echo("watcher"))
+            thread.start()
+            thread.join()
+        click.echo("after")
+
+        assert out.getvalue() == "served\n"
+        assert err.getvalue() == "served error\n"
+        assert stdout.getvalue() == "watcher\nafter\n"
+        assert stderr.getvalue() == ""
+
+
+class TestForward:
+    def test_no_server(self, runtime_dir):
+        assert serve_forward(["-c", "ck.config", "info", "KZG10"]) is None
+
+    def test_roundtrip(self, runtime_dir, capsys):
+        path = serve_socket_path("ck.config")
+        thread, requests = start_server(path, lambda req: { "stdout": "out\n", "stderr": "err\n", "exit": 3 })
+
+        assert serve_forward(["-c", "ck.config", "info", "KZG10"]) == 3
+        thread.join()
+
+        assert requests[0]["argv"] == ["-c", "ck.config", "info", "KZG10"]
+        assert requests[0]["cwd"] == os.getcwd()
+        captured = capsys.readouterr()
+        assert captured.out == "out\n"
+        assert captured.err == "err\n"
+
+    def test_fallback(self, runtime_dir):
+        thread, _ = start_server(serve_socket_path("ck.config"), lambda req: { "fallback": True })
+        assert serve_forward(["-c", "ck.config", "add", "https://eprint.iacr.org/2020/1"]) is None
+        thread.join()
+
+    def test_disabled(self, runtime_dir, monkeypatch):
+        open(serve_socket_path("ck.config"), "w").close()
+        monkeypatch.setenv(SERVE_DISABLE_ENV, "1")
+        assert serve_forward(["-c", "ck.config", "info", "KZG10"]) is None
+
+
+class TestListen:
+    def test_replaces_stale_socket(self, runtime_dir):
+        path = serve_socket_path("ck.config")
+        serve_listen(path).close()
+        # The socket file is still there, but nobody is listening on it
+        assert os.path.exists(path)
+        serve_listen(path).close()
+
+    def test_refuses_to_steal_socket(self, runtime_dir):
+        path = serve_socket_path("ck.config")
+        sock = serve_listen(path)
+        try:
+            with pytest.raises(FileExistsError):
+                serve_listen(path)
+        finally:
+            sock.close()
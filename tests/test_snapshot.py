@@ -0,0 +1,172 @@
+"""Unit tests for citationkeys/snapshot.py"""
+
+import os
+
+import pytest
+
+from citationkeys import snapshot as snapshot_mod
+from citationkeys.misc import cks_to_papers
+from citationkeys.paper import dateadded_to_timestamp
+from citationkeys.snapshot import snapshot_load, snapshot_path, snapshot_update
+
+
+@pytest.fixture
+def no_racy_window(monkeypatch):
+    """Lets snapshot_update() trust the fingerprints of files written just now by the test."""
+    monkeypatch.setattr(snapshot_mod, "RACY_WINDOW_NS", -10**18)
+
+
+class TestSnapshotUpdate:
+    def test_contains_all_bibs(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.cks() == ["BLS01", "GMR85", "KZG10"]
+            with open(os.path.join(bib_dir, "KZG10.bib")) as f:
+                assert snap.get_bibtex("KZG10") == f.read()
+
+    def test_paper_fields(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            bck, fields = snap.get_paper_fields("BLS01")
+            assert bck == "BLS01"
+            assert fields[1] == "Short Signatures from the Weil Pairing"
+            assert fields[2] == "2001"
+            assert fields[5] == "Journal of Cryptology"
+
+    def test_papers_match_bib_files(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        cks = ["BLS01", "GMR85", "KZG10"]
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            from_snapshot = cks_to_papers(bib_dir, cks, 0, snap)
+        from_files = cks_to_papers(bib_dir, cks, 0)
+
+        attrs = ["ck", "author", "title", "year", "date", "url", "venue", "has_md"]
+        assert [[getattr(p, a) for a in attrs] for p in from_snapshot] == [[getattr(p, a) for a in attrs] for p in from_files]
+
+    def test_unchanged_files_are_not_reread(self, populated_library, cache_dir, no_racy_window, monkeypatch):
+        bib_dir, _ = populated_library
+        snapshot_update(bib_dir, cache_dir, 0).close()
+
+        def fail(data):
+            raise AssertionError("re-parsed an unchanged .bib file")
+        monkeypatch.setattr(snapshot_mod, "bibtex_to_snapshot_fields", fail)
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert len(snap) == 3
+
+    def test_picks_up_changes(self, populated_library, cache_dir, no_racy_window):
+        bib_dir, _ = populated_library
+        snapshot_update(bib_dir, cache_dir, 0).close()
+
+        path = os.path.join(bib_dir, "KZG10.bib")
+        with open(path, "a") as f:
+            f.write("\n% edited\n")
+        os.remove(os.path.join(bib_dir, "GMR85.bib"))
+        with open(os.path.join(bib_dir, "KZG10.md"), "w") as f:
+            f.write("notes")
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.cks() == ["BLS01", "KZG10"]
+            assert snap.get_bibtex("KZG10").endswith("% edited\n")
+            assert snap.has_md("KZG10")
+
+    def test_corrupted_snapshot_is_rebuilt(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with open(snapshot_path(cache_dir), "wb") as f:
+            f.write(b"garbage")
+        assert snapshot_load(snapshot_path(cache_dir)) is None
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert len(snap) == 3
+
+    def test_only_given_cks_are_looked_at(self, populated_library, cache_dir, monkeypatch):
+        bib_dir, _ = populated_library
+        snapshot_update(bib_dir, cache_dir, 0).close()
+
+        with open(os.path.join(bib_dir, "KZG10.bib"), "a") as f:
+            f.write("\n% edited\n")
+        os.remove(os.path.join(bib_dir, "GMR85.bib"))
+        with open(os.path.join(bib_dir, "NEW20.bib"), "w") as f:
+            f.write("@misc{NEW20, title = {New}}")
+
+        with snapshot_update(bib_dir, cache_dir, 0, cks=["GMR85", "NEW20"]) as snap:
+            assert snap.cks() == ["BLS01", "KZG10", "NEW20"]
+            # KZG10 was not in the list of changed CKs, so its entry was trusted
+            assert not snap.get_bibtex("KZG10").endswith("% edited\n")
+
+
+class TestSnapshotSearch:
+    def test_case_insensitive(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.search("weil pairing") == {"BLS01"}
+            assert snap.search("ASIACRYPT") == {"KZG10"}
+
+    def test_case_sensitive(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.search("weil pairing", case_sensitive=True) == set()
+            assert snap.search("Weil Pairing", case_sensitive=True) == {"BLS01"}
+
+    def test_multiple_matches(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.search("author") == {"BLS01", "GMR85", "KZG10"}
+
+    def test_match_cannot_straddle_entries(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        with open(os.path.join(bib_dir, "A.bib"), "w") as f:
+            f.write("@misc{A, title = {xy}}")
+        with open(os.path.join(bib_dir, "B.bib"), "w") as f:
+            f.write("@misc{B, title = {zw}}")
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.search("}}@misc") == set()
+
+    def test_non_ascii(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        with open(os.path.join(bib_dir, "E.bib"), "w", encoding="utf-8") as f:
+            f.write("@misc{E, author = {Érdős, Paul}}")
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.search("érdős") == {"E"}
+
+
+class TestDateIndex:
+    # KZG10 was added on 2024-01-15, BLS01 on 2024-02-20 and GMR85 on 2024-03-01
+    def test_added_between(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.cks_added_between() == ["KZG10", "BLS01", "GMR85"]
+            assert snap.cks_added_between(since=dateadded_to_timestamp("2024-02-01 00:00:00")) == ["BLS01", "GMR85"]
+            assert snap.cks_added_between(until=dateadded_to_timestamp("2024-02-20 14:00:00")) == ["KZG10", "BLS01"]
+            assert snap.cks_added_between(since=dateadded_to_timestamp("2024-04-01 00:00:00")) == []
+
+    def test_latest(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.latest_cks(2) == ["GMR85", "BLS01"]
+            assert snap.latest_cks(10) == ["GMR85", "BLS01", "KZG10"]
+            assert snap.latest_cks(1, ["KZG10", "BLS01"]) == ["BLS01"]
+            assert snap.date_added("KZG10") == dateadded_to_timestamp("2024-01-15 10:30:00")
+
+    def test_undated_papers_come_first(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        with open(os.path.join(bib_dir, "NEW20.bib"), "w") as f:
+            f.write("@misc{NEW20, title = {New}}")
+
+        with snapshot_update(bib_dir, cache_dir, 0) as snap:
+            assert snap.date_added("NEW20") == -1
+            assert snap.cks_added_between()[0] == "NEW20"
+            assert "NEW20" not in snap.cks_added_between(since=0)
+            assert snap.latest_cks(3) == ["GMR85", "BLS01", "KZG10"]
+
+    def test_kept_up_to_date(self, populated_library, cache_dir):
+        bib_dir, _ = populated_library
+        snapshot_update(bib_dir, cache_dir, 0).close()
+
+        with open(os.path.join(bib_dir, "NEW20.bib"), "w") as f:
+            f.write("@misc{NEW20, title = {New}, ckdateadded = {2024-05-01 00:00:00}}")
+
+        with snapshot_update(bib_dir, cache_dir, 0, cks=["NEW20"]) as snap:
+            assert snap.latest_cks(1) == ["NEW20"]
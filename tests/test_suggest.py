@@ -0,0 +1,128 @@
+"""Unit tests for citationkeys/suggest.py"""
+
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from citationkeys import suggest
+from citationkeys.suggest import (
+    TagSuggester,
+    TermMatcher,
+    pdf_extract_text,
+    pdf_text,
+    suggest_tags_for_pdf,
+    suggest_worker_init,
+)
+
+
+def make_pdf(path, content, compress=True):
+    """Writes a one-page PDF with the given content stream."""
+    stream = zlib.compress(content) if compress else content
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> /Contents 4 0 R >>",
+        (b"<< /Filter /FlateDecode" if compress else b"<<") + b" /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+    ]
+    pdf = b"%PDF-1.4\n"
+    for i, obj in enumerate(objs, 1):
+        pdf += str(i).encode() + b" 0 obj\n" + obj + b"\nendobj\n"
+    pdf += b"trailer\n<< /Root 1 0 R >>\n%%EOF\n"
+
+    with open(path, "wb") as f:
+        f.write(pdf)
+    return str(path)
+
+
+@pytest.fixture
+def no_pypdf(monkeypatch):
+    """Makes sure we test our own text extractor, even if pypdf is installed."""
+    monkeypatch.setattr(suggest, "pypdf", None)
+
+
+class TestPdfExtractText:
+    def test_tj_and_TJ(self, tmp_path, no_pypdf):
+        path = make_pdf(tmp_path / "p.pdf",
+            b"BT /F1 12 Tf 72 712 Td (Short Signatures from the Weil Pairing) Tj ET\n"
+            b"BT [(Merkle)-333(tr)20(ees and \\(nested\\) accum)10(ulators)] TJ ET")
+        text = pdf_extract_text(path)
+        assert "Short Signatures from the Weil Pairing" in text
+        assert "Merkle trees and (nested) accumulators" in text
+
+    def test_uncompressed_and_escapes(self, tmp_path, no_pypdf):
+        path = make_pdf(tmp_path / "p.pdf", b"BT (Hello\\040world) Tj ET", compress=False)
+        assert pdf_extract_text(path).strip() == "Hello world"
+
+    def test_not_a_pdf(self, tmp_path, no_pypdf):
+        path = tmp_path / "p.pdf"
+        path.write_bytes(b"%PDF-1.4 fake pdf content")
+        assert pdf_extract_text(str(path)) == ""
+
+
+class TestPdfText:
+    def test_cached_until_pdf_changes(self, tmp_path, no_pypdf, monkeypatch):
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        path = make_pdf(tmp_path / "KZG10.pdf", b"BT (polynomial commitments) Tj ET")
+        assert "polynomial commitments" in pdf_text(path, str(cache_dir))
+        assert os.path.exists(cache_dir / "pdf-text" / "KZG10.json")
+
+        monkeypatch.setattr(suggest, "pdf_extract_text", lambda p: pytest.fail("should have used the cache"))
+        assert "polynomial commitments" in pdf_text(path, str(cache_dir))
+
+        monkeypatch.undo()
+        make_pdf(tmp_path / "KZG10.pdf", b"BT (vector commitments, now with more text) Tj ET")
+        assert "vector commitments" in pdf_text(path, str(cache_dir))
+
+
+class TestTermMatcher:
+    def test_counts_all_terms_in_one_pass(self):
+        matcher = TermMatcher(["merkle", "accumulators", "he", "she", "hers", "zero-knowledge"])
+        counts = matcher.count("She said: hers, not his. He knows Merkle. Zero-knowledge (zero knowledge) accumulators!")
+        assert counts == {"she": 1, "hers": 1, "he": 1, "merkle": 1, "zero knowledge": 2, "accumulators": 1}
+
+    def test_word_boundaries_and_plurals(self):
+        matcher = TermMatcher(["commitment", "hash", "acc"])
+        counts = matcher.count("commitments commitment commitmentx precommitment hashes account acc")
+        assert counts == {"commitment": 2, "hash": 1, "acc": 1}
+
+    def test_no_terms(self):
+        assert TermMatcher([]).count("anything") == {}
+
+
+class TestTagSuggester:
+    TAGS = ["accumulators", "accumulators/merkle", "accumulators/rsa", "sigs", "sigs/bls", "zkps"]
+
+    def test_ranked_by_hits(self):
+        suggester = TagSuggester(self.TAGS)
+        text = "Merkle accumulators. Merkle trees. Merkle proofs. We compare to BLS sigs. Accumulators again."
+        assert suggester.suggest(text) == ["accumulators/merkle", "accumulators", "sigs/bls", "sigs"]
+
+    def test_subtag_needs_its_last_component(self):
+        suggester = TagSuggester(self.TAGS)
+        assert suggester.suggest("many accumulators, and RSA") == ["accumulators/rsa", "accumulators"]
+        assert suggester.suggest("RSA, RSA and RSA, and accumulators") == ["accumulators/rsa", "accumulators"]
+        assert "accumulators/rsa" not in suggester.suggest("many accumulators")
+
+    def test_limit(self):
+        suggester = TagSuggester(self.TAGS)
+        assert len(suggester.suggest("accumulators merkle rsa sigs bls zkps", limit=2)) == 2
+        assert suggester.suggest("nothing relevant") == []
+
+
+class TestSuggestWorkers:
+    def test_suggests_in_worker_processes(self, tmp_path, no_pypdf):
+        cache_dir = str(tmp_path / "cache")
+        pdfs = [
+            make_pdf(tmp_path / "A.pdf", b"BT (Merkle accumulators) Tj ET"),
+            make_pdf(tmp_path / "B.pdf", b"BT (BLS sigs) Tj ET"),
+        ]
+
+        with ProcessPoolExecutor(max_workers=2, initializer=suggest_worker_init, initargs=(TestTagSuggester.TAGS,)) as executor:
+            futures = [executor.submit(suggest_tags_for_pdf, pdf, cache_dir) for pdf in pdfs]
+            assert [f.result() for f in futures] == [["accumulators/merkle", "accumulators"], ["sigs/bls", "sigs"]]
+
+        # The workers cached the text, so tagging the paper does not extract it again
+        assert os.path.exists(os.path.join(cache_dir, suggest.PDF_TEXT_DIRNAME, "A.json"))
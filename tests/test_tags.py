@@ -8,9 +8,14 @@ from citationkeys.tags import (
     find_tagged_pdfs,
     find_untagged_pdfs,
     get_all_tags,
+    tag_merge,
+    tag_move,
     tag_paper,
     untag_paper,
     parse_tags,
+    relink_tags,
+    SimpleCompleter,
+    tag_popularity,
     tags_filter_whitespace,
 )
 
@@ -163,3 +168,175 @@ class TestParseTags:
 class TestTagsFilterWhitespace:
     def test_strips_and_filters(self):
         assert tags_filter_whitespace(["  a  ", "", "  ", "b"]) == ["a", "b"]
+
+
+class TestTagMove:
+    def test_rename(self, populated_library):
+        _, tag_dir = populated_library
+        assert tag_move(tag_dir, "sigs", "signatures") == (2, 0)
+        assert not os.path.exists(os.path.join(tag_dir, "sigs"))
+        tags = find_tagged_pdfs(tag_dir, 0)
+        assert sorted(tags["BLS01"]) == ["signatures", "signatures/bls"]
+
+    def test_move_to_other_depth_keeps_relative_links(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        open(os.path.join(bib_dir, "A.pdf"), "w").close()
+        os.makedirs(os.path.join(tag_dir, "a", "b"))
+        link = os.path.join(tag_dir, "a", "b", "A.pdf")
+        os.symlink(os.path.relpath(os.path.join(bib_dir, "A.pdf"), os.path.dirname(link)), link)
+
+        tag_move(tag_dir, "a/b", "c")
+        assert os.path.exists(os.path.join(tag_dir, "c", "A.pdf"))
+        assert not os.path.isabs(os.readlink(os.path.join(tag_dir, "c", "A.pdf")))
+
+    def test_move_into_existing_merges(self, populated_library):
+        _, tag_dir = populated_library
+        assert tag_move(tag_dir, "commitments", "sigs") == (1, 0)
+        assert sorted(os.listdir(os.path.join(tag_dir, "sigs"))) == ["BLS01.pdf", "KZG10.pdf", "bls"]
+
+    def test_move_inside_itself(self, populated_library):
+        _, tag_dir = populated_library
+        with pytest.raises(ValueError):
+            tag_move(tag_dir, "sigs", "sigs/bls/new")
+
+    def test_missing_tag(self, populated_library):
+        _, tag_dir = populated_library
+        with pytest.raises(ValueError):
+            tag_move(tag_dir, "nope", "other")
+
+
+class TestTagMerge:
+    def test_only_differing_links_move(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        tag_paper(tag_dir, bib_dir, "BLS01", "commitments")
+        assert tag_merge(tag_dir, "sigs", "commitments") == (1, 1)
+        assert not os.path.exists(os.path.join(tag_dir, "sigs"))
+        tags = find_tagged_pdfs(tag_dir, 0)
+        assert sorted(tags["BLS01"]) == ["commitments", "commitments/bls"]
+
+    def test_subtag_into_parent(self, populated_library):
+        _, tag_dir = populated_library
+        assert tag_merge(tag_dir, "sigs/bls", "sigs") == (0, 1)
+        assert get_all_tags(tag_dir) == ["commitments", "sigs"]
+
+    def test_parent_into_subtag(self, populated_library):
+        _, tag_dir = populated_library
+        with pytest.raises(ValueError):
+            tag_merge(tag_dir, "sigs", "sigs/bls")
+
+
+class TestRelativeLinks:
+    def test_tag_relative(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        open(os.path.join(bib_dir, "A.pdf"), "w").close()
+        assert tag_paper(tag_dir, bib_dir, "A", "x/y", relative=True)
+        link = os.path.join(tag_dir, "x", "y", "A.pdf")
+        assert not os.path.isabs(os.readlink(link))
+        assert os.path.samefile(link, os.path.join(bib_dir, "A.pdf"))
+
+    def test_relink_to_relative_and_back(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        assert relink_tags(tag_dir, bib_dir, True) == (3, 0, [])
+        link = os.path.join(tag_dir, "sigs", "bls", "BLS01.pdf")
+        assert os.readlink(link) == os.path.join("..", "..", "..", "papers", "BLS01.pdf")
+        assert relink_tags(tag_dir, bib_dir, True) == (0, 3, [])
+
+        assert relink_tags(tag_dir, bib_dir, False) == (3, 0, [])
+        assert os.readlink(link) == os.path.join(bib_dir, "BLS01.pdf")
+
+    def test_relink_onto_new_bib_dir(self, populated_library, tmp_path):
+        bib_dir, tag_dir = populated_library
+        new_bib_dir = str(tmp_path / "moved")
+        os.rename(bib_dir, new_bib_dir)
+        link = os.path.join(tag_dir, "commitments", "KZG10.pdf")
+        assert not os.path.exists(link)
+
+        assert relink_tags(tag_dir, new_bib_dir, False) == (3, 0, [])
+        assert os.path.exists(link)
+
+    def test_dry_run_and_missing(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        os.remove(os.path.join(bib_dir, "KZG10.pdf"))
+        num_relinked, _, missing = relink_tags(tag_dir, bib_dir, True, dry_run=True)
+        assert num_relinked == 3
+        assert missing == [os.path.join(tag_dir, "commitments", "KZG10.pdf")]
+        assert os.path.isabs(os.readlink(os.path.join(tag_dir, "sigs", "BLS01.pdf")))
+
+    def test_relink_skips_other_links(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        notes = os.path.join(tag_dir, "sigs", "notes.txt")
+        os.symlink("/nowhere/notes.txt", notes)
+        stale = os.path.join(tag_dir, "sigs", ".BLS01.pdf.relink")
+        os.symlink("/nowhere/BLS01.pdf", stale)
+
+        assert relink_tags(tag_dir, bib_dir, True, dry_run=True) == (3, 0, [])
+        assert os.path.lexists(stale)
+        assert relink_tags(tag_dir, bib_dir, True) == (3, 0, [])
+        assert os.readlink(notes) == "/nowhere/notes.txt"
+        assert not os.path.lexists(stale)
+        assert sorted(os.listdir(os.path.join(tag_dir, "sigs"))) == ["BLS01.pdf", "bls", "notes.txt"]
+
+
+class TestSimpleCompleter:
+    TAGS = ["commitments", "encryption", "encryption/abe", "encryption/fhe", "sigs", "sigs/bls", "sigs/schnorr",
+            "sigs/threshold", "sigs/threshold/frost", "zkproofs"]
+
+    def all_completions(self, completer, text):
+        completions = []
+        while True:
+            c = completer.complete(text, len(completions))
+            if c is None:
+                return completions
+            completions.append(c)
+
+    def test_flat_prefix(self):
+        completer = SimpleCompleter(["KZG10", "KZG10e", "BLS01"], ',')
+        assert self.all_completions(completer, "KZG") == ["KZG10", "KZG10e"]
+        assert self.all_completions(completer, "") == ["BLS01", "KZG10", "KZG10e"]
+        assert self.all_completions(completer, "XYZ") == []
+
+    def test_segments(self):
+        completer = SimpleCompleter(self.TAGS, ',', separator='/')
+        assert sorted(self.all_completions(completer, "")) == ["commitments", "encryption/", "sigs/", "zkproofs"]
+        assert sorted(self.all_completions(completer, "sigs/")) == ["sigs/bls", "sigs/schnorr", "sigs/threshold/"]
+        assert self.all_completions(completer, "sigs/threshold/") == ["sigs/threshold/frost"]
+
+    def test_single_segment_expands(self):
+        completer = SimpleCompleter(self.TAGS, ',', separator='/')
+        completions = self.all_completions(completer, "enc")
+        assert completions[0] == "encryption/"
+        assert sorted(completions[1:]) == ["encryption/abe", "encryption/fhe"]
+
+    def test_ranked_by_popularity(self):
+        popularity = { "sigs/schnorr": 5, "sigs/bls": 2, "zkproofs": 1, "sigs/threshold/frost": 1 }
+        completer = SimpleCompleter(self.TAGS, ',', popularity, separator='/')
+        assert self.all_completions(completer, "sigs/") == ["sigs/schnorr", "sigs/bls", "sigs/threshold/"]
+        # 'sigs/' counts the papers in all of its subtags
+        assert self.all_completions(completer, "")[0] == "sigs/"
+
+    def test_fuzzy(self):
+        completer = SimpleCompleter(self.TAGS, ',', separator='/', fuzzy=True)
+        assert self.all_completions(completer, "frost") == ["sigs/threshold/frost"]
+        assert self.all_completions(completer, "thfr") == ["sigs/threshold/frost"]
+        assert sorted(self.all_completions(completer, "abe")) == ["encryption/abe"]
+        assert self.all_completions(completer, "xyz") == []
+
+        completer = SimpleCompleter(self.TAGS, ',', separator='/')
+        assert self.all_completions(completer, "frost") == []
+
+    def test_add(self):
+        completer = SimpleCompleter(self.TAGS, ',', separator='/')
+        completer.add("sigs/aggregate", 1)
+        assert self.all_completions(completer, "sigs/a") == ["sigs/aggregate"]
+        assert completer.options == sorted(self.TAGS + ["sigs/aggregate"])
+
+        completer.add("sigs/aggregate", 1)
+        assert completer.options.count("sigs/aggregate") == 1
+        assert completer.popularity["sigs/aggregate"] == 2
+        assert completer.popularity["sigs/"] == 2
+
+
+class TestTagPopularity:
+    def test_counts_papers(self):
+        assert tag_popularity({ "BLS01": ["sigs", "sigs/bls"], "KZG10": ["commitments"], "BB04": ["sigs"] }) == \
+            { "sigs": 2, "sigs/bls": 1, "commitments": 1 }
@@ -0,0 +1,162 @@
+"""Unit tests for citationkeys/tagstore.py"""
+
+import os
+
+import pytest
+
+from citationkeys import tagstore
+from citationkeys.tags import find_tagged_pdfs
+from citationkeys.tagstore import (
+    ManifestTagStore,
+    SymlinkTagStore,
+    TagStore,
+    tag_manifest_path,
+    tag_store_migrate,
+    tag_store_open,
+)
+
+
+@pytest.fixture
+def manifest_store(ck_dirs):
+    bib_dir, tag_dir = ck_dirs
+    return ManifestTagStore(tag_manifest_path(tag_dir), bib_dir)
+
+
+def reopen(store):
+    return ManifestTagStore(store.path, store.ck_bib_dir)
+
+
+class TestTagStore:
+    def test_incomplete_store_cannot_be_created(self):
+        class IncompleteTagStore(TagStore):
+            def tags(self):
+                return []
+
+        with pytest.raises(TypeError):
+            IncompleteTagStore()
+
+
+class TestManifestTagStore:
+    def test_empty(self, manifest_store):
+        assert manifest_store.tags() == []
+        assert manifest_store.ck_tags() == {}
+
+    def test_tag_and_reload(self, manifest_store):
+        assert manifest_store.tag("BLS01", "sigs/bls")
+        assert not manifest_store.tag("BLS01", "sigs/bls")
+        assert manifest_store.tag("KZG10", "commitments")
+
+        store = reopen(manifest_store)
+        assert store.tags() == ["commitments", "sigs", "sigs/bls"]
+        assert store.ck_tags() == {"BLS01": ["sigs/bls"], "KZG10": ["commitments"]}
+
+    def test_untag(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs")
+        manifest_store.tag("BLS01", "pairings")
+        assert manifest_store.untag("BLS01", "sigs")
+        assert not manifest_store.untag("BLS01", "sigs")
+        assert reopen(manifest_store).ck_tags() == {"BLS01": ["pairings"]}
+
+        assert manifest_store.untag("BLS01")
+        assert reopen(manifest_store).ck_tags() == {}
+        # Tags outlive their papers, like empty tag directories do
+        assert reopen(manifest_store).tags() == ["pairings", "sigs"]
+
+    def test_cks_with_tags(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs/bls")
+        manifest_store.tag("GMR85", "sigs")
+        assert manifest_store.cks_with_tags(["sigs"]) == {"BLS01", "GMR85"}
+        assert manifest_store.cks_with_tags(["sigs"], recursive=False) == {"GMR85"}
+
+    def test_move_and_merge(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs/bls")
+        manifest_store.tag("BLS01", "crypto")
+        manifest_store.tag("GMR85", "sigs")
+        assert manifest_store.move_tag("sigs", "crypto/sigs") == (2, 0)
+        assert manifest_store.merge_tag("crypto/sigs/bls", "crypto") == (0, 1)
+
+        store = reopen(manifest_store)
+        assert store.tags() == ["crypto", "crypto/sigs"]
+        assert store.ck_tags() == {"BLS01": ["crypto"], "GMR85": ["crypto/sigs"]}
+
+        with pytest.raises(ValueError):
+            store.move_tag("crypto", "crypto/inside")
+
+    def test_remove_tag_and_rename_ck(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs/bls")
+        manifest_store.tag("BLS01", "pairings")
+        manifest_store.remove_tag("sigs")
+        manifest_store.rename_ck("BLS01", "BLS04", ["pairings"])
+        store = reopen(manifest_store)
+        assert store.tags() == ["pairings"]
+        assert store.ck_tags() == {"BLS04": ["pairings"]}
+
+    def test_ignores_truncated_last_line(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs")
+        with open(manifest_store.path, "a") as f:
+            f.write("+\tKZG10\tcommit")
+        assert reopen(manifest_store).ck_tags() == {"BLS01": ["sigs"]}
+
+    def test_compaction(self, manifest_store, monkeypatch):
+        monkeypatch.setattr(tagstore, "TAG_MANIFEST_COMPACT_MIN", 8)
+        for _ in range(10):
+            manifest_store.tag("BLS01", "sigs")
+            manifest_store.untag("BLS01", "sigs")
+        manifest_store.tag("BLS01", "sigs")
+
+        with open(manifest_store.path) as f:
+            assert len(f.read().splitlines()) < 8
+        assert reopen(manifest_store).ck_tags() == {"BLS01": ["sigs"]}
+
+    def test_compaction_keeps_other_stores_operations(self, manifest_store):
+        manifest_store.tag("BLS01", "sigs")
+        other = reopen(manifest_store)
+        manifest_store.tag("KZG10", "commitments")
+        other.tag("GMR85", "zkproofs")
+        other.untag("BLS01", "sigs")
+
+        manifest_store.compact()
+        assert manifest_store.ck_tags() == {"GMR85": ["zkproofs"], "KZG10": ["commitments"]}
+        other.tag("GMR85", "sigs")
+        assert reopen(manifest_store).ck_tags() == {"GMR85": ["sigs", "zkproofs"], "KZG10": ["commitments"]}
+
+    def test_not_a_manifest(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        with open(tag_manifest_path(tag_dir), "w") as f:
+            f.write("garbage\n")
+        with pytest.raises(ValueError):
+            ManifestTagStore(tag_manifest_path(tag_dir), bib_dir)
+
+    def test_symlink_view(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        store = tag_store_open("manifest", tag_dir, bib_dir, symlink_view=True)
+        store.tag("GMR85", "sigs")
+        store.untag("BLS01", "sigs/bls")
+        assert os.path.islink(os.path.join(tag_dir, "sigs", "GMR85.pdf"))
+        assert not os.path.lexists(os.path.join(tag_dir, "sigs", "bls", "BLS01.pdf"))
+
+
+class TestTagStoreMigrate:
+    def test_symlinks_to_manifest_and_back(self, populated_library, tmp_path):
+        bib_dir, tag_dir = populated_library
+        symlinks = SymlinkTagStore(tag_dir, bib_dir)
+        expected = { ck: sorted(tags) for ck, tags in find_tagged_pdfs(tag_dir, 0).items() }
+
+        manifest = tag_store_open("manifest", tag_dir, bib_dir)
+        assert tag_store_migrate(symlinks, manifest) == 3
+        manifest = reopen(manifest)
+        assert { ck: sorted(tags) for ck, tags in manifest.ck_tags().items() } == expected
+        assert manifest.tags() == symlinks.tags()
+
+        new_tag_dir = str(tmp_path / "newtags")
+        os.makedirs(new_tag_dir)
+        assert tag_store_migrate(manifest, SymlinkTagStore(new_tag_dir, bib_dir)) == 3
+        assert { ck: sorted(tags) for ck, tags in find_tagged_pdfs(new_tag_dir, 0).items() } == expected
+
+    def test_sync_view(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        store = tag_store_open("manifest", tag_dir, bib_dir, symlink_view=True)
+        # The manifest does not exist yet, so the view has 3 symlinks too many
+        store._apply(("+", "GMR85", "sigs"))
+        assert store.sync_view() == (1, 3)
+        assert find_tagged_pdfs(tag_dir, 0) == {"GMR85": ["sigs"]}
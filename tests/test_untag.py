@@ -0,0 +1,29 @@
+"""Tests for 'ck untag', which run the ck script in a subprocess on a temporary library."""
+
+import os
+
+import click
+import pytest
+
+pytest.importorskip("numpy")
+
+
+def add_paper(bib_dir, ck, title):
+    with open(os.path.join(bib_dir, ck + ".bib"), "w") as f:
+        f.write("@article{" + ck + ",\n  title = {" + title + "},\n  year = {2020},\n}")
+    with open(os.path.join(bib_dir, ck + ".pdf"), "wb") as f:
+        f.write(b"%PDF-1.4 fake pdf content for " + ck.encode())
+
+
+class TestUntag:
+    def test_suggests_tags_given_earlier_in_the_session(self, populated_library, run_ck):
+        bib_dir, _ = populated_library
+        add_paper(bib_dir, "P1", "Verifiable delay functions")
+        add_paper(bib_dir, "P2", "Efficient verifiable delay functions")
+
+        # Prompts for the untagged GMR85, P1 and P2, in that order
+        result = run_ck("untag", "-j", "1", input="zk\nvdfs\nmore\n")
+        assert result.returncode == 0, result.stderr
+
+        p2 = click.unstyle(result.stdout[result.stdout.index("Added 'vdfs' tag"):])
+        assert "Tags of similar papers: #vdfs" in p2
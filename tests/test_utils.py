@@ -0,0 +1,28 @@
+"""Unit tests for citationkeys/utils.py"""
+
+import os
+import stat
+
+from citationkeys.utils import bytes_to_file_atomic, string_to_file_atomic
+
+
+class TestAtomicWrite:
+    def test_creates_file(self, tmp_path):
+        path = str(tmp_path / "X.bib")
+        string_to_file_atomic("hello", path)
+        with open(path) as f:
+            assert f.read() == "hello"
+
+    def test_overwrites_and_keeps_mode(self, tmp_path):
+        path = str(tmp_path / "X.bib")
+        with open(path, "w") as f:
+            f.write("old")
+        os.chmod(path, 0o640)
+        bytes_to_file_atomic(b"new", path)
+        with open(path, "rb") as f:
+            assert f.read() == b"new"
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+    def test_no_temporary_files_left(self, tmp_path):
+        string_to_file_atomic("hello", str(tmp_path / "X.bib"))
+        assert os.listdir(str(tmp_path)) == ["X.bib"]
@@ -0,0 +1,155 @@
+"""Unit tests for citationkeys/vectors.py"""
+
+import json
+import os
+
+import pytest
+
+from citationkeys.snapshot import snapshot_update
+from citationkeys.suggest import PDF_TEXT_DIRNAME
+from citationkeys.vectors import (
+    bibtex_field,
+    vector_terms,
+    vectors_index_load,
+    vectors_index_path,
+    vectors_index_update,
+)
+
+np = pytest.importorskip("numpy")
+
+
+def write_bib(bib_dir, ck, title, abstract=None):
+    bibtex = "@article{" + ck + ",\n  title = {" + title + "},\n  year = {2020},\n"
+    if abstract is not None:
+        bibtex += "  abstract = {" + abstract + "},\n"
+    with open(os.path.join(bib_dir, ck + ".bib"), "w") as f:
+        f.write(bibtex + "}")
+
+
+def write_pdf_text(cache_dir, ck, text):
+    os.makedirs(os.path.join(cache_dir, PDF_TEXT_DIRNAME), exist_ok=True)
+    with open(os.path.join(cache_dir, PDF_TEXT_DIRNAME, ck + ".json"), "w") as f:
+        json.dump({"fingerprint": [0, 0], "text": text}, f)
+
+
+def update(bib_dir, cache_dir, verbosity=0):
+    with snapshot_update(bib_dir, cache_dir, 0) as snap:
+        return vectors_index_update(cache_dir, snap, verbosity)
+
+
+class TestBibtexField:
+    def test_braces(self):
+        bibtex = "@article{A,\n  title = {On {BLS} Signatures},\n  abstract = {We {study} them.},\n}"
+        assert bibtex_field(bibtex, "abstract") == "We {study} them."
+        assert bibtex_field(bibtex, "title") == "On {BLS} Signatures"
+
+    def test_quotes_and_bare(self):
+        bibtex = '@article{A,\n  Abstract = "Short {"}quoted{"} text",\n  year = 2010\n}'
+        assert bibtex_field(bibtex, "abstract") == 'Short {"}quoted{"} text'
+        assert bibtex_field(bibtex, "year") == "2010"
+
+    def test_missing(self):
+        assert bibtex_field("@article{A,\n  title = {T},\n}", "abstract") is None
+
+
+class TestVectorTerms:
+    def test_normalizes_and_drops_stop_words(self):
+        assert vector_terms("The Schnörr signatures of a BLS-based scheme, in 2010") == ["schnorr", "signatures", "bls", "based", "scheme"]
+
+
+class TestVectorIndex:
+    def test_update_is_incremental(self, ck_dirs, cache_dir, capsys):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Pairing-based signatures")
+        write_bib(bib_dir, "B", "Polynomial commitments")
+        update(bib_dir, cache_dir, 1)
+        assert "2 of 2 papers re-read" in capsys.readouterr().out
+
+        write_bib(bib_dir, "C", "Vector commitments")
+        index = update(bib_dir, cache_dir, 1)
+        assert "1 of 3 papers re-read" in capsys.readouterr().out
+        assert index.row("A") == {"pairing": 1, "based": 1, "signatures": 1}
+        assert index.row("C") == {"vector": 1, "commitments": 1}
+
+        assert update(bib_dir, cache_dir, 1) is not None
+        assert "re-read" not in capsys.readouterr().out
+
+    def test_removed_papers_terms_are_dropped(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Pairing-based signatures")
+        write_bib(bib_dir, "B", "Polynomial commitments")
+        update(bib_dir, cache_dir)
+
+        os.remove(os.path.join(bib_dir, "B.bib"))
+        index = update(bib_dir, cache_dir)
+        assert index.cks == ["A"]
+        assert sorted(index.terms) == ["based", "pairing", "signatures"]
+        assert vectors_index_load(vectors_index_path(cache_dir)).row("A") == index.row("A")
+
+    def test_uses_abstract_and_pdf_text(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Signatures", abstract="Aggregation of signatures")
+        write_pdf_text(cache_dir, "A", "pairing pairing threshold")
+        assert update(bib_dir, cache_dir).row("A") == {"signatures": 2, "aggregation": 1, "pairing": 2, "threshold": 1}
+
+    def test_pdf_text_changed(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Signatures")
+        write_bib(bib_dir, "B", "Commitments")
+        index = update(bib_dir, cache_dir)
+        assert not index.pdf_text_changed("A", cache_dir)
+
+        write_pdf_text(cache_dir, "A", "pairing")
+        assert index.pdf_text_changed("A", cache_dir)
+        assert not index.pdf_text_changed("B", cache_dir)
+        assert not index.pdf_text_changed("missing", cache_dir)
+
+        index = update(bib_dir, cache_dir)
+        assert not index.pdf_text_changed("A", cache_dir)
+        assert index.row("A") == {"signatures": 1, "pairing": 1}
+
+    def test_nearest(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Threshold pairing signatures")
+        write_bib(bib_dir, "B", "Aggregate pairing signatures")
+        write_bib(bib_dir, "C", "Polynomial commitments")
+        index = update(bib_dir, cache_dir)
+
+        assert [ck for ck, _ in index.nearest(index.vector("A"), 10)] == ["A", "B"]
+        assert [ck for ck, _ in index.nearest(index.vector("A"), 10, exclude=("A",))] == ["B"]
+        assert index.nearest(index.vector("A"), 10, cks=["C"]) == []
+        assert index.nearest(index.text_vector("commitments to polynomials"), 1)[0][0] == "C"
+
+        sims = index.similarities(index.vector("A"))
+        assert sims[0] == pytest.approx(1)
+
+    def test_nearest_limit(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        for i, title in enumerate(["Pairing signatures", "Pairing signatures and more", "Signatures", "Pairing", "Lattices"]):
+            write_bib(bib_dir, "P" + str(i), title)
+        index = update(bib_dir, cache_dir)
+
+        related = index.nearest(index.vector("P0"), 2, exclude=("P0",))
+        # 'P2' and 'P3' are equally similar to 'P0', so ties are broken by CK
+        assert [ck for ck, _ in related] == ["P1", "P2"]
+        assert related[0][1] > related[1][1]
+        assert len(index.nearest(index.vector("P0"), 10, exclude=("P0",))) == 3
+
+    def test_suggest_tags(self, ck_dirs, cache_dir):
+        bib_dir, _ = ck_dirs
+        write_bib(bib_dir, "A", "Threshold pairing signatures")
+        write_bib(bib_dir, "B", "Aggregate pairing signatures")
+        write_bib(bib_dir, "C", "Polynomial commitments")
+        write_bib(bib_dir, "D", "Pairing-based polynomial commitments")
+        index = update(bib_dir, cache_dir)
+
+        ck_tags = {"B": ["sigs", "pairings"], "C": ["commitments"], "D": ["commitments", "pairings"]}
+        assert index.suggest_tags("A", ck_tags, 10) == ["pairings", "sigs", "commitments"]
+        assert index.suggest_tags("A", ck_tags, 1) == ["pairings"]
+        assert index.suggest_tags("missing", ck_tags, 10) == []
+
+    def test_load_corrupted(self, cache_dir):
+        path = vectors_index_path(cache_dir)
+        with open(path, "wb") as f:
+            f.write(b"CKVECS1\ngarbage")
+        assert vectors_index_load(path) is None
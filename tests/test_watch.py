@@ -0,0 +1,158 @@
+"""Unit tests for citationkeys/watch.py"""
+
+import os
+
+import pytest
+
+from citationkeys.tags import find_tagged_pdfs, tag_paper, untag_paper
+from citationkeys.watch import (
+    RESCAN,
+    InotifyWatcher,
+    PollingWatcher,
+    inotify_available,
+    split_changes,
+    tag_index_load,
+    tag_index_save,
+    tag_index_update,
+    watch_batches,
+    watch_is_running,
+    watch_pid_lock,
+    watch_pid_path,
+    watch_pid_unlock,
+)
+
+
+class FakeWatcher:
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def wait(self, timeout):
+        if len(self.changes) == 0:
+            raise KeyboardInterrupt()
+        return self.changes.pop(0)
+
+
+def collect_batches(changes):
+    batches = []
+    try:
+        for batch in watch_batches(FakeWatcher(changes), 0.1, 60):
+            batches.append(batch)
+    except KeyboardInterrupt:
+        pass
+    return batches
+
+
+class TestWatchBatches:
+    def test_debounces_bursts(self):
+        batches = collect_batches([["a"], ["b"], ["a", "c"], [], [], ["d"], []])
+        assert batches == [{"a", "b", "c"}, {"d"}]
+
+    def test_rescan_wins(self):
+        assert collect_batches([["a"], RESCAN, ["b"], []]) == [RESCAN]
+
+
+class TestSplitChanges:
+    def test_split(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        paths = [
+            os.path.join(bib_dir, "KZG10.bib"),
+            os.path.join(bib_dir, "KZG10.pdf"),
+            os.path.join(bib_dir, "BLS01.md"),
+            os.path.join(bib_dir, "BLS01.slides.bib"),
+            os.path.join(tag_dir, "sigs", "BLS01.pdf"),
+        ]
+        assert split_changes(bib_dir, tag_dir, paths) == ({"KZG10", "BLS01"}, [os.path.join(tag_dir, "sigs", "BLS01.pdf")])
+
+
+class TestTagIndex:
+    def test_save_and_load(self, tmp_path):
+        assert tag_index_load(str(tmp_path)) is None
+        tag_index_save(str(tmp_path), {"BLS01": ["sigs"]})
+        assert tag_index_load(str(tmp_path)) == {"BLS01": ["sigs"]}
+
+    def test_update_links(self, populated_library):
+        bib_dir, tag_dir = populated_library
+        ck_tags = find_tagged_pdfs(tag_dir, 0)
+
+        tag_paper(tag_dir, bib_dir, "GMR85", "sigs")
+        untag_paper(tag_dir, "KZG10", "commitments")
+        paths = [os.path.join(tag_dir, "sigs", "GMR85.pdf"), os.path.join(tag_dir, "commitments", "KZG10.pdf")]
+
+        assert tag_index_update(tag_dir, ck_tags, paths)
+        assert ck_tags == find_tagged_pdfs(tag_dir, 0)
+
+    def test_directory_changes_need_rebuild(self, populated_library):
+        _, tag_dir = populated_library
+        ck_tags = find_tagged_pdfs(tag_dir, 0)
+        os.rename(os.path.join(tag_dir, "sigs"), os.path.join(tag_dir, "signatures"))
+        paths = [os.path.join(tag_dir, "sigs"), os.path.join(tag_dir, "signatures")]
+        assert not tag_index_update(tag_dir, ck_tags, paths)
+
+
+class TestWatchers:
+    def test_polling(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        os.makedirs(os.path.join(tag_dir, "sigs"))
+        watcher = PollingWatcher(interval=0)
+        watcher.add(bib_dir)
+        watcher.add(tag_dir, recursive=True)
+        assert watcher.wait(0) == []
+
+        with open(os.path.join(bib_dir, "A.bib"), "w") as f:
+            f.write("@misc{A}")
+        os.symlink(os.path.join(bib_dir, "A.pdf"), os.path.join(tag_dir, "sigs", "A.pdf"))
+        changes = watcher.wait(0)
+        assert os.path.join(bib_dir, "A.bib") in changes
+        assert os.path.join(tag_dir, "sigs", "A.pdf") in changes
+
+    @pytest.mark.skipif(not inotify_available(), reason="inotify is only available on Linux")
+    def test_inotify(self, ck_dirs):
+        bib_dir, tag_dir = ck_dirs
+        watcher = InotifyWatcher()
+        try:
+            watcher.add(bib_dir)
+            watcher.add(tag_dir, recursive=True)
+
+            with open(os.path.join(bib_dir, "A.bib"), "w") as f:
+                f.write("@misc{A}")
+            assert os.path.join(bib_dir, "A.bib") in watcher.wait(1)
+
+            # Links created in new tag directories are picked up too
+            os.makedirs(os.path.join(tag_dir, "sigs"))
+            os.symlink(os.path.join(bib_dir, "A.pdf"), os.path.join(tag_dir, "sigs", "A.pdf"))
+            changes = []
+            while True:
+                batch = watcher.wait(0.2)
+                if len(batch) == 0:
+                    break
+                changes.extend(batch)
+            assert os.path.join(tag_dir, "sigs", "A.pdf") in changes
+        finally:
+            watcher.close()
+
+
+class TestWatchIsRunning:
+    def test_running(self, tmp_path):
+        assert not watch_is_running(str(tmp_path))
+        fd = watch_pid_lock(str(tmp_path))
+        assert watch_is_running(str(tmp_path))
+        assert watch_pid_lock(str(tmp_path)) is None
+
+        watch_pid_unlock(str(tmp_path), fd)
+        assert not os.path.exists(watch_pid_path(str(tmp_path)))
+        assert not watch_is_running(str(tmp_path))
+
+    def test_pid_reused(self, tmp_path):
+        # A watcher that was killed leaves its PID file behind, whose PID now belongs to some other (live) process
+        with open(watch_pid_path(str(tmp_path)), "w") as f:
+            f.write(str(os.getpid()))
+        assert not watch_is_running(str(tmp_path))
+
+        fd = watch_pid_lock(str(tmp_path))
+        assert watch_is_running(str(tmp_path))
+        watch_pid_unlock(str(tmp_path), fd)
+
+    def test_stale_pid(self, tmp_path):
+        with open(watch_pid_path(str(tmp_path)), "w") as f:
+            f.write("999999999")
+        assert not watch_is_running(str(tmp_path))